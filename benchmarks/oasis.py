@@ -0,0 +1,250 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measures how OasisDEX operations scale with the size of the order book.
+
+A `MatchingMarket` gets deployed on `EthereumTesterProvider` together with SAI, then it gets
+seeded with more and more offers spread across several token pairs. After each step wall time,
+number of JSON-RPC requests and, in a separate run, peak memory of the following operations get measured:
+`SimpleMarket.active_offers`, `MatchingMarket.position` (with a fresh and with an already read
+order book), `SaiMakerOtc.synchronize_offers` and `SaiArbitrage.profitable_opportunities`.
+
+Results are written as JSON, so they can be compared between revisions:
+
+    python3 -m benchmarks.oasis --sizes 100,1000,10000 --output oasis.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+from web3 import Web3, EthereumTesterProvider
+
+from keeper import Config
+from keeper.api import Address, Wad
+from keeper.api.accounting import AccountingProvider, RpcAccounting
+from keeper.api.approval import directly
+from keeper.api.feed import DSValue
+from keeper.api.oasis import MatchingMarket
+from keeper.api.token import DSToken, ERC20Token
+from keeper.api.util import chain
+from keeper.sai_arbitrage import SaiArbitrage
+from keeper.sai_maker_otc import SaiMakerOtc
+from benchmarks.deployment import deploy_sai
+
+TARGET_PRICE = Wad.from_number(250)
+
+
+class BenchmarkSaiMakerOtc(SaiMakerOtc):
+    """`SaiMakerOtc` targeting a fixed price, instead of asking `setzer` for it."""
+    def tub_target_price(self) -> Wad:
+        return TARGET_PRICE
+
+
+class OasisBenchmark:
+    def __init__(self, number_of_pairs: int):
+        self.accounting = RpcAccounting()
+        self.web3 = Web3(AccountingProvider(EthereumTesterProvider(), self.accounting))
+        self.web3.eth.defaultAccount = self.web3.eth.accounts[0]
+        self.our_address = Address(self.web3.eth.defaultAccount)
+
+        self.sai = deploy_sai(self.web3)
+        DSValue(web3=self.web3, address=self.sai.tub.pip()).poke_with_int(TARGET_PRICE.value).transact()
+        ERC20Token.register_token(self.sai.tub.skr(), 'SKR')
+        ERC20Token.register_token(self.sai.tub.sai(), 'SAI')
+        ERC20Token.register_token(self.sai.tub.gem(), 'WETH')
+
+        self.otc = MatchingMarket.deploy(self.web3, 2500000000)
+        self.pairs = self.token_pairs(number_of_pairs)
+        for base_token, quote_token in self.pairs:
+            self.otc.add_token_pair_whitelist(base_token.address, quote_token.address).transact()
+
+        tokens = list({token.address: token for pair in self.pairs for token in pair}.values())
+        for token in tokens:
+            if token != self.sai.skr:
+                token.mint(Wad.from_number(100000000)).transact()
+
+        # SKR has to be obtained by joining, as minting it directly would bring its GEM price down to zero
+        self.sai.gem.mint(Wad.from_number(100000000)).transact()
+        self.sai.tub.join(Wad.from_number(100000000)).transact()
+        self.otc.approve(tokens, directly())
+
+        self.size = 0
+
+    def token_pairs(self, number_of_pairs: int) -> list:
+        pairs = [(self.sai.gem, self.sai.sai), (self.sai.skr, self.sai.sai), (self.sai.gem, self.sai.skr)]
+        for index in range(len(pairs), number_of_pairs):
+            pairs.append((DSToken.deploy(self.web3, f'T{index}'), self.sai.sai))
+        return pairs[:number_of_pairs]
+
+    def seed(self, size: int):
+        """Create offers until there are `size` of them, spread across all pairs.
+
+        Asks and bids of each pair are priced far enough from each other and from the target
+        price for none of them to be matched, neither with each other nor with keeper offers."""
+        for index in range(self.size, size):
+            base_token, quote_token = self.pairs[index % len(self.pairs)]
+            scale = TARGET_PRICE if (base_token, quote_token) == (self.sai.gem, self.sai.sai) else Wad.from_number(1)
+            if (index // len(self.pairs)) % 2 == 0:
+                self.otc.make(have_token=base_token.address, have_amount=Wad.from_number(1),
+                              want_token=quote_token.address,
+                              want_amount=scale * Wad.from_number(1.1 + (index % 97) / 1000)).transact()
+            else:
+                self.otc.make(have_token=quote_token.address,
+                              have_amount=scale * Wad.from_number(0.9 - (index % 89) / 1000),
+                              want_token=base_token.address, want_amount=Wad.from_number(1)).transact()
+        self.size = size
+
+    def fresh_market(self) -> MatchingMarket:
+        return MatchingMarket(web3=self.web3, address=self.otc.address)
+
+    def measure(self, operation: str, function, setup=None, revert: bool = False) -> dict:
+        """Measure one operation, timing it and tracing its memory allocations in separate runs.
+
+        Tracing allocations slows Python down a lot, so wall time and the number of JSON-RPC
+        requests come from a run without `tracemalloc`, and peak memory from a second run."""
+        wall_time, accounting, _ = self._run(function, setup, revert, trace_memory=False)
+        _, _, peak_memory = self._run(function, setup, revert, trace_memory=True)
+
+        return {'operation': operation,
+                'size': self.size,
+                'pairs': len(self.pairs),
+                'wall_time': wall_time,
+                'rpc_requests': accounting.total().count,
+                'rpc_requests_by_method': {method: stats.count for method, stats in sorted(accounting.by_method.items())},
+                'peak_memory': peak_memory}
+
+    def _run(self, function, setup, revert: bool, trace_memory: bool) -> tuple:
+        argument = setup() if setup is not None else None
+        if revert:
+            self.web3.currentProvider.rpc_methods.evm_snapshot()
+
+        self.accounting.reset()
+        peak_memory = None
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            function(argument) if setup is not None else function()
+        finally:
+            wall_time = time.perf_counter() - start
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            accounting = self.accounting.reset()
+
+        if revert:
+            self.web3.currentProvider.rpc_methods.evm_revert()
+            # the order book read by the keeper would no longer reflect the reverted state
+            argument.otc.offer_book().close()
+
+        return wall_time, accounting, peak_memory
+
+    def keeper_config(self) -> Config:
+        network = chain(self.web3)
+        return Config(network, {network: {'tokens': {},
+                                          'contracts': {'saiTub': self.sai.tub.address.address,
+                                                        'saiTap': self.sai.tap.address.address,
+                                                        'saiTop': self.sai.top.address.address,
+                                                        'otc': self.otc.address.address}}})
+
+    def maker_keeper(self) -> SaiMakerOtc:
+        return BenchmarkSaiMakerOtc(args=[f"--eth-from={self.our_address}",
+                                          "--max-weth-amount=10", "--min-weth-amount=5",
+                                          "--max-sai-amount=100", "--min-sai-amount=50",
+                                          "--min-margin-buy=0.01", "--avg-margin-buy=0.02", "--max-margin-buy=0.03",
+                                          "--min-margin-sell=0.02", "--avg-margin-sell=0.03", "--max-margin-sell=0.04"],
+                                    web3=self.web3, config=self.keeper_config())
+
+    def arbitrage_keeper(self) -> SaiArbitrage:
+        return SaiArbitrage(args=[f"--eth-from={self.our_address}",
+                                  "--base-token=SAI", "--min-profit=0", "--max-engagement=100"],
+                            web3=self.web3, config=self.keeper_config())
+
+    def run(self, sizes: list) -> list:
+        base_token, quote_token = self.pairs[0]
+
+        def position(market: MatchingMarket):
+            market.position(have_token=base_token.address, have_amount=Wad.from_number(1),
+                            want_token=quote_token.address, want_amount=TARGET_PRICE * Wad.from_number(1.15))
+
+        def warm_market() -> MatchingMarket:
+            market = self.fresh_market()
+            market.offer_book(tokens=[base_token.address, quote_token.address])
+            position(market)
+            return market
+
+        results = []
+        for size in sizes:
+            logging.info(f"Seeding the market with {size} offers")
+            self.seed(size)
+
+            for result in [self.measure('SimpleMarket.active_offers', lambda market: market.active_offers(),
+                                        setup=self.fresh_market),
+                           self.measure('MatchingMarket.position[cold]', position, setup=self.fresh_market),
+                           self.measure('MatchingMarket.position[warm]', position, setup=warm_market),
+                           self.measure('SaiMakerOtc.synchronize_offers', lambda keeper: keeper.synchronize_offers(),
+                                        setup=self.maker_keeper, revert=True),
+                           self.measure('SaiArbitrage.profitable_opportunities',
+                                        lambda keeper: keeper.profitable_opportunities(),
+                                        setup=self.arbitrage_keeper)]:
+                logging.info(f"{result['operation']} with {size} offers: {result['wall_time']:.3f}s,"
+                             f" {result['rpc_requests']} requests, {result['peak_memory']} bytes")
+                results.append(result)
+
+        return results
+
+
+def revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(args: list):
+    parser = argparse.ArgumentParser(prog='benchmarks.oasis', description='OasisDEX scaling benchmarks')
+    parser.add_argument("--sizes", help="Comma-separated numbers of offers to measure at (default: 100,1000,10000)",
+                        type=str, default='100,1000,10000')
+    parser.add_argument("--pairs", help="Number of token pairs to spread the offers across (default: 5)",
+                        type=int, default=5)
+    parser.add_argument("--output", help="File to write the results to (default: standard output)", type=str)
+    arguments = parser.parse_args(args)
+
+    logging.basicConfig(format='%(asctime)-15s %(levelname)-8s %(message)s', level=logging.INFO)
+
+    sizes = sorted(int(size) for size in arguments.sizes.split(','))
+    report = {'revision': revision(),
+              'python': platform.python_version(),
+              'started': int(time.time()),
+              'results': OasisBenchmark(arguments.pairs).run(sizes)}
+
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
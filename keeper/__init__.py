@@ -26,9 +26,14 @@ import time
 
 from keeper.api import Address, register_filter_thread, all_filter_threads_alive, stop_all_filter_threads, \
     any_filter_thread_present, Wad
+from keeper.api.accounting import AccountingProvider, RpcAccounting
+from keeper.api.cache import BlockCache
 from keeper.api.gas import FixedGasPrice, DefaultGasPrice, GasPrice, IncreasingGasPrice
+from keeper.api.provider import PooledHTTPProvider, HedgedHTTPProvider, AdaptiveLimiter, LimitedProvider
+from keeper.api.replay import RecordingProvider, ReplayProvider
+from keeper.api.subscription import NewHeadsSubscription
 from keeper.api.util import AsyncCallback, chain, are_any_transactions_pending
-from web3 import Web3, HTTPProvider
+from web3 import Web3
 
 from keeper.api.token import ERC20Token
 
@@ -36,10 +41,27 @@ from keeper.api.token import ERC20Token
 class Keeper:
     logger = logging.getLogger('keeper')
 
-    def __init__(self):
+    def __init__(self, args: list = None, web3: Web3 = None, config: 'Config' = None):
+        """Parses the arguments and connects to the node.
+
+        Args:
+            args: Command-line arguments. Taken from `sys.argv` if `None`.
+            web3: Optional `Web3` instance to use instead of connecting to the node given in `args`.
+            config: Optional `Config` to use instead of the one for the chain the node is on.
+        """
         parser = argparse.ArgumentParser(prog=self.executable_name())
         parser.add_argument("--rpc-host", help="JSON-RPC host (default: `localhost')", default="localhost", type=str)
         parser.add_argument("--rpc-port", help="JSON-RPC port (default: `8545')", default=8545, type=int)
+        parser.add_argument("--rpc-timeout", help="JSON-RPC timeout in seconds (default: `10')", default=10, type=float)
+        parser.add_argument("--rpc-pool-size", help="Number of JSON-RPC connections used for calls (default: `10')", default=10, type=int)
+        parser.add_argument("--rpc-max-concurrency", help="Maximum number of JSON-RPC requests in flight (default: `32')", default=32, type=int)
+        parser.add_argument("--rpc-backup", help="Additional JSON-RPC endpoint to read from, e.g. `http://node2:8545' (can be repeated)", dest='rpc_backups', action='append', default=[], type=str)
+        parser.add_argument("--rpc-hedge-delay", help="Time after which slow reads get sent to a backup endpoint as well (default: `0.5')", default=0.5, type=float)
+        parser.add_argument("--rpc-record", help="Record all JSON-RPC requests and responses to a file", type=str)
+        parser.add_argument("--rpc-replay", help="Replay JSON-RPC responses recorded with `--rpc-record' instead of connecting to a node", type=str)
+        parser.add_argument("--rpc-replay-latency", help="Replay latency, either `zero' or `recorded' (default: `zero')", default='zero', choices=['zero', 'recorded'], type=str)
+        parser.add_argument("--ipc-path", help="Node IPC socket path, used to subscribe to new blocks instead of polling for them", type=str)
+        parser.add_argument("--block-cache", help="Cache values read from contracts for the duration of one block", dest='block_cache', action='store_true')
         parser.add_argument("--eth-from", help="Ethereum account from which to send transactions", required=True, type=str)
         parser.add_argument("--gas-price", help="Static gas pricing: Gas price in Wei", default=0, type=int)
         parser.add_argument("--initial-gas-price", help="Increasing gas pricing: Initial gas price in Wei", default=0, type=int)
@@ -48,13 +70,19 @@ class Keeper:
         parser.add_argument("--debug", help="Enable debug output", dest='debug', action='store_true')
         parser.add_argument("--trace", help="Enable trace output", dest='trace', action='store_true')
         self.args(parser)
-        self.arguments = parser.parse_args()
+        self.arguments = parser.parse_args(args)
         self._setup_logging()
-        self.web3 = Web3(HTTPProvider(endpoint_uri=f"http://{self.arguments.rpc_host}:{self.arguments.rpc_port}"))
+        self.rpc_accounting = RpcAccounting()
+        self.last_block_rpc_accounting = None
+        self._recording_provider = None
+        self._replay_provider = None
+        self.web3 = web3 if web3 is not None else Web3(self._get_provider())
         self.web3.eth.defaultAccount = self.arguments.eth_from
+        if self.arguments.block_cache:
+            BlockCache.enable(self.web3)
         self.our_address = Address(self.arguments.eth_from)
         self.chain = chain(self.web3)
-        self.config = Config(self.chain)
+        self.config = config if config is not None else Config(self.chain)
         self.gas_price = self._get_gas_price()
         self.terminated = False
         self.fatal_termination = False
@@ -81,7 +109,12 @@ class Keeper:
             self.logger.info("Waiting for outstanding callback to terminate...")
             self._on_block_callback.wait()
         self.logger.info("Executing keeper shutdown logic...")
-        self.shutdown()
+        try:
+            self.shutdown()
+        finally:
+            # otherwise a compressed recording would end up without its trailer and could not be replayed
+            if self._recording_provider is not None:
+                self._recording_provider.close()
         self.logger.info("Keeper terminated")
         exit(10 if self.fatal_termination else 0)
 
@@ -106,6 +139,31 @@ class Keeper:
         return Wad(self.web3.eth.getBalance(address.address))
 
     def on_block(self, callback):
+        def on_new_block(block_number, block_hash):
+            cache = BlockCache.of(self.web3)
+            if cache is not None:
+                cache.new_block(block_number)
+
+            def on_start():
+                self.logger.debug(f"Processing block #{block_number} ({block_hash})")
+                self.rpc_accounting.reset()
+                # recorded responses are matched to the block being processed, so replays see the same state
+                for provider in (self._recording_provider, self._replay_provider):
+                    if provider is not None:
+                        provider.new_block(block_number)
+
+            def on_finish():
+                self.logger.debug(f"Finished processing block #{block_number} ({block_hash})")
+                # requests made by other threads (filter polling, `every()` timers) while the block
+                # was being processed get counted as well, so this is not a per-block cost strictly
+                self.last_block_rpc_accounting = self.rpc_accounting.reset()
+                self.logger.debug(f"JSON-RPC requests while processing block #{block_number}, including"
+                                  f" other threads: {self.last_block_rpc_accounting.summary()}")
+
+            if not self._on_block_callback.trigger(on_start, on_finish):
+                self.logger.info(f"Ignoring block #{block_number} ({block_hash}),"
+                                 f" as previous callback is still running")
+
         def new_block_callback(block_hash):
             self._last_block_time = datetime.datetime.now()
             block = self.web3.eth.getBlock(block_hash)
@@ -113,28 +171,33 @@ class Keeper:
             if not self.web3.eth.syncing:
                 max_block_number = self.web3.eth.blockNumber
                 if block_number == max_block_number:
-                    def on_start():
-                        self.logger.debug(f"Processing block #{block_number} ({block_hash})")
-
-                    def on_finish():
-                        self.logger.debug(f"Finished processing block #{block_number} ({block_hash})")
-
-                    if not self._on_block_callback.trigger(on_start, on_finish):
-                        self.logger.info(f"Ignoring block #{block_number} ({block_hash}),"
-                                         f" as previous callback is still running")
+                    on_new_block(block_number, block_hash)
                 else:
                     self.logger.info(f"Ignoring block #{block_number} ({block_hash}),"
                                      f" as there is already block #{max_block_number} available")
             else:
                 self.logger.info(f"Ignoring block #{block_number} ({block_hash}), as the node is syncing")
 
+        def new_head_callback(header):
+            # block headers get pushed by the node as soon as they become the new head of the chain,
+            # so there is no need to query the node whether they are still the latest ones
+            self._last_block_time = datetime.datetime.now()
+            on_new_block(int(header['number'], 16), header['hash'])
+
         self._on_block_callback = AsyncCallback(callback)
 
-        block_filter = self.web3.eth.filter('latest')
-        block_filter.watch(new_block_callback)
-        register_filter_thread(block_filter)
+        if self.arguments.ipc_path:
+            block_subscription = NewHeadsSubscription(self.arguments.ipc_path, new_head_callback)
+            block_subscription.watch()
+            register_filter_thread(block_subscription)
 
-        self.logger.info("Watching for new blocks")
+            self.logger.info(f"Subscribed to new blocks via {self.arguments.ipc_path}")
+        else:
+            block_filter = self.web3.eth.filter('latest')
+            block_filter.watch(new_block_callback)
+            register_filter_thread(block_filter)
+
+            self.logger.info("Watching for new blocks")
 
     def every(self, time_in_seconds, callback):
         def func():
@@ -156,6 +219,34 @@ class Keeper:
             logging.getLogger("api").setLevel(logging.DEBUG)
             logging.getLogger("keeper").setLevel(logging.DEBUG)
 
+    def _get_provider(self):
+        limiter = AdaptiveLimiter(initial_limit=min(8, self.arguments.rpc_max_concurrency),
+                                  max_limit=self.arguments.rpc_max_concurrency)
+        return AccountingProvider(LimitedProvider(self._get_node_provider(), limiter), self.rpc_accounting)
+
+    def _get_node_provider(self):
+        if self.arguments.rpc_replay:
+            self._replay_provider = ReplayProvider(self.arguments.rpc_replay, latency=self.arguments.rpc_replay_latency)
+            return self._replay_provider
+        elif self.arguments.rpc_record:
+            self._recording_provider = RecordingProvider(self._get_http_provider(), self.arguments.rpc_record)
+            return self._recording_provider
+        else:
+            return self._get_http_provider()
+
+    def _get_http_provider(self):
+        endpoint_uri = f"http://{self.arguments.rpc_host}:{self.arguments.rpc_port}"
+        if len(self.arguments.rpc_backups) > 0:
+            return HedgedHTTPProvider(endpoint_uris=[endpoint_uri] + self.arguments.rpc_backups,
+                                      hedge_delay=self.arguments.rpc_hedge_delay,
+                                      pool_size=self.arguments.rpc_pool_size,
+                                      timeout=self.arguments.rpc_timeout)
+        else:
+            return PooledHTTPProvider(endpoint_uri=endpoint_uri,
+                                      pool_size=self.arguments.rpc_pool_size,
+                                      timeout=self.arguments.rpc_timeout,
+                                      filter_timeout=self.arguments.rpc_timeout)
+
     def _get_gas_price(self) -> GasPrice:
         if self.arguments.gas_price > 0:
             if self.arguments.initial_gas_price > 0 \
@@ -250,10 +341,13 @@ class Keeper:
 
 
 class Config:
-    def __init__(self, chain: str):
-        with open('keeper/config.json') as data_file:
-            self.chain = chain
-            self.config = json.load(data_file)
+    def __init__(self, chain: str, config: dict = None):
+        self.chain = chain
+        if config is not None:
+            self.config = config
+        else:
+            with open('keeper/config.json') as data_file:
+                self.config = json.load(data_file)
         for key, value in self.config[self.chain]["tokens"].items():
             ERC20Token.register_token(Address(value), key)
 
@@ -19,6 +19,8 @@ import asyncio
 import json
 import logging
 import sys
+import threading
+import weakref
 from functools import total_ordering
 from typing import Optional
 
@@ -26,10 +28,11 @@ import eth_utils
 import pkg_resources
 import time
 
+from keeper.api.cache import BlockCache
 from keeper.api.gas import DefaultGasPrice, GasPrice
 from keeper.api.numeric import Wad
-from keeper.api.util import synchronize, next_nonce
-from web3 import Web3, EthereumTesterProvider
+from keeper.api.util import synchronize, next_nonce, is_tester
+from web3 import Web3
 from web3.utils.events import get_event_data
 
 filter_threads = []
@@ -105,6 +108,9 @@ class Address:
 class Contract:
     logger = logging.getLogger('api')
 
+    _contracts = weakref.WeakKeyDictionary()
+    _contracts_lock = threading.Lock()
+
     @staticmethod
     def _deploy(web3: Web3, abi: dict, bytecode: str, args) -> Address:
         contract_factory = web3.eth.contract(abi=abi, bytecode=bytecode)
@@ -113,11 +119,25 @@ class Contract:
         return Address(receipt['contractAddress'])
 
     def _get_contract(self, web3: Web3, abi: dict, address: Address):
-        code = web3.eth.getCode(address.address)
-        if (code == "0x") or (code is None):
-            raise Exception(f"No contract found at {address}")
-
-        return web3.eth.contract(abi=abi)(address=address.address)
+        # The existence of a contract is checked only once for each address and web3.py contract
+        # objects are reused for each (abi, address) pair, separately for each `Web3` instance.
+        # ABIs are always loaded once and kept in class attributes, so it is safe to use `id(abi)`.
+        with Contract._contracts_lock:
+            verified_addresses, contracts = Contract._contracts.setdefault(web3, (set(), {}))
+            if (id(abi), address) in contracts and contracts[(id(abi), address)][0] is abi:
+                return contracts[(id(abi), address)][1]
+
+        if address not in verified_addresses:
+            code = web3.eth.getCode(address.address)
+            if (code == "0x") or (code is None):
+                raise Exception(f"No contract found at {address}")
+
+        contract = web3.eth.contract(abi=abi)(address=address.address)
+        with Contract._contracts_lock:
+            verified_addresses.add(address)
+            contracts[(id(abi), address)] = (abi, contract)
+
+        return contract
 
     def _on_event(self, contract, event, cls, handler):
         register_filter_thread(contract.on(event, None, self._event_callback(cls, handler, False)))
@@ -281,7 +301,7 @@ class Transact:
         # `eth-testrpc` does not handle the `nonce` parameter properly so we do have to
         # ignore it otherwise unit-tests will not pass. Hopefully we will be able to get
         # rid of it once the above issue is solved.
-        nonce_dict = {'nonce': nonce} if not isinstance(self.web3.currentProvider, EthereumTesterProvider) else {}
+        nonce_dict = {'nonce': nonce} if not is_tester(self.web3) else {}
         gas_price_dict = {'gasPrice': gas_price} if gas_price is not None else {}
 
         return self.contract.\
@@ -371,6 +391,12 @@ class Transact:
                 for tx_hash in tx_hashes:
                     receipt = self._get_receipt(tx_hash)
                     if receipt:
+                        # The transaction could have changed the state of contracts,
+                        # so values cached for the current block are no longer valid.
+                        cache = BlockCache.of(self.web3)
+                        if cache is not None:
+                            cache.invalidate()
+
                         if receipt.successful:
                             self.logger.info(f"Transaction {self.name()} was successful (tx_hash={tx_hash})")
                             return receipt
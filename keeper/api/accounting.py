@@ -0,0 +1,186 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import threading
+import time
+
+from keeper.api.asynchronous import request_async
+from keeper.api.batch import make_batch_request
+from keeper.api.provider import ProviderWrapper
+
+
+class RequestStats:
+    """Number, total duration and failures of JSON-RPC requests.
+
+    Attributes:
+        count: Number of requests.
+        duration: Total duration of all requests, in seconds.
+        failures: Number of requests which failed.
+    """
+    def __init__(self, count: int = 0, duration: float = 0.0, failures: int = 0):
+        self.count = count
+        self.duration = duration
+        self.failures = failures
+
+    def __eq__(self, other):
+        return self.count == other.count and self.duration == other.duration and self.failures == other.failures
+
+    def __repr__(self):
+        return f"RequestStats(count={self.count}, duration={self.duration:.3f}, failures={self.failures})"
+
+
+class RpcAccounting:
+    """Counts and times JSON-RPC requests, both by method and by the function which made them.
+
+    The calling function is the innermost function from the `keeper` package which is not part
+    of the JSON-RPC request path itself, for example `SimpleMarket.get_offer` or `Tub.tag`.
+    """
+
+    # modules which are part of the request path, so they never get reported as callers
+    IGNORED_MODULES = {'keeper.api.accounting', 'keeper.api.asynchronous', 'keeper.api.batch',
+                       'keeper.api.cache', 'keeper.api.provider'}
+
+    def __init__(self):
+        self.by_method = {}
+        self.by_caller = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def caller() -> str:
+        """Returns the name of the innermost `keeper` function on the current call stack."""
+        frame = sys._getframe(1)
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            if module.startswith('keeper') \
+                    and module not in RpcAccounting.IGNORED_MODULES \
+                    and not frame.f_code.co_name.startswith('<'):
+                if 'self' in frame.f_locals:
+                    return f"{type(frame.f_locals['self']).__name__}.{frame.f_code.co_name}"
+                else:
+                    return f"{module}.{frame.f_code.co_name}"
+            frame = frame.f_back
+
+        return 'unknown'
+
+    def record(self, method: str, caller: str, duration: float, failed: bool):
+        """Records one JSON-RPC request.
+
+        Args:
+            method: JSON-RPC method name, for example `eth_call`.
+            caller: Name of the function which made the request.
+            duration: Duration of the request, in seconds.
+            failed: `True` if the request failed, `False` otherwise.
+        """
+        with self._lock:
+            for stats in [self.by_method.setdefault(method, RequestStats()),
+                          self.by_caller.setdefault(caller, RequestStats())]:
+                stats.count += 1
+                stats.duration += duration
+                stats.failures += 1 if failed else 0
+
+    def total(self) -> RequestStats:
+        """Returns the totals of all requests recorded."""
+        with self._lock:
+            return RequestStats(count=sum(stats.count for stats in self.by_method.values()),
+                                duration=sum(stats.duration for stats in self.by_method.values()),
+                                failures=sum(stats.failures for stats in self.by_method.values()))
+
+    def reset(self) -> 'RpcAccounting':
+        """Starts counting from zero.
+
+        Returns:
+            A `RpcAccounting` object with all requests recorded until now.
+        """
+        with self._lock:
+            snapshot = RpcAccounting()
+            snapshot.by_method, snapshot.by_caller, snapshot.started = self.by_method, self.by_caller, self.started
+            self.by_method, self.by_caller, self.started = {}, {}, time.time()
+            return snapshot
+
+    def summary(self, top: int = 5) -> str:
+        """Returns a compact, one-line summary of requests recorded.
+
+        Args:
+            top: Number of methods and callers to be listed.
+
+        Returns:
+            The summary, for example `12 requests (0.140s): eth_call=10 (0.120s), ... | SimpleMarket.get_offer=8, ...`.
+        """
+        def top_items(stats: dict, with_duration: bool):
+            items = sorted(stats.items(), key=lambda item: (-item[1].count, item[0]))[:top]
+            return ', '.join(f"{name}={item.count}" + (f" ({item.duration:.3f}s)" if with_duration else "")
+                             for name, item in items)
+
+        total = self.total()
+        with self._lock:
+            return f"{total.count} requests ({total.duration:.3f}s)" \
+                   + (f", {total.failures} failed" if total.failures > 0 else "") \
+                   + (f": {top_items(self.by_method, True)} | {top_items(self.by_caller, False)}" if total.count > 0 else "")
+
+
+class AccountingProvider(ProviderWrapper):
+    """Provider recording all requests sent through it in `RpcAccounting`.
+
+    Args:
+        provider: The `web3.py` provider to be wrapped.
+        accounting: The `RpcAccounting` object requests should be recorded in.
+    """
+    def __init__(self, provider, accounting: RpcAccounting):
+        assert(isinstance(accounting, RpcAccounting))
+
+        super().__init__(provider)
+        self.accounting = accounting
+
+    def make_request(self, method, params):
+        caller = RpcAccounting.caller()
+        start = time.time()
+        try:
+            response = self.provider.make_request(method, params)
+        except:
+            self.accounting.record(method, caller, time.time() - start, True)
+            raise
+
+        self.accounting.record(method, caller, time.time() - start, False)
+        return response
+
+    async def make_request_async(self, method, params) -> dict:
+        caller = RpcAccounting.caller()
+        start = time.time()
+        try:
+            response = await request_async(self.provider, method, params)
+        except:
+            self.accounting.record(method, caller, time.time() - start, True)
+            raise
+
+        self.accounting.record(method, caller, time.time() - start, False)
+        return response
+
+    def make_batch_request(self, requests: list) -> list:
+        caller = RpcAccounting.caller()
+        start = time.time()
+        failed = False
+        try:
+            return make_batch_request(self.provider, requests)
+        except:
+            failed = True
+            raise
+        finally:
+            # all requests in a batch share one round trip, so its duration gets split between them
+            for method, params in requests:
+                self.accounting.record(method, caller, (time.time() - start) / len(requests), failed)
@@ -0,0 +1,219 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import itertools
+import json
+import weakref
+from urllib.parse import urlparse
+
+from eth_utils import force_obj_to_text, force_text
+from web3 import Web3, HTTPProvider
+
+from keeper.api.batch import BatchContext, CallRequired, batch_request_manager
+
+
+class AsyncHTTPClient:
+    """Non-blocking JSON-RPC client, sending requests over keep-alive HTTP/1.1 connections.
+
+    Each client is bound to the event loop it has been created in, use `AsyncHTTPClient.get()`
+    to get the client for the current event loop.
+
+    Args:
+        endpoint_uri: The JSON-RPC endpoint, for example `http://localhost:8545`.
+        pool_size: Maximum number of connections open at the same time.
+        timeout: Timeout (in seconds) for each request.
+    """
+    _clients = weakref.WeakKeyDictionary()
+
+    def __init__(self, endpoint_uri: str, pool_size: int = 10, timeout: float = 10):
+        assert(isinstance(endpoint_uri, str))
+        assert(isinstance(pool_size, int))
+        assert(isinstance(timeout, (int, float)))
+
+        url = urlparse(endpoint_uri)
+        self.endpoint_uri = endpoint_uri
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.path = url.path or '/'
+        self.ssl = url.scheme == 'https'
+        self.timeout = timeout
+        self._ids = itertools.count()
+        self._idle_connections = []
+        self._semaphore = asyncio.Semaphore(pool_size)
+
+    @staticmethod
+    def get(endpoint_uri: str, pool_size: int = 10, timeout: float = 10) -> 'AsyncHTTPClient':
+        """Returns the client for `endpoint_uri` bound to the current event loop, creating it if necessary.
+
+        Clients with different `pool_size` or `timeout` are kept separately, even for the same `endpoint_uri`."""
+        clients = AsyncHTTPClient._clients.setdefault(asyncio.get_event_loop(), {})
+        if (endpoint_uri, pool_size, timeout) not in clients:
+            clients[(endpoint_uri, pool_size, timeout)] = AsyncHTTPClient(endpoint_uri, pool_size, timeout)
+        return clients[(endpoint_uri, pool_size, timeout)]
+
+    async def request(self, method: str, params: list) -> dict:
+        """Sends a JSON-RPC request and returns the response.
+
+        Args:
+            method: JSON-RPC method name, for example `eth_call`.
+            params: JSON-RPC method parameters.
+
+        Returns:
+            The JSON-RPC response dictionary.
+        """
+        body = json.dumps(force_obj_to_text({"jsonrpc": "2.0", "method": method, "params": params,
+                                             "id": next(self._ids)})).encode('utf-8')
+        async with self._semaphore:
+            return json.loads(force_text(await asyncio.wait_for(self._post(body), self.timeout)))
+
+    async def _post(self, body: bytes) -> bytes:
+        # an idle connection could have been closed by the node in the meantime,
+        # if that happens we retry with a fresh one
+        if self._idle_connections:
+            reader, writer = self._idle_connections.pop()
+            try:
+                return await self._exchange(reader, writer, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        return await self._exchange(reader, writer, body)
+
+    async def _exchange(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, body: bytes) -> bytes:
+        try:
+            writer.write(f"POST {self.path} HTTP/1.1\r\n"
+                         f"Host: {self.host}:{self.port}\r\n"
+                         f"Content-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         f"Connection: keep-alive\r\n\r\n".encode('ascii') + body)
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError("Connection closed by the node")
+            version, status = status_line.split()[0], int(status_line.split()[1])
+
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+            # HTTP/1.0 connections are closed after each response unless asked to be kept alive
+            keep_alive = headers.get('connection', '').lower() != 'close' and \
+                (version != b'HTTP/1.0' or headers.get('connection', '').lower() == 'keep-alive')
+
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                content = b''
+                while True:
+                    size = int((await reader.readline()).split(b';')[0], 16)
+                    chunk = await reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+                    content += chunk[:-2]
+            elif 'content-length' in headers:
+                content = await reader.readexactly(int(headers['content-length']))
+            else:
+                # without a length the body ends when the node closes the connection
+                content = await reader.read()
+                keep_alive = False
+        except:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self._idle_connections.append((reader, writer))
+        else:
+            writer.close()
+
+        if status >= 400:
+            raise ConnectionError(f"HTTP error {status} returned by the node")
+
+        return content
+
+
+async def request_async(provider, method: str, params: list) -> dict:
+    """Sends a JSON-RPC request through a provider without blocking the event loop.
+
+    Providers can implement their own `make_request_async(method, params)` coroutine, which is
+    how provider wrappers (`AccountingProvider`, `LimitedProvider` etc.) keep doing their job for
+    asynchronous requests. Otherwise, for an `HTTPProvider`, the request gets sent using
+    `AsyncHTTPClient`. Other providers just get called directly.
+
+    Args:
+        provider: The `web3.py` provider to send the request with.
+        method: JSON-RPC method name, for example `eth_call`.
+        params: JSON-RPC method parameters.
+
+    Returns:
+        The JSON-RPC response dictionary.
+    """
+    if hasattr(provider, 'make_request_async'):
+        return await provider.make_request_async(method, params)
+    elif isinstance(provider, HTTPProvider):
+        return await AsyncHTTPClient.get(provider.endpoint_uri).request(method, params)
+    else:
+        # providers without a non-blocking transport (like the in-process `EthereumTesterProvider`,
+        # which is not thread-safe) just get called directly
+        response = provider.make_request(method, params)
+        return response if isinstance(response, dict) else json.loads(force_text(response))
+
+
+async def call_async(web3: Web3, call):
+    """Awaitable variant of any constant contract call.
+
+    `call` is a function taking no arguments which reads something from one or more
+    contracts, usually a bound getter method like `tub.tag` or a lambda like
+    `lambda: otc.get_offer(offer_id)`. All `eth_call` requests made by it are sent using a
+    non-blocking HTTP client, so many such calls can be executed concurrently within one
+    event loop, for example using `asyncio.gather()`. The result is exactly what the
+    getter would return (`Wad`, `Ray`, `Address`, `OfferInfo` etc.).
+
+    Similar to `keeper.api.batch.batch()`, `call` gets invoked again once the responses
+    arrive, so it should not catch all exceptions.
+
+    Args:
+        web3: An instance of `Web3` from `web3.py`.
+        call: Function (taking no arguments) to be called.
+
+    Returns:
+        The result of `call`.
+    """
+    assert(isinstance(web3, Web3))
+    assert(callable(call))
+
+    manager = batch_request_manager(web3)
+    context = BatchContext()
+
+    while True:
+        manager.context = context
+        try:
+            return call()
+        except CallRequired:
+            pass
+        finally:
+            manager.context = None
+
+        requests = list(context.requests.items())
+        responses = await asyncio.gather(*[request_async(manager.provider, method, params)
+                                           for key, (method, params) in requests])
+        for (key, request), response in zip(requests, responses):
+            context.responses[key] = response
+
+        context.requests = {}
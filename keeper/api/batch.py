@@ -0,0 +1,224 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+
+from eth_utils import force_obj_to_text, force_text
+from web3 import Web3, HTTPProvider
+from web3.providers.manager import RequestManager
+from web3.utils.compat import make_post_request
+
+_install_lock = threading.Lock()
+
+
+class CallRequired(Exception):
+    """Raised internally to abort a callable which needs a result that has not been fetched yet."""
+    pass
+
+
+class BatchContext:
+    """Collects `eth_call` requests made by callables and serves the responses once they arrive."""
+    def __init__(self):
+        self.requests = {}
+        self.responses = {}
+
+    @staticmethod
+    def key(method: str, params: list) -> str:
+        return method + json.dumps(force_obj_to_text(params), sort_keys=True)
+
+    def request(self, method: str, params: list):
+        key = self.key(method, params)
+        if key in self.responses:
+            response = self.responses[key]
+            if "error" in response:
+                raise ValueError(response["error"])
+            return response['result']
+        else:
+            self.requests[key] = (method, params)
+            raise CallRequired()
+
+
+class BatchRequestManager(RequestManager):
+    """Request manager which diverts `eth_call` requests to the active batch of the calling thread.
+
+    Requests made outside of any batch, or requests other than `eth_call`, get passed through
+    to the original request manager, so having it installed does not change the behaviour
+    of any other code using the same `Web3` instance.
+    """
+    def __init__(self, manager: RequestManager):
+        self.manager = manager
+        self._local = threading.local()
+
+    @property
+    def provider(self):
+        return self.manager.provider
+
+    @property
+    def pending_requests(self):
+        return self.manager.pending_requests
+
+    def setProvider(self, provider):
+        self.manager.setProvider(provider)
+
+    @property
+    def context(self):
+        return getattr(self._local, 'context', None)
+
+    @context.setter
+    def context(self, context):
+        self._local.context = context
+
+    def request_blocking(self, method, params):
+        if self.context is not None and method == "eth_call":
+            return self.context.request(method, params)
+        else:
+            return self.manager.request_blocking(method, params)
+
+    def request_async(self, method, params):
+        return self.manager.request_async(method, params)
+
+    def receive_blocking(self, request_id, timeout=None):
+        return self.manager.receive_blocking(request_id, timeout)
+
+    def receive_async(self, request_id, *args, **kwargs):
+        return self.manager.receive_async(request_id, *args, **kwargs)
+
+
+def batch_request_manager(web3: Web3) -> BatchRequestManager:
+    with _install_lock:
+        if not isinstance(web3._requestManager, BatchRequestManager):
+            web3.setManager(BatchRequestManager(web3._requestManager))
+        return web3._requestManager
+
+
+def match_batch_responses(responses, count: int) -> list:
+    """Matches the responses to a JSON-RPC batch request to the requests, by their `id`s.
+
+    Nodes can return the responses to a batch in any order, so they are put back in the order
+    of the requests, which are expected to have been sent with `id`s from `0` to `count - 1`.
+
+    Args:
+        responses: Parsed response to a batch of `count` requests.
+        count: Number of requests in the batch.
+
+    Returns:
+        List of `count` JSON-RPC response dictionaries, in the same order as the requests.
+
+    Raises:
+        ValueError: If there is not exactly one response for each request.
+    """
+    if not isinstance(responses, list):
+        raise ValueError(responses.get("error", "Invalid JSON-RPC batch response"))
+
+    by_id = {response.get('id'): response for response in responses if isinstance(response, dict)}
+    if len(responses) != count or set(by_id.keys()) != set(range(count)):
+        raise ValueError(f"Invalid JSON-RPC batch response, got ids {sorted(by_id.keys(), key=str)}"
+                         f" in {len(responses)} responses to {count} requests")
+
+    return [by_id[id] for id in range(count)]
+
+
+def make_batch_request(provider, requests: list) -> list:
+    """Sends a list of JSON-RPC requests to the node in one go.
+
+    Providers can implement their own `make_batch_request(requests)` method. Otherwise, for
+    an `HTTPProvider`, all requests get sent as one JSON-RPC batch in a single HTTP POST. Other
+    providers (like the `EthereumTesterProvider` used in unit-tests) get the requests one by one.
+
+    Args:
+        provider: The `web3.py` provider to send the requests with.
+        requests: List of `(method, params)` tuples.
+
+    Returns:
+        List of JSON-RPC response dictionaries, in the same order as `requests`.
+
+    Raises:
+        ValueError: If the provider did not return exactly one response for each request.
+    """
+    def as_dict(response):
+        return response if isinstance(response, dict) else json.loads(force_text(response))
+
+    if hasattr(provider, 'make_batch_request'):
+        responses = list(map(as_dict, provider.make_batch_request(requests)))
+        if len(responses) != len(requests):
+            raise ValueError(f"Got {len(responses)} responses to a batch of {len(requests)} requests")
+
+        return responses
+    elif isinstance(provider, HTTPProvider):
+        request_data = json.dumps(force_obj_to_text([{"jsonrpc": "2.0", "method": method, "params": params, "id": id}
+                                                     for id, (method, params) in enumerate(requests)]))
+        responses = as_dict(make_post_request(provider.endpoint_uri, request_data.encode('utf-8'),
+                                              **provider.get_request_kwargs()))
+        return match_batch_responses(responses, len(requests))
+    else:
+        return [as_dict(provider.make_request(method, params)) for method, params in requests]
+
+
+def batch(web3: Web3, calls: list) -> list:
+    """Executes multiple constant contract calls using as few JSON-RPC round trips as possible.
+
+    Each element of `calls` is a function taking no arguments which reads something from one
+    or more contracts, usually just a bound getter method like `tub.tag` or a lambda like
+    `lambda: token.balance_of(address)`. All `eth_call` requests these functions make are sent
+    to the node as one JSON-RPC batch request, then the functions are invoked again to decode
+    the responses, so the results are exactly what the getters would return (`Wad`, `Ray`,
+    `Address` etc.).
+
+    Functions that need the result of one call to make another one (`Tub.cups()` followed by
+    `Tub.tab()` for example) are handled as well, it just takes one extra round trip for each
+    dependent call.
+
+    Functions passed to `batch()` should not catch all exceptions, as aborting them when a result
+    is not available yet is implemented with an exception.
+
+    Args:
+        web3: An instance of `Web3` from `web3.py`.
+        calls: List of functions (taking no arguments) to be called.
+
+    Returns:
+        List of results of the functions, in the same order as `calls`.
+    """
+    assert(isinstance(web3, Web3))
+    assert(isinstance(calls, list))
+
+    manager = batch_request_manager(web3)
+    context = BatchContext()
+    results = [None] * len(calls)
+    pending = list(range(len(calls)))
+
+    while len(pending) > 0:
+        manager.context = context
+        try:
+            for index in list(pending):
+                try:
+                    results[index] = calls[index]()
+                    pending.remove(index)
+                except CallRequired:
+                    pass
+        finally:
+            manager.context = None
+
+        if len(context.requests) > 0:
+            requests = list(context.requests.items())
+            responses = make_batch_request(manager.provider, [request for key, request in requests])
+            for (key, request), response in zip(requests, responses):
+                context.responses[key] = response
+
+            context.requests = {}
+
+    return results
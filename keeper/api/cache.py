@@ -0,0 +1,175 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+import inspect
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+from web3 import Web3
+
+
+class BlockCache:
+    """Read-through cache for values read from contracts, valid for one block only.
+
+    The cache is opt-in and has to be enabled for a `Web3` instance using `BlockCache.enable()`,
+    which `Keeper` does if started with `--block-cache`.
+    Once it's enabled and the current block number is known (see `new_block()`), all getters
+    decorated with `@cached` return values from the cache, calling the contract only once
+    per block for each getter and each set of arguments.
+
+    `Keeper.on_block` informs the cache about every new block, which invalidates all values
+    cached so far. As transactions sent by the keeper itself can change contract state within
+    the same block, the cache gets invalidated every time one of them gets mined as well.
+
+    Attributes:
+        block_number: Number of the block the cached values come from. `None` if not known yet,
+            in which case nothing gets cached.
+    """
+    _caches = weakref.WeakKeyDictionary()
+    _caches_lock = threading.Lock()
+
+    def __init__(self):
+        self.block_number = None
+        self._values = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def enable(web3: Web3) -> 'BlockCache':
+        """Enables the cache for all contracts accessed via `web3`.
+
+        Args:
+            web3: An instance of `Web3` from `web3.py`.
+
+        Returns:
+            The `BlockCache` instance used for `web3`.
+        """
+        assert(isinstance(web3, Web3))
+        with BlockCache._caches_lock:
+            if web3 not in BlockCache._caches:
+                BlockCache._caches[web3] = BlockCache()
+            return BlockCache._caches[web3]
+
+    @staticmethod
+    def disable(web3: Web3):
+        """Disables the cache for all contracts accessed via `web3`."""
+        assert(isinstance(web3, Web3))
+        with BlockCache._caches_lock:
+            BlockCache._caches.pop(web3, None)
+
+    @staticmethod
+    def of(web3: Web3) -> Optional['BlockCache']:
+        """Returns the cache used for `web3`, or `None` if it hasn't been enabled."""
+        return BlockCache._caches.get(web3)
+
+    def new_block(self, block_number: int):
+        """Sets the current block number, invalidating all cached values if it has changed.
+
+        Args:
+            block_number: Number of the current block.
+        """
+        assert(isinstance(block_number, int))
+        with self._lock:
+            if block_number != self.block_number:
+                self.block_number = block_number
+                self._values = {}
+                self._generation += 1
+
+    def invalidate(self):
+        """Invalidates all cached values."""
+        with self._lock:
+            self._values = {}
+            self._generation += 1
+
+    def get(self, key: tuple, fetch):
+        """Returns the cached value for `key`, calling `fetch()` to get it if it's not cached yet.
+
+        Args:
+            key: Key identifying the value, for example `(address, method name, arguments)`.
+            fetch: Function (taking no arguments) returning the value from the contract.
+
+        Returns:
+            The value, either cached or just returned by `fetch()`.
+        """
+        with self._lock:
+            block_number = self.block_number
+            generation = self._generation
+            if block_number is not None and (block_number, key) in self._values:
+                return self._values[(block_number, key)]
+
+        value = fetch()
+
+        with self._lock:
+            # the value is stored only if no new block arrived and
+            # the cache did not get invalidated while we were fetching it
+            if block_number is not None and generation == self._generation:
+                self._values.setdefault((block_number, key), value)
+
+        return value
+
+    def get_many(self, keys: list, fetch_many) -> list:
+        """Returns the cached values for `keys`, calling `fetch_many()` once for all the missing ones.
+
+        Args:
+            keys: List of keys identifying the values. May contain duplicates.
+            fetch_many: Function taking a list of distinct keys missing from the cache and
+                returning a list of their values, in the same order.
+
+        Returns:
+            List of values, either cached or just returned by `fetch_many()`, in the same order as `keys`.
+        """
+        with self._lock:
+            block_number = self.block_number
+            generation = self._generation
+            values = {key: self._values[(block_number, key)] for key in keys
+                      if block_number is not None and (block_number, key) in self._values}
+
+        missing = list(OrderedDict.fromkeys(key for key in keys if key not in values))
+        if len(missing) > 0:
+            values.update(zip(missing, fetch_many(missing)))
+
+            with self._lock:
+                if block_number is not None and generation == self._generation:
+                    for key in missing:
+                        self._values.setdefault((block_number, key), values[key])
+
+        return [values[key] for key in keys]
+
+
+def cached(getter):
+    """Decorator making a `Contract` getter go through the `BlockCache`, if one is enabled.
+
+    Arguments are bound to the parameters of the getter before building the cache key, so passing
+    the same value positionally or by keyword, or omitting an argument which has a default value,
+    hits the same cached value."""
+    signature = inspect.signature(getter)
+
+    @functools.wraps(getter)
+    def wrapper(self, *args, **kwargs):
+        cache = BlockCache.of(self.web3)
+        if cache is None:
+            return getter(self, *args, **kwargs)
+        else:
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = (self.address, getter.__name__, bound.args[1:], tuple(sorted(bound.kwargs.items())))
+            return cache.get(key, lambda: getter(self, *args, **kwargs))
+
+    return wrapper
@@ -15,20 +15,33 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
 import hashlib
 import json
+import logging
+import os
 import random
 import sys
+import threading
+import time
+from functools import partial
 from pprint import pformat
 from typing import Optional, List
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+
 from keeper.api import Contract, Address, Receipt, Transact
+from keeper.api.batch import batch
+from keeper.api.cache import BlockCache
+from keeper.api.provider import EndpointStats
 from keeper.api.numeric import Wad
 from keeper.api.util import bytes_to_hexstring, hexstring_to_bytes
 from eth_abi.encoding import get_single_encoder
-from eth_utils import coerce_return_to_text, encode_hex
+from eth_utils import coerce_return_to_text, encode_hex, event_abi_to_log_topic
 from web3 import Web3
+from web3.utils.events import get_event_data
 
 from keeper.api.token import ERC20Token
 
@@ -201,6 +214,247 @@ class LogCancel():
         return pformat(vars(self))
 
 
+class EtherDeltaApi:
+    """Client of the `EtherDelta` API server.
+
+    All requests are sent using one `requests.Session` with a pool of persistent keep-alive
+    connections, so they do not pay for setting up a new TCP (and TLS) connection each time.
+    If all `pool_size` connections are in use, the request waits for one of them to become available.
+
+    Each request times out after `timeout` seconds. GET requests which fail because of a connection
+    error, a timeout or a 5xx response get retried up to `max_retries` times, waiting a random
+    time between zero and `retry_delay * 2^attempt` seconds before each retry, so many keepers
+    do not hammer a recovering server at the same moment. POST requests are not idempotent, so they
+    get retried only if the connection could not be established and nothing has been sent.
+
+    Latency and failures are tracked separately for each endpoint (`orders`, `message` etc.).
+
+    Args:
+        api_server: Base URL of the `EtherDelta` API server.
+        pool_size: Maximum number of connections open to the API server.
+        timeout: Timeout (in seconds) for each request.
+        max_retries: Maximum number of times a failed request gets retried.
+        retry_delay: Base delay (in seconds) before retrying a failed request.
+    """
+
+    logger = logging.getLogger('api')
+
+    def __init__(self, api_server: str, pool_size: int = 4, timeout: float = 10,
+                 max_retries: int = 3, retry_delay: float = 0.5):
+        assert(isinstance(api_server, str))
+        assert(isinstance(pool_size, int))
+        assert(isinstance(timeout, (int, float)))
+        assert(isinstance(max_retries, int))
+        assert(isinstance(retry_delay, (int, float)))
+
+        self.api_server = api_server
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get(self, endpoint: str, path: str, **kwargs) -> requests.Response:
+        """Sends a GET request to `{api_server}/{path}`, recording its statistics under `endpoint`."""
+        return self._request(endpoint, 'GET', path, **kwargs)
+
+    def post(self, endpoint: str, path: str, **kwargs) -> requests.Response:
+        """Sends a POST request to `{api_server}/{path}`, recording its statistics under `endpoint`."""
+        return self._request(endpoint, 'POST', path, **kwargs)
+
+    def endpoint_stats(self) -> list:
+        """Returns latency and failure statistics of all endpoints used so far.
+
+        Returns:
+            List of `EndpointStats` objects, one for each endpoint.
+        """
+        with self._stats_lock:
+            return [copy.copy(stats) for endpoint, stats in sorted(self._stats.items())]
+
+    def close(self):
+        self.session.close()
+
+    def _record(self, endpoint: str, latency: float, failed: bool):
+        with self._stats_lock:
+            if endpoint not in self._stats:
+                self._stats[endpoint] = EndpointStats(f"{self.api_server}/{endpoint}")
+
+            self._stats[endpoint].record(latency, failed)
+
+    def _request(self, endpoint: str, method: str, path: str, **kwargs) -> requests.Response:
+        url = f"{self.api_server}/{path}"
+        kwargs.setdefault('timeout', self.timeout)
+
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code >= 500:
+                    raise requests.HTTPError(f"{response.status_code} Server Error for url: {url}", response=response)
+            except requests.RequestException as e:
+                self._record(endpoint, time.time() - start, True)
+
+                # a POST request which reached the server could have been processed already,
+                # even if it timed out or the server responded with an error
+                if method != 'GET' and not self._not_sent(e):
+                    if e.response is not None:
+                        return e.response
+                    raise
+
+                if attempt >= self.max_retries:
+                    raise
+
+                delay = random.uniform(0, self.retry_delay * 2 ** attempt)
+                self.logger.debug(f"EtherDelta API request {method} {url} failed ({e}), retrying in {delay:.3f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self._record(endpoint, time.time() - start, False)
+            return response
+
+    @staticmethod
+    def _not_sent(exception: requests.RequestException) -> bool:
+        if isinstance(exception, requests.exceptions.ConnectTimeout):
+            return True
+
+        # failing to establish a connection surfaces as `NewConnectionError` wrapped in `MaxRetryError`
+        return isinstance(exception, requests.exceptions.ConnectionError) and len(exception.args) > 0 \
+            and isinstance(getattr(exception.args[0], 'reason', None), NewConnectionError)
+
+
+class OffChainOrderStream:
+    """Keeps an in-memory book of off-chain orders of one token pair, fed by a streaming API connection.
+
+    A background thread keeps a persistent HTTP connection to `{api_server}/orders/stream/{token1}/{token2}`
+    open and reads newline-delimited JSON messages from it. The first message sent on each connection
+    has to be a snapshot (`{"orders": [...]}`) of all orders, subsequent ones are incremental changes
+    (`{"added": [...], "removed": [...]}`). Orders are represented the same way as in the responses
+    of `/orders/...`, i.e. as `{"order": {...}}` entries. Empty lines are ignored, so the server can send
+    them as heartbeats.
+
+    If the connection breaks or nothing arrives for `read_timeout` seconds, the book is marked as not
+    synchronized and the thread reconnects, waiting `reconnect_delay` seconds between attempts.
+
+    Args:
+        api_server: Base URL of the `EtherDelta` API server.
+        contract_address: Address of the `EtherDelta` contract. Orders for other contracts are ignored.
+        token1: Address of the first token of the pair.
+        token2: Address of the second token of the pair.
+        read_timeout: Maximum number of seconds to wait for the next message before reconnecting.
+        reconnect_delay: Number of seconds to wait before reconnecting after a failure.
+        session: The `requests.Session` to open the connection with. If `None`, the stream creates
+            its own one and closes it once the background thread exits. The connection stays open
+            for as long as the stream runs, so the session should not be shared with other requests.
+    """
+
+    logger = logging.getLogger('api')
+
+    def __init__(self, api_server: str, contract_address: Address, token1: Address, token2: Address,
+                 read_timeout: float = 60.0, reconnect_delay: float = 5.0, session: Optional[requests.Session] = None):
+        assert(isinstance(api_server, str))
+        assert(isinstance(contract_address, Address))
+        assert(isinstance(token1, Address))
+        assert(isinstance(token2, Address))
+        assert(isinstance(read_timeout, (int, float)))
+        assert(isinstance(reconnect_delay, (int, float)))
+
+        self.url = f"{api_server}/orders/stream/{token1.address}/{token2.address}"
+        self.contract_address = contract_address
+        self.read_timeout = read_timeout
+        self.reconnect_delay = reconnect_delay
+        self.session = session if session is not None else requests.Session()
+        self._own_session = session is None
+        self.synced = threading.Event()
+        self._orders = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='etherdelta-order-stream', daemon=True)
+
+    def start(self):
+        """Starts the background thread receiving the orders."""
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> bool:
+        """Stops the background thread and waits up to `timeout` seconds for it to exit.
+
+        The connection gets closed by the thread itself once the next message arrives or `read_timeout`
+        elapses, as closing it from another thread would block until then anyway.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the background thread to exit.
+
+        Returns:
+            `True` if the background thread has exited, `False` if it is still waiting for the connection.
+        """
+        assert(isinstance(timeout, (int, float)))
+
+        self._stopped.set()
+        self.synced.clear()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                self.logger.warning(f"EtherDelta order stream {self.url} did not stop within {timeout} seconds")
+                return False
+
+        return True
+
+    def orders(self) -> set:
+        """Returns a copy of the current set of orders."""
+        with self._lock:
+            return set(self._orders)
+
+    def discard(self, orders: set):
+        """Removes orders from the book, for example once they have been found to be filled."""
+        with self._lock:
+            self._orders.difference_update(orders)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            response = None
+            try:
+                response = self.session.get(self.url, stream=True, timeout=(10, self.read_timeout))
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if self._stopped.is_set():
+                        break
+                    if line:
+                        self._apply(json.loads(line.decode('utf-8')))
+            except Exception as e:
+                if not self._stopped.is_set():
+                    self.logger.warning(f"EtherDelta order stream {self.url} failed ({e}), reconnecting")
+            finally:
+                self.synced.clear()
+                if response is not None:
+                    response.close()
+
+            self._stopped.wait(self.reconnect_delay)
+
+        if self._own_session:
+            self.session.close()
+
+    def _parse(self, entries: list) -> set:
+        orders_dicts = map(lambda entry: entry['order'], entries)
+        orders_dicts = filter(lambda order: Address(order['contractAddr']) == self.contract_address, orders_dicts)
+        return set(map(lambda order: OffChainOrder.from_json(order), orders_dicts))
+
+    def _apply(self, message: dict):
+        with self._lock:
+            if 'orders' in message:
+                self._orders = self._parse(message['orders'])
+                self.synced.set()
+            elif not self.synced.is_set():
+                raise Exception("Incremental message received before a snapshot")
+
+            self._orders.update(self._parse(message.get('added', [])))
+            self._orders.difference_update(self._parse(message.get('removed', [])))
+
+
 class EtherDelta(Contract):
     """A client for the EtherDelta exchange contract.
 
@@ -212,6 +466,8 @@ class EtherDelta(Contract):
         address: Ethereum address of the `EtherDelta` contract.
         api_server: Base URL of the `EtherDelta` API server (for off-chain order support etc.).
             `None` if no off-chain order support desired.
+        checkpoint_file: Name of the file the progress of discovering on-chain orders gets saved to,
+            so it can be resumed after a restart. `None` if it should not be saved.
     """
 
     abi = Contract._load_abi(__name__, 'abi/EtherDelta.abi')
@@ -219,6 +475,13 @@ class EtherDelta(Contract):
 
     ETH_TOKEN = Address('0x0000000000000000000000000000000000000000')
 
+    # number of past blocks to look for on-chain orders in, if there is no checkpoint
+    BACKFILL_BLOCKS = 1000000
+
+    # initial and maximum number of blocks to read `Order` events from in one request
+    BACKFILL_CHUNK = 10000
+    BACKFILL_MAX_CHUNK = 100000
+
     @staticmethod
     def deploy(web3: Web3,
                admin: Address,
@@ -249,16 +512,24 @@ class EtherDelta(Contract):
                           ]),
                           api_server=api_server)
 
-    def __init__(self, web3: Web3, address: Address, api_server: str):
+    def __init__(self, web3: Web3, address: Address, api_server: str, checkpoint_file: Optional[str] = None):
         assert(isinstance(address, Address))
         assert(isinstance(api_server, str) or api_server is None)
+        assert(isinstance(checkpoint_file, str) or checkpoint_file is None)
 
         self.web3 = web3
         self.address = address
         self.api_server = api_server
+        self.api = EtherDeltaApi(api_server) if api_server is not None else None
+        self.checkpoint_file = checkpoint_file
         self._contract = self._get_contract(web3, self.abi, address)
+        self._order_abi = next(abi for abi in self.abi if abi.get('type') == 'event' and abi.get('name') == 'Order')
+        self._order_filter_id = None
         self._onchain_orders = None
+        self._onchain_orders_block = None
+        self._backfill_from_block = None
         self._offchain_orders = set()
+        self._offchain_streams = {}
 
     def supports_offchain_orders(self) -> bool:
         return self.api_server is not None
@@ -401,18 +672,194 @@ class EtherDelta(Contract):
         return Wad(self._contract.call().balanceOf(token.address, user.address))
 
     def active_onchain_orders(self) -> List[OnChainOrder]:
-        # if this method is being called for the first time, discover existing orders
-        # by looking for past events and set up monitoring of the future ones
+        """Returns all active on-chain orders.
+
+        When called for the first time, a log filter for new `Order` events gets installed and then
+        past `Order` events get read, starting `BACKFILL_BLOCKS` blocks ago. They are read in chunks,
+        which get smaller if the node fails to return them and bigger again once it succeeds. After each
+        chunk the progress gets saved to `checkpoint_file` (if set), so after a restart discovering
+        orders continues from the last block read instead of starting all over again. If reading past
+        events fails, the exception gets raised and the next call continues from the first block which
+        has not been read yet. Once all past events have been read, subsequent calls only read new
+        `Order` events from the log filter.
+
+        Returns:
+            List of active on-chain orders.
+        """
         if self._onchain_orders is None:
-            self._onchain_orders = set()
-            self.on_order(lambda order: self._onchain_orders.add(order.to_order()))
-            for old_order in self.past_order(1000000):
-                self._onchain_orders.add(old_order.to_order())
+            checkpoint = self._load_checkpoint()
+            if checkpoint is not None:
+                from_block = checkpoint['block_number'] + 1
+            else:
+                from_block = max(self.web3.eth.blockNumber - self.BACKFILL_BLOCKS, 0)
+            self._onchain_orders = set(checkpoint['orders']) if checkpoint is not None else set()
+            self._backfill_from_block = from_block
+
+        if self._backfill_from_block is not None:
+            # either this is the first call, or the previous backfill failed halfway and continues now
+            self._backfill_onchain_orders()
+        else:
+            # new events can only come from blocks after this one, so it is safe to resume from it later
+            block = self._block('latest')
+            try:
+                self._add_onchain_orders(self.web3.eth.getFilterChanges(self._order_filter_id))
+                self._onchain_orders_block = block
+                self._save_checkpoint()
+            except ValueError as e:
+                self.logger.warning(f"Failed to get new EtherDelta orders ({e}), reading past orders again")
+                self._backfill_from_block = self._onchain_orders_block['number'] + 1
+                self._backfill_onchain_orders()
 
         self._remove_filled_orders(self._onchain_orders)
 
         return list(self._onchain_orders)
 
+    def _backfill_onchain_orders(self):
+        # the filter gets installed first, so no orders placed while reading past events can be missed.
+        # if reading a chunk fails for good, `_backfill_from_block` is left pointing at it, so the next
+        # call continues from there and no blocks get skipped
+        head = self._block('latest')
+        if self._order_filter_id is not None:
+            try:
+                self.web3.eth.uninstallFilter(self._order_filter_id)
+            except:
+                pass
+        self._order_filter_id = self.web3.eth.filter(self._order_filter_params(head['number'] + 1)).filter_id
+
+        chunk = self.BACKFILL_CHUNK
+        while self._backfill_from_block <= head['number']:
+            from_block = self._backfill_from_block
+            to_block = min(from_block + chunk - 1, head['number'])
+            try:
+                logs = self._order_logs(from_block, to_block)
+            except Exception as e:
+                if chunk == 1:
+                    raise
+                chunk = max(chunk // 2, 1)
+                self.logger.warning(f"Failed to read EtherDelta orders from blocks #{from_block}-#{to_block} ({e}),"
+                                    f" retrying with {chunk} blocks at a time")
+                continue
+
+            self._add_onchain_orders(logs)
+            self._onchain_orders_block = head if to_block == head['number'] else self._block(to_block)
+            self._save_checkpoint()
+            self._backfill_from_block = to_block + 1
+            chunk = min(chunk * 2, self.BACKFILL_MAX_CHUNK)
+
+        self._onchain_orders_block = head
+        self._backfill_from_block = None
+        self._save_checkpoint()
+
+    def _order_filter_params(self, from_block: int, to_block: Optional[int] = None) -> dict:
+        filter_params = {'fromBlock': from_block,
+                         'address': self.address.address,
+                         'topics': [encode_hex(event_abi_to_log_topic(self._order_abi))]}
+        if to_block is not None:
+            filter_params['toBlock'] = to_block
+        return filter_params
+
+    def _order_logs(self, from_block: int, to_block: int) -> list:
+        filter_id = self.web3.eth.filter(self._order_filter_params(from_block, to_block)).filter_id
+        try:
+            return self.web3.eth.getFilterLogs(filter_id)
+        finally:
+            self.web3.eth.uninstallFilter(filter_id)
+
+    def _add_onchain_orders(self, logs: list):
+        for log in logs:
+            self._onchain_orders.add(LogOrder(get_event_data(self._order_abi, log)['args']).to_order())
+
+    def _block(self, block_identifier) -> dict:
+        block = self.web3.eth.getBlock(block_identifier)
+        return {'number': block['number'], 'hash': block['hash']}
+
+    def _load_checkpoint(self) -> Optional[dict]:
+        if self.checkpoint_file is None or not os.path.isfile(self.checkpoint_file):
+            return None
+
+        try:
+            with open(self.checkpoint_file, 'r') as file:
+                checkpoint = json.load(file)
+        except (IOError, ValueError) as e:
+            self.logger.warning(f"Failed to read the EtherDelta checkpoint from '{self.checkpoint_file}' ({e})")
+            return None
+
+        if Address(checkpoint['contract']) != self.address:
+            self.logger.warning(f"EtherDelta checkpoint in '{self.checkpoint_file}' is not for {self.address}, ignoring it")
+            return None
+
+        block = self.web3.eth.getBlock(checkpoint['block_number'])
+        if block is None or block['hash'] != checkpoint['block_hash']:
+            self.logger.warning(f"Block #{checkpoint['block_number']} of the EtherDelta checkpoint"
+                                f" is no longer canonical, ignoring the checkpoint")
+            return None
+
+        return {'block_number': checkpoint['block_number'],
+                'orders': [OnChainOrder(token_get=Address(order[0]),
+                                        amount_get=Wad(order[1]),
+                                        token_give=Address(order[2]),
+                                        amount_give=Wad(order[3]),
+                                        expires=order[4],
+                                        nonce=order[5],
+                                        user=Address(order[6])) for order in checkpoint['orders']]}
+
+    def _save_checkpoint(self):
+        if self.checkpoint_file is None or self._onchain_orders_block is None:
+            return
+
+        checkpoint = {'contract': self.address.address,
+                      'block_number': self._onchain_orders_block['number'],
+                      'block_hash': self._onchain_orders_block['hash'],
+                      'orders': [[order.token_get.address, order.amount_get.value, order.token_give.address,
+                                  order.amount_give.value, order.expires, order.nonce, order.user.address]
+                                 for order in self._onchain_orders]}
+
+        # the checkpoint gets replaced atomically, so a crash can never leave a partially written one
+        with open(self.checkpoint_file + '.tmp', 'w') as file:
+            json.dump(checkpoint, file, separators=(',', ':'))
+        os.replace(self.checkpoint_file + '.tmp', self.checkpoint_file)
+
+    def stream_offchain_orders(self, token1: Address, token2: Address) -> OffChainOrderStream:
+        """Starts receiving off-chain orders of a token pair over a streaming API connection.
+
+        From now on `active_offchain_orders()` for this pair gets served from an in-memory book
+        kept up to date by an :py:class:`keeper.api.etherdelta.OffChainOrderStream`, instead of
+        downloading all orders on each call. It falls back to downloading them whenever the stream
+        is not synchronized, for example while it is reconnecting.
+
+        Args:
+            token1: Address of the first token of the pair.
+            token2: Address of the second token of the pair.
+
+        Returns:
+            The :py:class:`keeper.api.etherdelta.OffChainOrderStream` receiving the orders.
+        """
+        assert(isinstance(token1, Address))
+        assert(isinstance(token2, Address))
+
+        if not self.supports_offchain_orders():
+            raise Exception("Off-chain orders not supported for this EtherDelta instance")
+
+        key = self._pair_key(token1, token2)
+        if key not in self._offchain_streams:
+            self._offchain_streams[key] = OffChainOrderStream(self.api_server, self.address, token1, token2)
+            self._offchain_streams[key].start()
+
+        return self._offchain_streams[key]
+
+    def close(self):
+        """Stops all off-chain order streams started with `stream_offchain_orders()`, waiting
+        for their threads to exit, and closes connections to the API server."""
+        for stream in self._offchain_streams.values():
+            stream.stop()
+        self._offchain_streams = {}
+        if self.api is not None:
+            self.api.close()
+
+    @staticmethod
+    def _pair_key(token1: Address, token2: Address) -> tuple:
+        return tuple(sorted([token1, token2]))
+
     def active_offchain_orders(self, token1: Address, token2: Address) -> List[OffChainOrder]:
         assert(isinstance(token1, Address))
         assert(isinstance(token2, Address))
@@ -420,9 +867,16 @@ class EtherDelta(Contract):
         if not self.supports_offchain_orders():
             raise Exception("Off-chain orders not supported for this EtherDelta instance")
 
+        stream = self._offchain_streams.get(self._pair_key(token1, token2))
+        if stream is not None and stream.synced.is_set():
+            orders = stream.orders()
+            active_orders = set(orders)
+            self._remove_filled_orders(active_orders)
+            stream.discard(orders - active_orders)
+            return self._pair_orders(active_orders, token1, token2)
+
         nonce = str(hash(token1.address)) + str(hash(token2.address)) + str(random.randint(1, 2**32 - 1))
-        url = f"{self.api_server}/orders/{nonce}/{token1.address}/{token2.address}"
-        res = requests.get(url)
+        res = self.api.get('orders', f"orders/{nonce}/{token1.address}/{token2.address}")
         if res.ok:
             if len(res.text) > 0:
                 orders_dicts = map(lambda entry: entry['order'], json.loads(res.text)['orders'])
@@ -435,16 +889,21 @@ class EtherDelta(Contract):
 
         self._remove_filled_orders(self._offchain_orders)
 
+        return self._pair_orders(self._offchain_orders, token1, token2)
+
+    @staticmethod
+    def _pair_orders(orders: set, token1: Address, token2: Address) -> List[OffChainOrder]:
         return list(filter(lambda order: (order.token_get == token1 and order.token_give == token2) or
                                          (order.token_get == token2 and order.token_give == token1),
-                           self._offchain_orders))
+                           orders))
 
     def _remove_filled_orders(self, order_set: set):
         assert(isinstance(order_set, set))
 
         # remove orders which have been completely filled (or cancelled)
-        for order in list(order_set):
-            if self.amount_filled(order) == order.amount_get:
+        orders = list(order_set)
+        for order, amount_filled in zip(orders, self.amounts_filled(orders)):
+            if amount_filled == order.amount_get:
                 order_set.remove(order)
 
     def place_order_onchain(self,
@@ -545,7 +1004,7 @@ class EtherDelta(Contract):
             try:
                 self.logger.info(f"Creating off-chain EtherDelta order {log_signature} in progress...")
                 self.logger.debug(json.dumps(off_chain_order.to_json(self.address)))
-                res = requests.post(f"{self.api_server}/message",
+                res = self.api.post('message', 'message',
                                     data={'message': json.dumps(off_chain_order.to_json(self.address))},
                                     timeout=30)
 
@@ -614,6 +1073,48 @@ class EtherDelta(Contract):
                                                       order.r if hasattr(order, 'r') else bytes(),
                                                       order.s if hasattr(order, 's') else bytes()))
 
+    def amounts_available(self, orders: List[Order]) -> List[Wad]:
+        """Returns the amounts that are still available (tradeable) for multiple orders.
+
+        Does exactly the same as calling `amount_available(order)` for each order, but all calls
+        are sent to the node in one batch. If the `BlockCache` is enabled, the results are cached
+        for the current block.
+
+        Args:
+            orders: List of orders you want to know the available amounts of.
+                Can be either `OnChainOrder`s or `OffChainOrder`s.
+
+        Returns:
+            List of available amounts for the orders (in terms of their `token_get`), in the same order as `orders`.
+        """
+        assert(isinstance(orders, list))
+        return self._order_state_per_block(self.amount_available, orders)
+
+    def amounts_filled(self, orders: List[Order]) -> List[Wad]:
+        """Returns the amounts that have been already filled for multiple orders.
+
+        Does exactly the same as calling `amount_filled(order)` for each order, but all calls
+        are sent to the node in one batch. If the `BlockCache` is enabled, the results are cached
+        for the current block.
+
+        Args:
+            orders: List of orders you want to know the filled amounts of.
+                Can be either `OnChainOrder`s or `OffChainOrder`s.
+
+        Returns:
+            List of filled amounts for the orders (in terms of their `token_get`), in the same order as `orders`.
+        """
+        assert(isinstance(orders, list))
+        return self._order_state_per_block(self.amount_filled, orders)
+
+    def _order_state_per_block(self, function, orders: list) -> list:
+        def fetch_many(keys: list) -> list:
+            return batch(self.web3, [partial(function, order) for _, _, order in keys])
+
+        # without the cache enabled, a new empty one still makes sure every order is asked about only once
+        cache = BlockCache.of(self.web3) or BlockCache()
+        return cache.get_many([(self.address, function.__name__, order) for order in orders], fetch_many)
+
     def trade(self, order: Order, amount: Wad) -> Transact:
         """Takes (buys) an order.
 
@@ -15,10 +15,24 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+import logging
+import os
+import random
+import re
+import threading
+from array import array
+from fractions import Fraction
+from functools import partial
 from pprint import pformat
-from typing import Optional, List
+from typing import Optional, List, Iterable, Tuple
+
+from eth_utils import decode_hex, encode_hex, event_abi_to_log_topic, keccak
+from sortedcontainers import SortedList
+from web3.utils.events import get_event_data
 
 from keeper.api import Contract, Address, Transact
+from keeper.api.batch import batch
 from keeper.api.numeric import Wad
 from keeper.api.util import int_to_bytes32, bytes_to_int
 from web3 import Web3
@@ -39,6 +53,9 @@ class OfferInfo:
         timestamp: Date and time when this offer has been created, as a unix timestamp.
     """
 
+    __slots__ = ['offer_id', 'sell_how_much', 'sell_which_token', 'buy_how_much', 'buy_which_token', 'owner',
+                 'timestamp']
+
     def __init__(self, offer_id: int, sell_how_much: Wad, sell_which_token: Address, buy_how_much: Wad,
                  buy_which_token: Address, owner: Address, timestamp: int):
         self.offer_id = offer_id
@@ -53,7 +70,186 @@ class OfferInfo:
         return self.offer_id == other.offer_id
 
     def __repr__(self):
-        return pformat(vars(self))
+        return pformat({name: getattr(self, name) for name in self.__slots__})
+
+
+class OfferColumns:
+    """A collection of `OasisDEX` offers stored column by column.
+
+    Offer ids, amounts and timestamps are kept in parallel arrays, while tokens and owners are
+    interned and only their indices are kept in the arrays. Bulk filters like `select()` compare
+    these integers instead of doing attribute lookups and `Address` comparisons for each offer.
+    No `OfferInfo` instances are kept, they only get created for the offers being returned.
+
+    Offers can be added, replaced and removed one by one in O(1) time, so the collection can be
+    kept up to date as offers change instead of being rebuilt. A removed offer gets replaced with
+    the last one, so the offers are in the order they have been added in only until the first removal.
+
+    Attributes:
+        offer_ids: Ids of the offers.
+        sell_how_much: Raw `sell_how_much` amounts of the offers.
+        sell_which_token: Indices of the `sell_which_token` tokens of the offers in `tokens`.
+        buy_how_much: Raw `buy_how_much` amounts of the offers.
+        buy_which_token: Indices of the `buy_which_token` tokens of the offers in `tokens`.
+        owner: Indices of the owners of the offers in `owners`.
+        timestamp: Timestamps of the offers.
+        tokens: Distinct token addresses of the offers.
+        owners: Distinct owner addresses of the offers.
+    """
+
+    def __init__(self, offers: Iterable[OfferInfo] = ()):
+        self.offer_ids = array('Q')
+        self.sell_how_much = []
+        self.sell_which_token = array('I')
+        self.buy_how_much = []
+        self.buy_which_token = array('I')
+        self.owner = array('I')
+        self.timestamp = array('Q')
+        self.tokens = []
+        self.owners = []
+        self._token_index = {}
+        self._owner_index = {}
+        self._rows = {}
+
+        for offer in offers:
+            self.append(offer)
+
+    def append(self, offer: OfferInfo):
+        """Add an offer to the collection.
+
+        Args:
+            offer: The offer to add. There must be no offer with the same id in the collection yet.
+        """
+        assert(isinstance(offer, OfferInfo))
+        assert(offer.offer_id not in self._rows)
+
+        self._rows[offer.offer_id] = len(self.offer_ids)
+        self.offer_ids.append(offer.offer_id)
+        self.sell_how_much.append(offer.sell_how_much.value)
+        self.sell_which_token.append(self._intern(offer.sell_which_token, self.tokens, self._token_index))
+        self.buy_how_much.append(offer.buy_how_much.value)
+        self.buy_which_token.append(self._intern(offer.buy_which_token, self.tokens, self._token_index))
+        self.owner.append(self._intern(offer.owner, self.owners, self._owner_index))
+        self.timestamp.append(offer.timestamp)
+
+    def replace(self, offer: OfferInfo):
+        """Replace an offer with its new state, keeping its place in the collection.
+
+        Args:
+            offer: The new state of the offer. The offer must already be in the collection.
+        """
+        assert(isinstance(offer, OfferInfo))
+
+        row = self._rows[offer.offer_id]
+        self.sell_how_much[row] = offer.sell_how_much.value
+        self.sell_which_token[row] = self._intern(offer.sell_which_token, self.tokens, self._token_index)
+        self.buy_how_much[row] = offer.buy_how_much.value
+        self.buy_which_token[row] = self._intern(offer.buy_which_token, self.tokens, self._token_index)
+        self.owner[row] = self._intern(offer.owner, self.owners, self._owner_index)
+        self.timestamp[row] = offer.timestamp
+
+    def remove(self, offer_id: int):
+        """Remove an offer from the collection, moving the last offer into its place.
+
+        Args:
+            offer_id: Id of the offer to remove. The offer must be in the collection.
+        """
+        assert(isinstance(offer_id, int))
+
+        row = self._rows.pop(offer_id)
+        last = len(self.offer_ids) - 1
+        for column in (self.offer_ids, self.sell_how_much, self.sell_which_token, self.buy_how_much,
+                       self.buy_which_token, self.owner, self.timestamp):
+            if row != last:
+                column[row] = column[last]
+            column.pop()
+
+        if row != last:
+            self._rows[self.offer_ids[row]] = row
+
+    def get(self, offer_id: int) -> Optional[OfferInfo]:
+        """Get an offer by its id.
+
+        Args:
+            offer_id: Id of the offer.
+
+        Returns:
+            The offer, or `None` if there is no offer with this id in the collection.
+        """
+        assert(isinstance(offer_id, int))
+
+        row = self._rows.get(offer_id)
+        return self._offer(row) if row is not None else None
+
+    def select(self, sell_token: Optional[Address] = None, buy_token: Optional[Address] = None,
+               owner: Optional[Address] = None, tokens: Optional[List[Address]] = None) -> List[OfferInfo]:
+        """Get offers matching all the criteria given.
+
+        Args:
+            sell_token: Address of the token the offers should sell. `None` means any token.
+            buy_token: Address of the token the offers should buy. `None` means any token.
+            owner: Address of the owner of the offers. `None` means any owner.
+            tokens: If given, both tokens of the offers should be in this list.
+
+        Returns:
+            List of matching offers, in the order they are in the collection.
+        """
+        assert(isinstance(sell_token, Address) or (sell_token is None))
+        assert(isinstance(buy_token, Address) or (buy_token is None))
+        assert(isinstance(owner, Address) or (owner is None))
+        assert(isinstance(tokens, list) or (tokens is None))
+
+        indices = range(len(self.offer_ids))
+        if sell_token is not None:
+            indices = self._matching(indices, self.sell_which_token, self._token_index.get(sell_token))
+        if buy_token is not None:
+            indices = self._matching(indices, self.buy_which_token, self._token_index.get(buy_token))
+        if owner is not None:
+            indices = self._matching(indices, self.owner, self._owner_index.get(owner))
+        if tokens is not None:
+            token_indices = set(self._token_index[token] for token in tokens if token in self._token_index)
+            indices = [index for index in indices
+                       if self.sell_which_token[index] in token_indices and self.buy_which_token[index] in token_indices]
+
+        return [self._offer(index) for index in indices]
+
+    def _offer(self, row: int) -> OfferInfo:
+        return OfferInfo(offer_id=self.offer_ids[row],
+                         sell_how_much=Wad(self.sell_how_much[row]),
+                         sell_which_token=self.tokens[self.sell_which_token[row]],
+                         buy_how_much=Wad(self.buy_how_much[row]),
+                         buy_which_token=self.tokens[self.buy_which_token[row]],
+                         owner=self.owners[self.owner[row]],
+                         timestamp=self.timestamp[row])
+
+    @staticmethod
+    def _matching(indices, column: array, value: Optional[int]) -> list:
+        if value is None:
+            return []
+        return [index for index in indices if column[index] == value]
+
+    @staticmethod
+    def _intern(address: Address, addresses: list, address_index: dict) -> int:
+        index = address_index.get(address)
+        if index is None:
+            index = address_index[address] = len(addresses)
+            addresses.append(address)
+        return index
+
+    def __contains__(self, offer_id: int):
+        return offer_id in self._rows
+
+    def __getitem__(self, index: int) -> OfferInfo:
+        return self._offer(index)
+
+    def __iter__(self):
+        return (self._offer(row) for row in range(len(self.offer_ids)))
+
+    def __len__(self):
+        return len(self.offer_ids)
+
+    def __repr__(self):
+        return f"OfferColumns({len(self.offer_ids)} offers)"
 
 
 class LogMake:
@@ -113,6 +309,139 @@ class LogKill:
         return pformat(vars(self))
 
 
+class DeadOffers:
+    """Ids of `OasisDEX` offers which are known to be inactive.
+
+    Offer ids are assigned sequentially and an inactive offer never becomes active again, so over time
+    nearly all old offers end up inactive. All ids up to `watermark` are known to be inactive, and
+    inactive ids above it are kept in a bitmap, with bit `n` representing id `watermark + n + 1`.
+    Whenever the lowest ids of the bitmap become contiguous, the watermark moves up, so the memory
+    used only depends on the range of ids above the oldest active offer, not on the whole history
+    of the market. One old active offer can keep that range large though, so the bitmap never gets
+    tested id by id. `unknown()` scans it for clear bits as bytes, which costs little per inactive
+    offer, and then only the offers which may still be active get looked at.
+
+    Attributes:
+        watermark: The highest id such that this id and all lower ones are known to be inactive.
+    """
+
+    def __init__(self, watermark: int = 0):
+        assert(isinstance(watermark, int))
+        assert(watermark >= 0)
+
+        self.watermark = watermark
+        self._bits = 0
+
+    def add(self, offer_id: int):
+        """Record an offer as inactive.
+
+        Args:
+            offer_id: Id of the inactive offer.
+        """
+        assert(isinstance(offer_id, int))
+        assert(offer_id > 0)
+
+        if offer_id > self.watermark:
+            self._bits |= 1 << (offer_id - self.watermark - 1)
+            self._advance(0)
+
+    def add_up_to(self, watermark: int, excluding: Iterable[int] = ()):
+        """Record all offers up to and including `watermark` as inactive.
+
+        Args:
+            watermark: Id of the last offer which should be recorded as inactive.
+            excluding: Ids of offers which should not be recorded as inactive, as they may still be active.
+        """
+        assert(isinstance(watermark, int))
+
+        if watermark <= self.watermark:
+            return
+
+        count = watermark - self.watermark
+        excluding = [offer_id for offer_id in excluding if self.watermark < offer_id <= watermark]
+        if len(excluding) == 0:
+            self._advance(count)
+        else:
+            mask = bytearray(b'\xff' * ((count + 7) // 8))
+            for offer_id in excluding:
+                index = offer_id - self.watermark - 1
+                mask[index // 8] &= ~(1 << (index % 8)) & 0xff
+            self._bits |= int.from_bytes(mask, 'little') & ((1 << count) - 1)
+            self._advance(0)
+
+    def update(self, offer_ids: Iterable[int]):
+        """Record several offers as inactive.
+
+        Args:
+            offer_ids: Ids of the inactive offers.
+        """
+        for offer_id in offer_ids:
+            self.add(offer_id)
+
+    def above_watermark(self) -> List[int]:
+        """Get ids of inactive offers above `watermark`.
+
+        Returns:
+            Sorted list of ids of the inactive offers above `watermark`.
+        """
+        return self._set_bits(self._bits, self._bits.bit_length())
+
+    def highest(self) -> int:
+        """Get the highest id known to be inactive.
+
+        Returns:
+            The highest id known to be inactive, or `watermark` if there are no inactive ids above it.
+        """
+        return self.watermark + self._bits.bit_length()
+
+    def unknown(self, last_offer_id: int) -> List[int]:
+        """Get ids of offers up to `last_offer_id` which are not known to be inactive.
+
+        Only ids above `watermark` can be returned. The bitmap gets scanned for clear bits, so the cost
+        depends on the number of ids returned, not on the number of inactive offers above `watermark`.
+
+        Args:
+            last_offer_id: The highest id to be considered, usually the id of the last offer created.
+
+        Returns:
+            Sorted list of ids of the offers which may still be active.
+        """
+        assert(isinstance(last_offer_id, int))
+
+        count = last_offer_id - self.watermark
+        if count <= 0:
+            return []
+
+        return self._set_bits(~self._bits & ((1 << count) - 1), count)
+
+    def _set_bits(self, bits: int, count: int) -> List[int]:
+        # scanning for non-zero bytes happens in C, so only the bytes with any bit set get looked at in Python
+        data = bits.to_bytes((count + 7) // 8, 'little')
+        offer_ids = []
+        for match in re.finditer(b'[^\x00]', data):
+            index, byte = match.start(), data[match.start()]
+            offer_ids += [self.watermark + index * 8 + bit + 1 for bit in range(8) if (byte >> bit) & 1]
+        return offer_ids
+
+    def _advance(self, advance: int):
+        self.watermark += advance
+        self._bits >>= advance
+
+        # number of contiguous set bits at the bottom of the bitmap
+        contiguous = (~self._bits & (self._bits + 1)).bit_length() - 1
+        self.watermark += contiguous
+        self._bits >>= contiguous
+
+    def __contains__(self, offer_id: int):
+        return offer_id <= self.watermark or (self._bits >> (offer_id - self.watermark - 1)) & 1 == 1
+
+    def __len__(self):
+        return self.watermark + bin(self._bits).count('1')
+
+    def __repr__(self):
+        return f"DeadOffers(watermark={self.watermark}, above={self.above_watermark()})"
+
+
 class SimpleMarket(Contract):
     """A client for a `SimpleMarket` contract.
 
@@ -134,7 +463,8 @@ class SimpleMarket(Contract):
         self.web3 = web3
         self.address = address
         self._contract = self._get_contract(web3, self.abi, address)
-        self._none_offers = set()
+        self._none_offers = DeadOffers()
+        self._offer_book = None
 
     @staticmethod
     def deploy(web3: Web3):
@@ -212,10 +542,145 @@ class SimpleMarket(Contract):
                              owner=Address(array[4]),
                              timestamp=array[6])
 
-    def active_offers(self) -> List[OfferInfo]:
-        offers = [self.get_offer(offer_id + 1) for offer_id in range(self.get_last_offer_id())]
+    def active_offers(self, batch_size: int = 100) -> List[OfferInfo]:
+        """Get all active offers.
+
+        Offers are read using JSON-RPC batch requests, up to `batch_size` offers in each of them.
+        Offers which are already known to be inactive do not get read again, and their ids are
+        not even looked at one by one, see `DeadOffers.unknown()`.
+
+        Args:
+            batch_size: Maximum number of offers to read in one JSON-RPC batch request.
+
+        Returns:
+            List of active offers, ordered by their ids.
+        """
+        assert(isinstance(batch_size, int))
+        assert(batch_size > 0)
+
+        offer_ids = self._none_offers.unknown(self.get_last_offer_id())
+
+        offers = []
+        for index in range(0, len(offer_ids), batch_size):
+            offers += batch(self.web3, [partial(self.get_offer, offer_id)
+                                        for offer_id in offer_ids[index:index + batch_size]])
+
         return [offer for offer in offers if offer is not None]
 
+    def active_pair_offers(self, tokens: List[Address], owner: Optional[Address] = None,
+                           batch_size: int = 100) -> List[OfferInfo]:
+        """Get all active offers between the tokens given.
+
+        Offers of other pairs are not read at all. Ids of the candidate offers are taken from `LogMake`
+        events, which the node looks up by their indexed `pair` (and `maker`) topics, and only the ones
+        not already known to be inactive get read, using JSON-RPC batch requests.
+
+        Args:
+            tokens: Addresses of the tokens. Only offers selling one of them for another one get returned.
+            owner: Optional address of the owner. If given, only offers of this owner get returned.
+            batch_size: Maximum number of offers to read in one JSON-RPC batch request.
+
+        Returns:
+            List of active offers between `tokens`, ordered by their ids.
+        """
+        assert(isinstance(tokens, list))
+        assert(isinstance(owner, Address) or (owner is None))
+
+        return self._pair_offers(self._token_pairs(tokens), owner, batch_size)
+
+    def _pair_offers(self, pairs: List[Tuple[Address, Address]], owner: Optional[Address] = None,
+                     batch_size: int = 100) -> List[OfferInfo]:
+        assert(isinstance(batch_size, int))
+        assert(batch_size > 0)
+
+        if len(pairs) == 0:
+            return []
+
+        filter_params = {'fromBlock': 0,
+                         'address': self.address.address,
+                         'topics': [self._event_topic('LogMake'), None, self._pair_topics(pairs),
+                                    self._address_topic(owner) if owner is not None else None]}
+        filter_id = self.web3.eth.filter(filter_params).filter_id
+        try:
+            logs = self.web3.eth.getFilterLogs(filter_id)
+        finally:
+            self.web3.eth.uninstallFilter(filter_id)
+
+        event_abi = self._event_abi('LogMake')
+        offer_ids = set(bytes_to_int(get_event_data(event_abi, log)['args']['id']) for log in logs)
+        offer_ids = sorted(offer_id for offer_id in offer_ids if offer_id not in self._none_offers)
+
+        offers = []
+        for index in range(0, len(offer_ids), batch_size):
+            offers += batch(self.web3, [partial(self.get_offer, offer_id)
+                                        for offer_id in offer_ids[index:index + batch_size]])
+
+        return [offer for offer in offers if offer is not None]
+
+    def _pair_filter_params(self, pairs: List[Tuple[Address, Address]], from_block: int) -> List[dict]:
+        # `pair` is the second indexed argument of all events but `LogTake`, where `id` is not indexed,
+        # so one filter can not cover all of them
+        pair_topics = self._pair_topics(pairs)
+        return [{'fromBlock': from_block,
+                 'address': self.address.address,
+                 'topics': [[self._event_topic('LogMake'), self._event_topic('LogBump'), self._event_topic('LogKill')],
+                            None, pair_topics]},
+                {'fromBlock': from_block,
+                 'address': self.address.address,
+                 'topics': [self._event_topic('LogTake'), pair_topics]}]
+
+    def _event_abi(self, name: str) -> dict:
+        return next(abi for abi in self.abi if abi.get('type') == 'event' and abi.get('name') == name)
+
+    def _event_topic(self, name: str) -> str:
+        return encode_hex(event_abi_to_log_topic(self._event_abi(name)))
+
+    @staticmethod
+    def _token_pairs(tokens: List[Address]) -> List[Tuple[Address, Address]]:
+        return [(pay_token, buy_token) for pay_token in tokens for buy_token in tokens if pay_token != buy_token]
+
+    @staticmethod
+    def _pair_topics(pairs: List[Tuple[Address, Address]]) -> List[str]:
+        # the contract uses `keccak256(pay_gem, buy_gem)` of both addresses tightly packed as `pair`
+        return [encode_hex(keccak(decode_hex(pay_token.address) + decode_hex(buy_token.address)))
+                for pay_token, buy_token in pairs]
+
+    @staticmethod
+    def _address_topic(address: Address) -> str:
+        return encode_hex(bytes(12) + decode_hex(address.address))
+
+    def offer_book(self, snapshot_file: Optional[str] = None, tokens: Optional[List[Address]] = None) -> 'OfferBook':
+        """Get the order book of this market, kept up to date incrementally from market events.
+
+        The same `OfferBook` instance is returned every time, so keepers can call this method
+        on each block and will only pay for the offers which have changed since the last call.
+        The order book gets configured on the first call, subsequent calls can omit the arguments.
+
+        Args:
+            snapshot_file: Optional name of the file the order book snapshot should be kept in.
+            tokens: Optional list of addresses of the tokens the order book should be limited to.
+
+        Returns:
+            An instance of `OfferBook`.
+
+        Raises:
+            Exception: If the order book has already been created with a different `snapshot_file` or `tokens`.
+        """
+        assert(isinstance(snapshot_file, str) or (snapshot_file is None))
+        assert(isinstance(tokens, list) or (tokens is None))
+
+        if self._offer_book is None:
+            self._offer_book = OfferBook(self, snapshot_file, tokens)
+        else:
+            if snapshot_file is not None and snapshot_file != self._offer_book.snapshot_file:
+                raise Exception(f"The {self} order book has already been created"
+                                f" with snapshot file '{self._offer_book.snapshot_file}'")
+            if tokens is not None and (self._offer_book.tokens is None or
+                                       set(tokens) != set(self._offer_book.tokens)):
+                raise Exception(f"The {self} order book has already been created"
+                                f" with tokens {self._offer_book.tokens}")
+        return self._offer_book
+
     #TODO make it return the id of the newly created offer
     def make(self, have_token: Address, have_amount: Wad, want_token: Address, want_amount: Wad) -> Transact:
         """Create a new offer.
@@ -421,7 +886,8 @@ class MatchingMarket(ExpiringMarket):
         return Transact(self, self.web3, self.abi, self.address, self._contract,
                         'offer', [have_amount.value, have_token.address, want_amount.value, want_token.address, pos])
 
-    def position(self, have_token: Address, have_amount: Wad, want_token: Address, want_amount: Wad) -> int:
+    def position(self, have_token: Address, have_amount: Wad, want_token: Address, want_amount: Wad,
+                 excluding: Iterable[int] = ()) -> int:
         """Calculate the position (`pos`) new offer should be inserted at to minimize gas costs.
 
         The `MatchingMarket` contract maintains an internal ordered linked list of offers, which allows the contract
@@ -434,13 +900,20 @@ class MatchingMarket(ExpiringMarket):
         due to high gas usage.
 
         This method is responsible for calculating the correct insertion position. It is used internally
-        by `make` when `pos` argument is omitted (or is `None`).
+        by `make` when `pos` argument is omitted (or is `None`). If the order book returned by `offer_book()`
+        has already been created and covers this token pair, the position is looked up in its price index,
+        so the market does not get scanned each time. Otherwise only the active offers selling `have_token`
+        for `want_token` get read, as `active_pair_offers()` does, and no order book gets created.
+
+        Offers which will be gone by the time the new offer gets placed, for example because they get
+        cancelled earlier in the same `TxManager` call, have to be passed in `excluding`.
 
         Args:
             have_token: Address of the ERC20 token you want to put on sale.
             have_amount: Amount of the `have_token` token you want to put on sale.
             want_token: Address of the ERC20 token you want to be paid with.
             want_amount: Amount of the `want_token` you want to receive.
+            excluding: Ids of offers which must not be used as the position.
 
         Returns:
             The position (`pos`) new offer should be inserted at.
@@ -450,12 +923,781 @@ class MatchingMarket(ExpiringMarket):
         assert(isinstance(want_token, Address))
         assert(isinstance(want_amount, Wad))
 
-        offers = filter(lambda o: o.sell_which_token == have_token and
-                                  o.buy_which_token == want_token and
-                                  o.sell_how_much / o.buy_how_much >= have_amount / want_amount, self.active_offers())
+        excluding = set(excluding)
+        offer_book = self._offer_book
+        if offer_book is not None and (offer_book.tokens is None or
+                                       (have_token in offer_book.tokens and want_token in offer_book.tokens)):
+            return offer_book.position(have_token=have_token,
+                                       have_amount=have_amount,
+                                       want_token=want_token,
+                                       want_amount=want_amount,
+                                       excluding=excluding)
+
+        price = Fraction(have_amount.value, want_amount.value)
+        offers = [(Fraction(offer.sell_how_much.value, offer.buy_how_much.value), offer.offer_id)
+                  for offer in self._pair_offers([(have_token, want_token)])]
+        offers = [offer for offer in offers if offer[0] >= price and offer[1] not in excluding]
+        return min(offers)[1] if len(offers) > 0 else 0
+
+    def get_offer_count(self, pay_token: Address, buy_token: Address) -> int:
+        """Get the number of active offers of one token pair.
 
-        sorted_offers = sorted(offers, key=lambda o: o.sell_how_much / o.buy_how_much)
-        return sorted_offers[0].offer_id if len(sorted_offers) > 0 else 0
+        Args:
+            pay_token: Address of the token the offers sell.
+            buy_token: Address of the token the offers buy.
+
+        Returns:
+            The number of active offers selling `pay_token` for `buy_token`.
+        """
+        assert(isinstance(pay_token, Address))
+        assert(isinstance(buy_token, Address))
+
+        return self._contract.call().getOfferCount(pay_token.address, buy_token.address)
+
+    def get_best_offer(self, pay_token: Address, buy_token: Address) -> int:
+        """Get the id of the best offer of one token pair.
+
+        Args:
+            pay_token: Address of the token the offer sells.
+            buy_token: Address of the token the offer buys.
+
+        Returns:
+            The id of the best offer selling `pay_token` for `buy_token`, or `0` if there are no offers.
+        """
+        assert(isinstance(pay_token, Address))
+        assert(isinstance(buy_token, Address))
+
+        return self._contract.call().getBestOffer(pay_token.address, buy_token.address)
+
+    def get_worse_offer(self, offer_id: int) -> int:
+        """Get the id of the next worse offer of the same token pair.
+
+        Args:
+            offer_id: The id of the offer to get the next worse offer of.
+
+        Returns:
+            The id of the next worse offer, or `0` if `offer_id` is the worst one.
+        """
+        assert(isinstance(offer_id, int))
+
+        return self._contract.call().getWorseOffer(offer_id)
+
+    def order_book(self, pay_token: Address, buy_token: Address, depth: int) -> List[OfferInfo]:
+        """Get the best offers of one token pair, walking the sorted offer list kept by the contract.
+
+        Args:
+            pay_token: Address of the token the offers sell.
+            buy_token: Address of the token the offers buy.
+            depth: Maximum number of offers to return.
+
+        Returns:
+            List of up to `depth` active offers selling `pay_token` for `buy_token`, best first.
+        """
+        return self.order_books([(pay_token, buy_token)], depth)[0]
+
+    def order_books(self, pairs: List[Tuple[Address, Address]], depth: int) -> List[List[OfferInfo]]:
+        """Get the best offers of several token pairs, walking the sorted offer lists kept by the contract.
+
+        The lists of all pairs get walked at the same time, using JSON-RPC batch requests. The first
+        round trip reads the number of offers of each pair, so pairs without any offers are skipped
+        and walks stop after the last offer without asking for the next one. The second round trip
+        reads the best offer ids, each subsequent one follows one `getWorseOffer` link in each pair,
+        and finally all the offers found get read in one batch. So the number of round trips is at
+        most `depth + 2`, regardless of the number of pairs and of the number of all offers on the market.
+
+        As each link can only be followed once the previous one is known, walking whole lists costs
+        one round trip per offer. Use `active_pair_offers()` or `offer_book()` to get all offers instead.
+
+        Args:
+            pairs: List of (`pay_token`, `buy_token`) tuples.
+            depth: Maximum number of offers to return for each pair.
+
+        Returns:
+            List of lists of active offers, best first, one list for each element of `pairs`.
+        """
+        assert(isinstance(pairs, list))
+        assert(isinstance(depth, int))
+        assert(depth >= 0)
+
+        def walk(pay_token: Address, buy_token: Address) -> List[int]:
+            count = self.get_offer_count(pay_token, buy_token)
+            limit = min(count, depth)
+            offer_ids = [self.get_best_offer(pay_token, buy_token)] if limit > 0 else []
+            while 0 < len(offer_ids) < limit and offer_ids[-1] != 0:
+                offer_ids.append(self.get_worse_offer(offer_ids[-1]))
+            return [offer_id for offer_id in offer_ids if offer_id != 0]
+
+        offer_ids = batch(self.web3, [partial(walk, pay_token, buy_token) for pay_token, buy_token in pairs])
+        offers = iter(batch(self.web3, [partial(self.get_offer, offer_id) for ids in offer_ids for offer_id in ids]))
+
+        return [[offer for offer in [next(offers) for _ in ids] if offer is not None] for ids in offer_ids]
 
     def __repr__(self):
         return f"MatchingMarket('{self.address}')"
+
+
+class _Level:
+    """Price level of `PairDepth`, being a node of its treap as well."""
+
+    __slots__ = ['price', 'sell', 'buy', 'count', 'priority', 'left', 'right', 'total_sell', 'total_buy']
+
+    def __init__(self, price: Fraction, sell: int, buy: int, count: int):
+        self.price = price
+        self.sell = sell
+        self.buy = buy
+        self.count = count
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.total_sell = sell
+        self.total_buy = buy
+
+    def update(self):
+        self.total_sell = self.sell + (self.left.total_sell if self.left else 0) \
+            + (self.right.total_sell if self.right else 0)
+        self.total_buy = self.buy + (self.left.total_buy if self.left else 0) \
+            + (self.right.total_buy if self.right else 0)
+
+
+class PairDepth:
+    """Aggregated depth of one token pair of an `OasisDEX` market.
+
+    Active offers selling the same token for the same other token are grouped into price levels.
+    The price of a level is the amount of the bought token the taker has to pay for one unit
+    of the sold token, so `buy_how_much / sell_how_much` as a `Fraction`. Levels are ordered
+    from the lowest price, which is the best one for the taker. Note that this is the inverse
+    of the price `OfferBook` orders offers by, which is `sell_how_much / buy_how_much`, as
+    `MatchingMarket` does, but the taker price makes volume queries read naturally.
+
+    Levels are kept in a treap (a randomized balanced binary search tree) ordered by price, with
+    each node holding the total volumes of its subtree. Adding or removing an offer, as well as
+    `volume_up_to()` and `fill_price()`, take O(log n) expected time, where n is the number
+    of price levels, so keeping the depth up to date never needs rescanning the levels.
+
+    Attributes:
+        sell_token: Address of the token the offers sell.
+        buy_token: Address of the token the offers buy.
+    """
+
+    def __init__(self, sell_token: Address, buy_token: Address):
+        assert(isinstance(sell_token, Address))
+        assert(isinstance(buy_token, Address))
+
+        self.sell_token = sell_token
+        self.buy_token = buy_token
+        self._root = None
+        self._size = 0
+
+    def add(self, offer: OfferInfo):
+        """Add an offer to its price level.
+
+        Args:
+            offer: The offer to add.
+        """
+        self._root = self._change(self._root, Fraction(offer.buy_how_much.value, offer.sell_how_much.value),
+                                  offer.sell_how_much.value, offer.buy_how_much.value, 1)
+
+    def remove(self, offer: OfferInfo):
+        """Remove an offer from its price level.
+
+        Args:
+            offer: The offer to remove.
+        """
+        self._root = self._change(self._root, Fraction(offer.buy_how_much.value, offer.sell_how_much.value),
+                                  -offer.sell_how_much.value, -offer.buy_how_much.value, -1)
+
+    def levels(self) -> List[Tuple[Fraction, Wad, Wad]]:
+        """Get all price levels.
+
+        Returns:
+            List of (price, total `sell_how_much`, total `buy_how_much`) tuples, ordered from the lowest price.
+        """
+        levels = []
+        stack = []
+        node = self._root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            levels.append((node.price, Wad(node.sell), Wad(node.buy)))
+            node = node.right
+        return levels
+
+    def volume(self) -> Wad:
+        """Get the total amount of `sell_token` on offer.
+
+        Returns:
+            Total amount of `sell_token` offered at all price levels.
+        """
+        return Wad(self._root.total_sell) if self._root else Wad(0)
+
+    def volume_up_to(self, price: Fraction) -> Wad:
+        """Get the amount of `sell_token` which can be bought at prices up to `price`.
+
+        Args:
+            price: Maximum price, in `buy_token` per one `sell_token`, inclusive.
+
+        Returns:
+            Total amount of `sell_token` offered at prices up to `price`.
+        """
+        assert(isinstance(price, Fraction))
+
+        sold = 0
+        node = self._root
+        while node:
+            if node.price <= price:
+                sold += node.sell + (node.left.total_sell if node.left else 0)
+                node = node.right
+            else:
+                node = node.left
+        return Wad(sold)
+
+    def fill_price(self, amount: Wad) -> Optional[Fraction]:
+        """Get the volume-weighted average price of buying `amount` of `sell_token`.
+
+        Args:
+            amount: Amount of `sell_token` to buy.
+
+        Returns:
+            The average price, in `buy_token` per one `sell_token`, or `None` if there is not enough
+            `sell_token` on offer to buy `amount` of it.
+        """
+        assert(isinstance(amount, Wad))
+        assert(amount > Wad(0))
+
+        sold_before = paid_before = 0
+        node = self._root
+        while node:
+            left_sell = node.left.total_sell if node.left else 0
+            left_buy = node.left.total_buy if node.left else 0
+            if amount.value <= sold_before + left_sell:
+                node = node.left
+            elif amount.value <= sold_before + left_sell + node.sell:
+                paid = paid_before + left_buy + (amount.value - sold_before - left_sell) * node.price
+                return paid / amount.value
+            else:
+                sold_before += left_sell + node.sell
+                paid_before += left_buy + node.buy
+                node = node.right
+        return None
+
+    def _change(self, node: Optional[_Level], price: Fraction, sell: int, buy: int, count: int) -> Optional[_Level]:
+        if node is None:
+            self._size += 1
+            return _Level(price, sell, buy, count)
+
+        if price < node.price:
+            node.left = self._change(node.left, price, sell, buy, count)
+            if node.left is not None and node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        elif price > node.price:
+            node.right = self._change(node.right, price, sell, buy, count)
+            if node.right is not None and node.right.priority > node.priority:
+                node = self._rotate_left(node)
+        else:
+            node.sell += sell
+            node.buy += buy
+            node.count += count
+            if node.count == 0:
+                self._size -= 1
+                return self._merge(node.left, node.right)
+
+        node.update()
+        return node
+
+    @staticmethod
+    def _rotate_right(node: _Level) -> _Level:
+        left = node.left
+        node.left = left.right
+        node.update()
+        left.right = node
+        left.update()
+        return left
+
+    @staticmethod
+    def _rotate_left(node: _Level) -> _Level:
+        right = node.right
+        node.right = right.left
+        node.update()
+        right.left = node
+        right.update()
+        return right
+
+    def _merge(self, left: Optional[_Level], right: Optional[_Level]) -> Optional[_Level]:
+        if left is None:
+            return right
+        if right is None:
+            return left
+
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+        else:
+            right.left = self._merge(left, right.left)
+            right.update()
+            return right
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return f"PairDepth('{self.sell_token}', '{self.buy_token}', {self._size} levels)"
+
+
+class OfferBook:
+    """Active offers of an `OasisDEX` market, kept up to date incrementally from market events.
+
+    The first update reads all active offers with `active_offers()`, having installed a log filter
+    on the market contract just before. Each subsequent update only fetches new `LogMake`, `LogBump`,
+    `LogTake`, `LogKill` and `LogItemUpdate` events from that filter and re-reads the offers these
+    events refer to (in one batch), so the cost of keeping the book up to date is proportional
+    to the number of offers which have changed, not to the number of offers ever created.
+
+    Nodes drop filters which have not been polled for some time. If it happens, the whole
+    order book gets read again.
+
+    Active offers are kept in an `OfferColumns` collection, which gets updated in place as offers
+    change, see `columns()`. They are also indexed separately for each (`sell_which_token`,
+    `buy_which_token`) pair by their exact price, which is `sell_how_much / buy_how_much` as a `Fraction`,
+    the same way `MatchingMarket` orders them. The higher the price, the better the offer is for the taker.
+    This makes looking up the best and the worst offer, range scans and calculating insertion positions
+    O(log n). Aggregated price levels of each pair are kept up to date as well, see `depth()`. Note that
+    they use the taker price, `buy_how_much / sell_how_much`, so the best level is the lowest one there.
+
+    If `snapshot_file` is given, a snapshot of the order book (ids of offers known to be inactive,
+    active offers and the last block processed, together with its hash) gets saved to that file
+    after each update. On the first update, if the block from the snapshot is still part of
+    the canonical chain, the order book is restored from it and only events which happened
+    since then get fetched, instead of reading the whole order book again. The snapshot gets
+    ignored, and the order book read from scratch, if it cannot be read, if it was saved for
+    a different market or different `tokens`, or if its block is no longer part of the chain.
+
+    If `tokens` is given, the order book is limited to offers between these tokens. It is read
+    with `active_pair_offers()`, and the log filters only match events of pairs between these tokens
+    by their indexed `pair` topic, so offers and events of other pairs are neither read nor fetched.
+
+    Attributes:
+        market: The market the order book is kept for.
+        snapshot_file: Name of the file the snapshot is kept in, or `None`.
+        tokens: Addresses of the tokens the order book is limited to, or `None`.
+    """
+
+    logger = logging.getLogger('api')
+
+    EVENTS = ['LogMake', 'LogBump', 'LogTake', 'LogKill', 'LogItemUpdate']
+
+    def __init__(self, market: SimpleMarket, snapshot_file: Optional[str] = None,
+                 tokens: Optional[List[Address]] = None):
+        assert(isinstance(market, SimpleMarket))
+        assert(isinstance(snapshot_file, str) or (snapshot_file is None))
+        assert(isinstance(tokens, list) or (tokens is None))
+
+        self.market = market
+        self.snapshot_file = snapshot_file
+        self.tokens = tokens
+        self._event_abis = {encode_hex(event_abi_to_log_topic(abi)): abi for abi in market.abi
+                            if abi.get('type') == 'event' and abi.get('name') in self.EVENTS}
+        self._columns = OfferColumns()
+        self._pairs = {}
+        self._depths = {}
+        self._filter_ids = []
+        self._block = None
+        self._saved_block_hash = None
+        self._lock = threading.RLock()
+
+    def offers(self) -> List[OfferInfo]:
+        """Get all active offers, updating the order book first.
+
+        Returns:
+            List of active offers, ordered by their ids.
+        """
+        with self._lock:
+            self.update()
+            return sorted(self._columns, key=lambda offer: offer.offer_id)
+
+    def columns(self) -> OfferColumns:
+        """Get all active offers as an `OfferColumns` collection, updating the order book first.
+
+        This is the collection the order book keeps its offers in. Subsequent updates change it
+        in place, so it must not be modified by the caller.
+
+        Returns:
+            All active offers as an `OfferColumns` collection.
+        """
+        with self._lock:
+            self.update()
+            return self._columns
+
+    def pair_offers(self, sell_token: Address, buy_token: Address) -> List[OfferInfo]:
+        """Get active offers of one token pair, best first, updating the order book first.
+
+        Args:
+            sell_token: Address of the token the offers sell.
+            buy_token: Address of the token the offers buy.
+
+        Returns:
+            List of active offers selling `sell_token` for `buy_token`, ordered by price from the highest.
+        """
+        assert(isinstance(sell_token, Address))
+        assert(isinstance(buy_token, Address))
+
+        with self._lock:
+            self.update()
+            return [self._columns.get(offer_id) for price, offer_id in reversed(self._pair(sell_token, buy_token))]
+
+    def best_offer(self, sell_token: Address, buy_token: Address) -> Optional[OfferInfo]:
+        """Get the offer of one token pair with the highest price, updating the order book first.
+
+        Args:
+            sell_token: Address of the token the offer sells.
+            buy_token: Address of the token the offer buys.
+
+        Returns:
+            The best offer, or `None` if there are no offers for this pair.
+        """
+        assert(isinstance(sell_token, Address))
+        assert(isinstance(buy_token, Address))
+
+        with self._lock:
+            self.update()
+            offers = self._pair(sell_token, buy_token)
+            return self._columns.get(offers[-1][1]) if len(offers) > 0 else None
+
+    def worst_offer(self, sell_token: Address, buy_token: Address) -> Optional[OfferInfo]:
+        """Get the offer of one token pair with the lowest price, updating the order book first.
+
+        Args:
+            sell_token: Address of the token the offer sells.
+            buy_token: Address of the token the offer buys.
+
+        Returns:
+            The worst offer, or `None` if there are no offers for this pair.
+        """
+        assert(isinstance(sell_token, Address))
+        assert(isinstance(buy_token, Address))
+
+        with self._lock:
+            self.update()
+            offers = self._pair(sell_token, buy_token)
+            return self._columns.get(offers[0][1]) if len(offers) > 0 else None
+
+    def offers_in_price_range(self, sell_token: Address, buy_token: Address,
+                              min_price: Optional[Fraction] = None,
+                              max_price: Optional[Fraction] = None) -> List[OfferInfo]:
+        """Get offers of one token pair with prices in a range, updating the order book first.
+
+        Args:
+            sell_token: Address of the token the offers sell.
+            buy_token: Address of the token the offers buy.
+            min_price: Minimum price (`sell_how_much / buy_how_much`), inclusive. `None` means no minimum.
+            max_price: Maximum price (`sell_how_much / buy_how_much`), inclusive. `None` means no maximum.
+
+        Returns:
+            List of offers with prices in the range, ordered by price from the lowest.
+        """
+        assert(isinstance(sell_token, Address))
+        assert(isinstance(buy_token, Address))
+        assert(isinstance(min_price, Fraction) or (min_price is None))
+        assert(isinstance(max_price, Fraction) or (max_price is None))
+
+        with self._lock:
+            self.update()
+            return [self._columns.get(offer_id) for price, offer_id in self._pair(sell_token, buy_token).irange(
+                minimum=(min_price, 0) if min_price is not None else None,
+                maximum=(max_price, float('inf')) if max_price is not None else None)]
+
+    def depth(self, sell_token: Address, buy_token: Address, owner: Optional[Address] = None) -> PairDepth:
+        """Get the aggregated depth of one token pair, updating the order book first.
+
+        The same `PairDepth` instance keeps being updated as offers change, as long as the whole
+        order book does not have to be read again. The depth of offers of one owner gets built
+        on the first call for that owner, and is kept up to date from then on as well.
+
+        Args:
+            sell_token: Address of the token the offers sell.
+            buy_token: Address of the token the offers buy.
+            owner: Optional address of the owner. If given, only offers of this owner are included.
+
+        Returns:
+            Price levels of offers selling `sell_token` for `buy_token`, as a `PairDepth` instance.
+        """
+        assert(isinstance(sell_token, Address))
+        assert(isinstance(buy_token, Address))
+        assert(isinstance(owner, Address) or (owner is None))
+
+        with self._lock:
+            self.update()
+            offers = self._pair(sell_token, buy_token)
+            if (sell_token, buy_token, owner) not in self._depths:
+                depth = PairDepth(sell_token, buy_token)
+                for price, offer_id in offers:
+                    offer = self._columns.get(offer_id)
+                    if offer.owner == owner:
+                        depth.add(offer)
+                self._depths[(sell_token, buy_token, owner)] = depth
+            return self._depths[(sell_token, buy_token, owner)]
+
+    def level_offers(self, sell_token: Address, buy_token: Address) -> List[OfferInfo]:
+        """Get the largest offer of each price level of one token pair, updating the order book first.
+
+        Offers of the same price only differ by their volume, so for a taker the largest one of
+        each level is at least as good as any other one of that level.
+
+        Args:
+            sell_token: Address of the token the offers sell.
+            buy_token: Address of the token the offers buy.
+
+        Returns:
+            List of offers selling `sell_token` for `buy_token`, one for each price level, ordered by price from the highest.
+        """
+        assert(isinstance(sell_token, Address))
+        assert(isinstance(buy_token, Address))
+
+        with self._lock:
+            self.update()
+            offers = []
+            last_price = None
+            for price, offer_id in reversed(self._pair(sell_token, buy_token)):
+                offer = self._columns.get(offer_id)
+                if price != last_price:
+                    offers.append(offer)
+                    last_price = price
+                elif offer.sell_how_much > offers[-1].sell_how_much:
+                    offers[-1] = offer
+            return offers
+
+    def position(self, have_token: Address, have_amount: Wad, want_token: Address, want_amount: Wad,
+                 excluding: Iterable[int] = ()) -> int:
+        """Find the cheapest offer of the same pair priced at least as high as a new offer would be.
+
+        This is the insertion position `MatchingMarket` expects when placing a new offer.
+
+        Args:
+            have_token: Address of the token the new offer would sell.
+            have_amount: Amount of `have_token` the new offer would sell.
+            want_token: Address of the token the new offer would buy.
+            want_amount: Amount of `want_token` the new offer would buy.
+            excluding: Ids of offers which will be gone by the time the new offer gets placed.
+
+        Returns:
+            Id of the offer the new offer should be inserted at, or `0` if there is no such offer.
+        """
+        assert(isinstance(have_token, Address))
+        assert(isinstance(have_amount, Wad))
+        assert(isinstance(want_token, Address))
+        assert(isinstance(want_amount, Wad))
+
+        excluding = set(excluding)
+        with self._lock:
+            self.update()
+            offers = self._pair(have_token, want_token)
+            index = offers.bisect_left((Fraction(have_amount.value, want_amount.value), 0))
+            while index < len(offers) and offers[index][1] in excluding:
+                index += 1
+            return offers[index][1] if index < len(offers) else 0
+
+    def update(self):
+        """Bring the order book up to date with the market."""
+        with self._lock:
+            if len(self._filter_ids) == 0:
+                if not self._resume():
+                    self._bootstrap()
+            else:
+                # changes can only be newer than the block, so it is safe to resume from it later
+                block = self._latest_block() if self.snapshot_file is not None else None
+                try:
+                    self._apply([log for filter_id in self._filter_ids
+                                 for log in self.market.web3.eth.getFilterChanges(filter_id)])
+                    self._block = block
+                except ValueError as e:
+                    self.logger.warning(f"Failed to get changes of the {self.market} order book ({e}),"
+                                        f" reading the whole order book again")
+                    self._bootstrap()
+
+            self._save()
+
+    def close(self):
+        """Uninstall the log filters. The order book will be read again on next update."""
+        with self._lock:
+            for filter_id in self._filter_ids:
+                try:
+                    self.market.web3.eth.uninstallFilter(filter_id)
+                except:
+                    pass
+            self._filter_ids = []
+
+    def _bootstrap(self):
+        # offers get read not earlier than at `block`, so no changes after it can be missed
+        self.close()
+        block = self._latest_block()
+        self._install_filter(block['number'] + 1)
+        self._columns = OfferColumns()
+        self._pairs = {}
+        self._depths = {}
+        offers = self.market.active_offers() if self.tokens is None else self.market.active_pair_offers(self.tokens)
+        for offer in offers:
+            self._set(offer.offer_id, offer)
+        self._block = block
+
+    def _resume(self) -> bool:
+        if self.snapshot_file is None or not os.path.isfile(self.snapshot_file):
+            return False
+
+        try:
+            with open(self.snapshot_file, 'r') as file:
+                snapshot = json.load(file)
+        except (IOError, ValueError) as e:
+            self.logger.warning(f"Failed to read the {self.market} order book snapshot from '{self.snapshot_file}' ({e})")
+            return False
+
+        if Address(snapshot['market']) != self.market.address:
+            self.logger.warning(f"Order book snapshot in '{self.snapshot_file}' is not for {self.market}, ignoring it")
+            return False
+
+        if snapshot.get('tokens') != self._tokens_to_json():
+            self.logger.warning(f"Order book snapshot in '{self.snapshot_file}' is for different tokens, ignoring it")
+            return False
+
+        snapshot_block = self.market.web3.eth.getBlock(snapshot['block_number'])
+        if snapshot_block is None or snapshot_block['hash'] != snapshot['block_hash']:
+            self.logger.warning(f"Block #{snapshot['block_number']} of the {self.market} order book snapshot"
+                                f" is no longer canonical, reading the whole order book again")
+            return False
+
+        self.close()
+        block = self._latest_block()
+        self._install_filter(snapshot['block_number'] + 1)
+        self._columns = OfferColumns()
+        self._pairs = {}
+        self._depths = {}
+        self.market._none_offers.add_up_to(snapshot['dead_offers_up_to'], excluding=snapshot['dead_offers_except'])
+        for offer in map(self._offer_from_json, snapshot['offers']):
+            self._set(offer.offer_id, offer)
+        self._apply([log for filter_id in self._filter_ids
+                     for log in self.market.web3.eth.getFilterLogs(filter_id)])
+        self._block = block
+
+        self.logger.info(f"Restored the {self.market} order book from block #{snapshot['block_number']},"
+                         f" {len(self._columns)} active offers")
+        return True
+
+    def _save(self):
+        if self.snapshot_file is None or self._block is None or self._block['hash'] == self._saved_block_hash:
+            return
+
+        snapshot = {'market': self.market.address.address,
+                    'tokens': self._tokens_to_json(),
+                    'block_number': self._block['number'],
+                    'block_hash': self._block['hash'],
+                    'dead_offers_up_to': self.market._none_offers.highest(),
+                    'dead_offers_except': self.market._none_offers.unknown(self.market._none_offers.highest()),
+                    'offers': [self._offer_to_json(offer) for offer in sorted(self._columns, key=lambda offer: offer.offer_id)]}
+
+        # the snapshot gets replaced atomically, so a crash can never leave a partially written one
+        with open(self.snapshot_file + '.tmp', 'w') as file:
+            json.dump(snapshot, file, separators=(',', ':'))
+        os.replace(self.snapshot_file + '.tmp', self.snapshot_file)
+        self._saved_block_hash = self._block['hash']
+
+    def _latest_block(self) -> dict:
+        block = self.market.web3.eth.getBlock('latest')
+        return {'number': block['number'], 'hash': block['hash']}
+
+    def _install_filter(self, from_block: int):
+        if self.tokens is None:
+            filter_params = [{'fromBlock': from_block, 'address': self.market.address.address}]
+        else:
+            filter_params = self.market._pair_filter_params(self.market._token_pairs(self.tokens), from_block)
+        self._filter_ids = [self.market.web3.eth.filter(params).filter_id for params in filter_params]
+
+    def _apply(self, logs: list):
+        offer_ids = set(filter(lambda offer_id: offer_id is not None, map(self._offer_id, logs)))
+        if len(offer_ids) > 0:
+            self._refresh(sorted(offer_ids))
+
+    def _refresh(self, offer_ids: List[int]):
+        offers = batch(self.market.web3, [partial(self.market.get_offer, offer_id) for offer_id in offer_ids])
+        for offer_id, offer in zip(offer_ids, offers):
+            self._set(offer_id, offer)
+
+    def _set(self, offer_id: int, offer: Optional[OfferInfo]):
+        if offer is not None and not self._in_scope(offer.sell_which_token, offer.buy_which_token):
+            offer = None
+
+        previous = self._columns.get(offer_id)
+        if previous is not None:
+            self._pair(previous.sell_which_token, previous.buy_which_token).remove((self._price(previous), offer_id))
+            for depth in self._offer_depths(previous):
+                depth.remove(previous)
+
+        if offer is not None:
+            if previous is not None:
+                self._columns.replace(offer)
+            else:
+                self._columns.append(offer)
+            self._pair(offer.sell_which_token, offer.buy_which_token).add((self._price(offer), offer_id))
+            for depth in self._offer_depths(offer):
+                depth.add(offer)
+        elif previous is not None:
+            self._columns.remove(offer_id)
+
+    def _offer_depths(self, offer: OfferInfo) -> List[PairDepth]:
+        return [self._depths[key] for key in [(offer.sell_which_token, offer.buy_which_token, None),
+                                              (offer.sell_which_token, offer.buy_which_token, offer.owner)]
+                if key in self._depths]
+
+    def _pair(self, sell_token: Address, buy_token: Address) -> SortedList:
+        # (price, offer id) tuples, so offers with the same price are ordered by their ids
+        if (sell_token, buy_token) not in self._pairs:
+            self._pairs[(sell_token, buy_token)] = SortedList()
+            self._depths[(sell_token, buy_token, None)] = PairDepth(sell_token, buy_token)
+        return self._pairs[(sell_token, buy_token)]
+
+    @staticmethod
+    def _price(offer: OfferInfo) -> Fraction:
+        return Fraction(offer.sell_how_much.value, offer.buy_how_much.value)
+
+    def _in_scope(self, sell_token: Address, buy_token: Address) -> bool:
+        return self.tokens is None or (sell_token in self.tokens and buy_token in self.tokens)
+
+    def _tokens_to_json(self) -> Optional[list]:
+        return sorted(token.address for token in self.tokens) if self.tokens is not None else None
+
+    @staticmethod
+    def _offer_to_json(offer: OfferInfo) -> list:
+        return [offer.offer_id, offer.sell_how_much.value, offer.sell_which_token.address,
+                offer.buy_how_much.value, offer.buy_which_token.address, offer.owner.address, offer.timestamp]
+
+    @staticmethod
+    def _offer_from_json(data: list) -> OfferInfo:
+        return OfferInfo(offer_id=data[0],
+                         sell_how_much=Wad(data[1]),
+                         sell_which_token=Address(data[2]),
+                         buy_how_much=Wad(data[3]),
+                         buy_which_token=Address(data[4]),
+                         owner=Address(data[5]),
+                         timestamp=data[6])
+
+    def _offer_id(self, log) -> Optional[int]:
+        event_abi = self._event_abis.get(log['topics'][0]) if len(log['topics']) > 0 else None
+        if event_abi is None:
+            return None
+
+        args = get_event_data(event_abi, log)['args']
+        offer_id = args['id'] if isinstance(args['id'], int) else bytes_to_int(args['id'])
+
+        # all events other than `LogItemUpdate` tell which pair the offer belongs to, and any change
+        # of an offer emits one of them, so `LogItemUpdate` only matters for offers we already have
+        if self.tokens is not None:
+            if 'pay_gem' in args:
+                if not self._in_scope(Address(args['pay_gem']), Address(args['buy_gem'])):
+                    return None
+            elif offer_id not in self._columns:
+                return None
+
+        return offer_id
+
+    def __repr__(self):
+        return f"OfferBook({self.market})"
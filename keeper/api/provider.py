@@ -0,0 +1,553 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import copy
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from eth_utils import force_obj_to_text
+from requests.adapters import HTTPAdapter
+from web3 import HTTPProvider
+from web3.providers.base import BaseProvider, JSONBaseProvider
+
+from keeper.api.asynchronous import AsyncHTTPClient, request_async
+from keeper.api.batch import make_batch_request, match_batch_responses
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """HTTP JSON-RPC provider using persistent keep-alive connections from separate connection pools.
+
+    Filter polling (`eth_getFilterChanges` etc.), transaction sending (`eth_sendTransaction`,
+    `eth_getTransactionCount` etc.) and all other requests (mainly `eth_call`) get sent using
+    separate connection pools. Thanks to that a burst of contract calls will never delay
+    filter polling or transaction submission, as each of them will always have its own
+    connections available.
+
+    If all connections in a pool are in use, the request waits for one of them to become
+    available, so the total number of connections open to the node never exceeds the sum
+    of pool sizes.
+
+    Args:
+        endpoint_uri: The JSON-RPC endpoint, for example `http://localhost:8545`.
+        pool_size: Maximum number of connections used for contract calls and all other requests.
+        filter_pool_size: Maximum number of connections used for filter polling.
+        transaction_pool_size: Maximum number of connections used for sending transactions.
+        timeout: Timeout (in seconds) for contract calls and all other requests.
+        filter_timeout: Timeout (in seconds) for filter polling requests.
+        transaction_timeout: Timeout (in seconds) for transaction sending requests.
+    """
+
+    FILTER_METHODS = {'eth_newFilter', 'eth_newBlockFilter', 'eth_newPendingTransactionFilter',
+                      'eth_getFilterChanges', 'eth_getFilterLogs', 'eth_uninstallFilter'}
+
+    TRANSACTION_METHODS = {'eth_sendTransaction', 'eth_sendRawTransaction', 'eth_getTransactionCount',
+                           'eth_sign', 'eth_estimateGas'}
+
+    def __init__(self, endpoint_uri: str,
+                 pool_size: int = 10, filter_pool_size: int = 2, transaction_pool_size: int = 4,
+                 timeout: float = 10, filter_timeout: float = 10, transaction_timeout: float = 60):
+        assert(isinstance(endpoint_uri, str))
+        assert(isinstance(pool_size, int))
+        assert(isinstance(filter_pool_size, int))
+        assert(isinstance(transaction_pool_size, int))
+        assert(isinstance(timeout, (int, float)))
+        assert(isinstance(filter_timeout, (int, float)))
+        assert(isinstance(transaction_timeout, (int, float)))
+
+        super().__init__(endpoint_uri)
+        self.pool_size = pool_size
+        self.call_pool = self._session(pool_size), timeout
+        self.filter_pool = self._session(filter_pool_size), filter_timeout
+        self.transaction_pool = self._session(transaction_pool_size), transaction_timeout
+
+    @staticmethod
+    def _session(pool_size: int) -> requests.Session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _pool(self, method: str):
+        if method in self.FILTER_METHODS:
+            return self.filter_pool
+        elif method in self.TRANSACTION_METHODS:
+            return self.transaction_pool
+        else:
+            return self.call_pool
+
+    def _post(self, pool, request_data: bytes) -> bytes:
+        session, timeout = pool
+        response = session.post(self.endpoint_uri, data=request_data, timeout=timeout, **self.get_request_kwargs())
+        response.raise_for_status()
+        return response.content
+
+    def make_request(self, method, params):
+        return self._post(self._pool(method), self.encode_rpc_request(method, params))
+
+    async def make_request_async(self, method, params) -> dict:
+        # the non-blocking client gets the same number of connections and timeout as contract calls
+        session, timeout = self.call_pool
+        return await AsyncHTTPClient.get(self.endpoint_uri, self.pool_size, timeout).request(method, params)
+
+    def make_batch_request(self, requests: list) -> list:
+        request_data = json.dumps(force_obj_to_text([{"jsonrpc": "2.0", "method": method, "params": params, "id": id}
+                                                     for id, (method, params) in enumerate(requests)]))
+        responses = json.loads(self._post(self.call_pool, request_data.encode('utf-8')).decode('utf-8'))
+        return match_batch_responses(responses, len(requests))
+
+    def close(self):
+        for session, timeout in [self.call_pool, self.filter_pool, self.transaction_pool]:
+            session.close()
+
+    def __str__(self):
+        return f"Pooled RPC connection {self.endpoint_uri}"
+
+
+class EndpointStats:
+    """Health and latency statistics of one JSON-RPC endpoint.
+
+    Attributes:
+        endpoint_uri: The JSON-RPC endpoint.
+        requests: Number of requests sent to the endpoint.
+        failures: Number of requests which failed (timeouts, connection errors, HTTP errors).
+        consecutive_failures: Number of requests which failed since the last successful one.
+        latency: Exponential moving average of the request latency, in seconds.
+        last_failure_time: Time (as returned by `time.time()`) of the last failed request.
+    """
+    def __init__(self, endpoint_uri: str):
+        self.endpoint_uri = endpoint_uri
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = 0.0
+        self.last_failure_time = None
+
+    def record(self, latency: float, failed: bool):
+        """Records the outcome of one request.
+
+        The latency of failed requests is not taken into account. The first successful request
+        sets the average directly, even if some requests failed before it.
+
+        Args:
+            latency: Duration of the request, in seconds.
+            failed: `True` if the request failed, `False` otherwise.
+        """
+        self.requests += 1
+        if failed:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure_time = time.time()
+        else:
+            self.consecutive_failures = 0
+            self.latency = latency if self.requests - self.failures == 1 else 0.7 * self.latency + 0.3 * latency
+
+    def healthy(self, max_failures: int, recovery_time: float) -> bool:
+        return self.consecutive_failures < max_failures or time.time() - self.last_failure_time > recovery_time
+
+    def __repr__(self):
+        return f"EndpointStats('{self.endpoint_uri}', requests={self.requests}, failures={self.failures}," \
+               f" consecutive_failures={self.consecutive_failures}, latency={self.latency:.3f})"
+
+
+class HedgedHTTPProvider(JSONBaseProvider):
+    """JSON-RPC provider spreading requests over multiple nodes.
+
+    Contract calls and all other read requests are sent to the fastest healthy endpoint.
+    If it does not respond within `hedge_delay` seconds, the same request gets sent to the
+    second fastest endpoint as well and whichever response comes first is used. If a request
+    fails, it gets retried on the next endpoint.
+
+    Transaction sending, nonce queries, account queries and filters are always pinned to the first
+    endpoint, as nodes do not share accounts, pending transactions nor installed filters with each other.
+    So are block number, block, transaction and receipt lookups, as the block hashes returned by filters
+    and the transactions sent could be not known yet to a lagging endpoint. The first endpoint is also
+    the one exposed as `endpoint_uri`.
+
+    An endpoint becomes unhealthy after `max_failures` consecutive failed requests. Unhealthy
+    endpoints are used only if no healthy ones are available, or once `recovery_time` seconds
+    have passed since their last failure.
+
+    Args:
+        endpoint_uris: List of JSON-RPC endpoints, for example `['http://node1:8545', 'http://node2:8545']`.
+        hedge_delay: Time (in seconds) after which a slow read request gets sent to the second endpoint.
+        max_failures: Number of consecutive failures after which an endpoint becomes unhealthy.
+        recovery_time: Time (in seconds) after which an unhealthy endpoint gets tried again.
+        pool_size: Maximum number of connections to each endpoint used for contract calls and all other requests.
+        timeout: Timeout (in seconds) for each request.
+    """
+    logger = logging.getLogger('api')
+
+    PINNED_METHODS = PooledHTTPProvider.FILTER_METHODS | PooledHTTPProvider.TRANSACTION_METHODS \
+        | {'eth_accounts', 'eth_coinbase', 'eth_blockNumber', 'eth_getBlockByHash', 'eth_getBlockByNumber',
+           'eth_getTransactionByHash', 'eth_getTransactionReceipt'}
+
+    def __init__(self, endpoint_uris: list, hedge_delay: float = 0.5, max_failures: int = 3,
+                 recovery_time: float = 30, pool_size: int = 10, timeout: float = 10):
+        assert(isinstance(endpoint_uris, list))
+        assert(len(endpoint_uris) > 0)
+        assert(isinstance(hedge_delay, (int, float)))
+        assert(isinstance(max_failures, int))
+        assert(isinstance(recovery_time, (int, float)))
+        assert(isinstance(pool_size, int))
+        assert(isinstance(timeout, (int, float)))
+
+        super().__init__()
+        self.endpoint_uri = endpoint_uris[0]
+        self.providers = [PooledHTTPProvider(endpoint_uri, pool_size=pool_size, timeout=timeout, filter_timeout=timeout)
+                          for endpoint_uri in endpoint_uris]
+        self.hedge_delay = hedge_delay
+        self.max_failures = max_failures
+        self.recovery_time = recovery_time
+        self._stats = {endpoint_uri: EndpointStats(endpoint_uri) for endpoint_uri in endpoint_uris}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=10*len(endpoint_uris))
+
+    def endpoint_stats(self) -> list:
+        """Returns health and latency statistics of all endpoints.
+
+        Returns:
+            List of `EndpointStats` objects, one for each endpoint.
+        """
+        with self._stats_lock:
+            return [copy.copy(self._stats[provider.endpoint_uri]) for provider in self.providers]
+
+    def _ranked_providers(self) -> list:
+        with self._stats_lock:
+            def key(provider):
+                stats = self._stats[provider.endpoint_uri]
+                return not stats.healthy(self.max_failures, self.recovery_time), stats.latency
+
+            return sorted(self.providers, key=key)
+
+    def _record(self, provider: PooledHTTPProvider, latency: float, failed: bool):
+        with self._stats_lock:
+            self._stats[provider.endpoint_uri].record(latency, failed)
+
+    def _timed(self, provider: PooledHTTPProvider, function):
+        start = time.time()
+        try:
+            result = function(provider)
+        except:
+            self._record(provider, time.time() - start, True)
+            raise
+
+        self._record(provider, time.time() - start, False)
+        return result
+
+    def _hedged(self, function):
+        providers = self._ranked_providers()
+        futures = set()
+        submitted = 0
+        hedged = False
+        last_exception = None
+
+        def submit():
+            nonlocal submitted
+            futures.add(self._executor.submit(self._timed, providers[submitted], function))
+            submitted += 1
+
+        submit()
+        while len(futures) > 0:
+            can_hedge = not hedged and submitted < len(providers)
+            done, futures = wait(futures, timeout=(self.hedge_delay if can_hedge else None),
+                                 return_when=FIRST_COMPLETED)
+
+            if len(done) == 0:
+                self.logger.debug(f"No response from {providers[submitted-1].endpoint_uri} within"
+                                  f" {self.hedge_delay}s, hedging to {providers[submitted].endpoint_uri}")
+                hedged = True
+                submit()
+                continue
+
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    self.logger.warning(f"Request failed, trying another endpoint ({e})")
+                    last_exception = e
+
+            if submitted < len(providers):
+                submit()
+
+        raise last_exception
+
+    def make_request(self, method, params):
+        if method in self.PINNED_METHODS:
+            return self._timed(self.providers[0], lambda provider: provider.make_request(method, params))
+        else:
+            return self._hedged(lambda provider: provider.make_request(method, params))
+
+    def make_batch_request(self, requests: list) -> list:
+        return self._hedged(lambda provider: provider.make_batch_request(requests))
+
+    async def make_request_async(self, method, params) -> dict:
+        # asynchronous requests do not get hedged, but they still go to the fastest healthy
+        # endpoint and get retried on the next one if they fail
+        providers = [self.providers[0]] if method in self.PINNED_METHODS else self._ranked_providers()
+        last_exception = None
+        for provider in providers:
+            start = time.time()
+            try:
+                response = await provider.make_request_async(method, params)
+            except Exception as e:
+                self._record(provider, time.time() - start, True)
+                self.logger.warning(f"Request failed, trying another endpoint ({e})")
+                last_exception = e
+                continue
+
+            self._record(provider, time.time() - start, False)
+            return response
+
+        raise last_exception
+
+    def isConnected(self):
+        return any(provider.isConnected() for provider in self.providers)
+
+    def __str__(self):
+        return f"Hedged RPC connection {', '.join(provider.endpoint_uri for provider in self.providers)}"
+
+
+class ProviderWrapper(BaseProvider):
+    """Base class for providers adding some behaviour to another provider.
+
+    All attributes not defined by the wrapper (like `endpoint_uri`) are taken from
+    the wrapped provider, so wrappers can be freely stacked on top of each other.
+
+    Args:
+        provider: The `web3.py` provider to be wrapped.
+    """
+    def __init__(self, provider):
+        self.provider = provider
+
+    def __getattr__(self, name):
+        if name == 'provider':
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    def unwrap(self):
+        """Get the provider at the bottom of the stack of wrappers.
+
+        Returns:
+            The innermost wrapped provider, which is not a `ProviderWrapper` itself.
+        """
+        return self.provider.unwrap() if isinstance(self.provider, ProviderWrapper) else self.provider
+
+    def make_request(self, method, params):
+        return self.provider.make_request(method, params)
+
+    def make_batch_request(self, requests: list) -> list:
+        return make_batch_request(self.provider, requests)
+
+    async def make_request_async(self, method, params) -> dict:
+        return await request_async(self.provider, method, params)
+
+    def isConnected(self):
+        return self.provider.isConnected()
+
+
+class AdaptiveLimiter:
+    """Limits the number of JSON-RPC requests in flight, adapting the limit to the node performance.
+
+    The limit grows by one every time `limit` requests complete successfully within `target_latency`
+    seconds (additive increase), and gets halved if a request fails or takes longer than that
+    (multiplicative decrease), but no more often than once every `target_latency` seconds.
+
+    High priority requests (filter polling and transactions) are always admitted
+    before the waiting low priority ones (bulk reads), and they can exceed the limit by
+    `reserve` requests, so they never wait for a burst of contract calls to finish.
+
+    Args:
+        initial_limit: Initial number of requests allowed in flight.
+        min_limit: Minimum number of requests allowed in flight.
+        max_limit: Maximum number of requests allowed in flight.
+        target_latency: Latency (in seconds) above which the node is considered overloaded.
+        reserve: Number of requests by which high priority requests can exceed the limit.
+    """
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 32,
+                 target_latency: float = 1.0, reserve: int = 2):
+        assert(isinstance(initial_limit, int))
+        assert(isinstance(min_limit, int))
+        assert(isinstance(max_limit, int))
+        assert(min_limit <= initial_limit <= max_limit)
+        assert(isinstance(target_latency, (int, float)))
+        assert(isinstance(reserve, int))
+
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.reserve = reserve
+        self.in_flight = 0
+        self._waiting_high = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._async_waiters = []
+        self._async_holders = {}
+
+    def _available(self, high_priority: bool) -> bool:
+        if high_priority:
+            return self.in_flight < int(self.limit) + self.reserve
+        else:
+            return self.in_flight < int(self.limit) and self._waiting_high == 0
+
+    def acquire(self, high_priority: bool):
+        """Waits until the request can be sent."""
+        with self._condition:
+            if high_priority:
+                self._waiting_high += 1
+            try:
+                while not self._available(high_priority):
+                    self._condition.wait()
+            finally:
+                if high_priority:
+                    self._waiting_high -= 1
+
+            self.in_flight += 1
+
+    async def acquire_async(self, high_priority: bool):
+        """Waits until the request can be sent, without blocking the event loop.
+
+        The slot has to be given back with `release_async()`, called from the same event loop.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            with self._condition:
+                if self._available(high_priority):
+                    self.in_flight += 1
+                    thread = threading.get_ident()
+                    self._async_holders[thread] = self._async_holders.get(thread, 0) + 1
+                    return
+
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+                if high_priority:
+                    self._waiting_high += 1
+
+            try:
+                await waiter
+            finally:
+                if high_priority:
+                    with self._condition:
+                        self._waiting_high -= 1
+
+    def release(self, latency: float, failed: bool):
+        """Records the outcome of a request sent after `acquire()` and adapts the limit accordingly."""
+        with self._condition:
+            self.in_flight -= 1
+            if failed or latency > self.target_latency:
+                if time.time() - self._last_decrease > self.target_latency:
+                    self.limit = max(float(self.min_limit), self.limit / 2)
+                    self._last_decrease = time.time()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+            self._condition.notify_all()
+            for loop, waiter in self._async_waiters:
+                try:
+                    loop.call_soon_threadsafe(self._wake, waiter)
+                except RuntimeError:
+                    # the event loop of a cancelled waiter can be closed already
+                    pass
+            self._async_waiters = []
+
+    def release_async(self, latency: float, failed: bool):
+        """Records the outcome of a request sent after `acquire_async()` and adapts the limit accordingly."""
+        with self._condition:
+            thread = threading.get_ident()
+            self._async_holders[thread] -= 1
+            if self._async_holders[thread] == 0:
+                del self._async_holders[thread]
+
+        self.release(latency, failed)
+
+    def held_asynchronously(self) -> bool:
+        """Checks if asynchronous requests running in the current thread hold any slots.
+
+        If they do, the current thread must not wait in `acquire()`, as these requests could
+        only give their slots back once the event loop of this thread gets control again.
+        """
+        with self._condition:
+            return threading.get_ident() in self._async_holders
+
+    @staticmethod
+    def _wake(waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+class LimitedProvider(ProviderWrapper):
+    """Provider sending requests through an `AdaptiveLimiter`.
+
+    Filter polling and the requests made while sending a transaction (gas estimation, nonce,
+    submission and receipt polling) are treated as high priority, all other requests
+    as low priority. Asynchronous requests wait for a slot without
+    blocking the event loop and then get sent using the non-blocking transport of
+    the wrapped provider.
+
+    Args:
+        provider: The `web3.py` provider to be wrapped.
+        limiter: The limiter to be used. Can be shared by many providers.
+    """
+    HIGH_PRIORITY_METHODS = PooledHTTPProvider.FILTER_METHODS | PooledHTTPProvider.TRANSACTION_METHODS \
+        | {'eth_getTransactionReceipt'}
+
+    def __init__(self, provider, limiter: AdaptiveLimiter):
+        assert(isinstance(limiter, AdaptiveLimiter))
+
+        super().__init__(provider)
+        self.limiter = limiter
+
+    def _limited(self, high_priority: bool, function):
+        # a synchronous request made while asynchronous requests of the same thread hold slots
+        # could wait for these slots forever, as they only get released when the event loop runs
+        if self.limiter.held_asynchronously():
+            return function()
+
+        self.limiter.acquire(high_priority)
+        start = time.time()
+        try:
+            result = function()
+        except:
+            self.limiter.release(time.time() - start, True)
+            raise
+
+        self.limiter.release(time.time() - start, False)
+        return result
+
+    def make_request(self, method, params):
+        return self._limited(method in self.HIGH_PRIORITY_METHODS, lambda: self.provider.make_request(method, params))
+
+    def make_batch_request(self, requests: list) -> list:
+        return self._limited(False, lambda: make_batch_request(self.provider, requests))
+
+    async def make_request_async(self, method, params) -> dict:
+        await self.limiter.acquire_async(method in self.HIGH_PRIORITY_METHODS)
+        start = time.time()
+        try:
+            response = await request_async(self.provider, method, params)
+        except:
+            self.limiter.release_async(time.time() - start, True)
+            raise
+
+        self.limiter.release_async(time.time() - start, False)
+        return response
@@ -0,0 +1,201 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import gzip
+import json
+import threading
+import time
+
+from eth_utils import force_obj_to_text, force_text
+from web3.providers.base import BaseProvider
+
+from keeper.api.asynchronous import request_async
+from keeper.api.batch import make_batch_request
+from keeper.api.provider import ProviderWrapper
+
+
+def _open(filename: str, mode: str):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't', encoding='utf-8')
+    else:
+        return open(filename, mode, encoding='utf-8')
+
+
+def _key(method: str, params: list) -> str:
+    return method + json.dumps(force_obj_to_text(params), sort_keys=True)
+
+
+class RecordingProvider(ProviderWrapper):
+    """Provider recording all requests sent through it, together with responses, to a file.
+
+    Each request is recorded as one line of JSON containing the method (`m`), parameters (`p`),
+    the response (`r`), the time it took to get it in seconds (`t`) and the number of the block
+    being processed when it was sent (`b`), as last passed to `new_block()`. If `filename` ends
+    with `.gz`, the file gets compressed.
+
+    Requests which failed without a response (i.e. timeouts or connection errors) do not get
+    recorded. The recording can be replayed with `ReplayProvider`.
+
+    Args:
+        provider: The `web3.py` provider to be wrapped.
+        filename: Name of the file the requests should be recorded to.
+    """
+    def __init__(self, provider, filename: str):
+        assert(isinstance(filename, str))
+
+        super().__init__(provider)
+        self.filename = filename
+        self.block_number = None
+        self._file = _open(filename, 'w')
+        self._lock = threading.Lock()
+
+    def new_block(self, block_number: int):
+        """Mark all requests recorded from now on as sent while processing block `block_number`."""
+        assert(isinstance(block_number, int))
+        self.block_number = block_number
+
+    def _record(self, method: str, params: list, response: dict, duration: float):
+        line = json.dumps(force_obj_to_text({'m': method, 'p': params, 'r': response, 't': round(duration, 6),
+                                             'b': self.block_number}),
+                          separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def make_request(self, method, params):
+        start = time.time()
+        response = self.provider.make_request(method, params)
+        self._record(method, params, response if isinstance(response, dict) else json.loads(force_text(response)),
+                     time.time() - start)
+        return response
+
+    def make_batch_request(self, requests: list) -> list:
+        start = time.time()
+        responses = make_batch_request(self.provider, requests)
+        for (method, params), response in zip(requests, responses):
+            self._record(method, params, response, (time.time() - start) / len(requests))
+        return responses
+
+    async def make_request_async(self, method, params) -> dict:
+        start = time.time()
+        response = await request_async(self.provider, method, params)
+        self._record(method, params, response, time.time() - start)
+        return response
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ReplayProvider(BaseProvider):
+    """Provider serving responses recorded earlier by `RecordingProvider`, without any node.
+
+    Responses are matched to requests by the block being replayed, as last passed to `new_block()`,
+    and by method and parameters. This way the keeper gets the state of the same block it got
+    when recording, even if it now sends a different number of identical requests. If the same
+    request has been recorded more than once for a block, the recorded responses are served in
+    the original order, with the last one being repeated once all of them have been served.
+    If it has not been recorded for the block being replayed, the response recorded for
+    the closest earlier block gets served. Requests which have not been recorded at all
+    fail with `KeyError`.
+
+    Filter polls (`eth_getFilterChanges`) are the exception, as they drive the sequence of
+    blocks being replayed. They are served in the recorded order regardless of the block,
+    and once all of them have been served they return no changes.
+
+    Args:
+        filename: Name of the file with the recorded requests.
+        latency: Either `'zero'` to serve the responses immediately, or `'recorded'`
+            to wait as long as the original requests took.
+    """
+
+    # responses recorded before the first block are served for this block number
+    NO_BLOCK = -1
+
+    def __init__(self, filename: str, latency: str = 'zero'):
+        assert(isinstance(filename, str))
+        assert(latency in ['zero', 'recorded'])
+
+        self.endpoint_uri = f"replay:{filename}"
+        self.latency = latency
+        self.requests = 0
+        self.block_number = self.NO_BLOCK
+        self._responses = {}
+        self._blocks = {}
+        self._filter_changes = {}
+        self._lock = threading.Lock()
+
+        with _open(filename, 'r') as file:
+            for line in file:
+                record = json.loads(line)
+                key = _key(record['m'], record['p'])
+                if record['m'] == 'eth_getFilterChanges':
+                    self._filter_changes.setdefault(key, []).append((record['r'], record['t']))
+                else:
+                    block_number = record.get('b') if record.get('b') is not None else self.NO_BLOCK
+                    if (block_number, key) not in self._responses:
+                        self._responses[(block_number, key)] = []
+                        bisect.insort(self._blocks.setdefault(key, []), block_number)
+                    self._responses[(block_number, key)].append((record['r'], record['t']))
+
+    def new_block(self, block_number: int):
+        """Serve the responses recorded while processing block `block_number` from now on."""
+        assert(isinstance(block_number, int))
+        with self._lock:
+            self.block_number = block_number
+
+    def _response(self, method: str, params: list) -> dict:
+        with self._lock:
+            self.requests += 1
+            key = _key(method, params)
+            if method == 'eth_getFilterChanges' and key in self._filter_changes:
+                response, duration = self._filter_poll(self._filter_changes[key])
+            else:
+                blocks = self._blocks.get(key, [])
+                index = bisect.bisect_right(blocks, self.block_number)
+                if index == 0:
+                    raise KeyError(f"Request {method}{params} has not been recorded")
+
+                responses = self._responses[(blocks[index - 1], key)]
+                response, duration = responses.pop(0) if len(responses) > 1 else responses[0]
+
+        if self.latency == 'recorded':
+            time.sleep(duration)
+
+        return response
+
+    @staticmethod
+    def _filter_poll(responses: list) -> tuple:
+        if len(responses) > 1:
+            return responses.pop(0)
+
+        # the last poll keeps its envelope, but the changes it returned must not be delivered again
+        response, duration = responses[0]
+        no_changes = {field: value for field, value in response.items() if field != 'error'}
+        no_changes['result'] = []
+        responses[0] = (no_changes, 0)
+        return response, duration
+
+    def make_request(self, method, params):
+        return self._response(method, params)
+
+    def make_batch_request(self, requests: list) -> list:
+        return [self._response(method, params) for method, params in requests]
+
+    def isConnected(self):
+        return True
@@ -16,6 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from keeper.api import Address, Wad, Contract, Calldata, Transact
+from keeper.api.cache import cached
 from keeper.api.numeric import Ray
 from keeper.api.util import int_to_bytes32
 from web3 import Web3
@@ -106,6 +107,7 @@ class Tub(Contract):
         approval_function(ERC20Token(web3=self.web3, address=self.skr()), self.pit(), 'Tub.pit')
         approval_function(ERC20Token(web3=self.web3, address=self.sai()), self.pit(), 'Tub.pit')
 
+    @cached
     def era(self) -> int:
         """Return the current SAI contracts timestamp.
 
@@ -128,6 +130,7 @@ class Tub(Contract):
         """
         return Transact(self, self.web3, self.abiTip, self.tip(), self._contractTip, 'warp', [seconds])
 
+    @cached
     def sai(self) -> Address:
         """Get the SAI token.
 
@@ -136,6 +139,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().sai())
 
+    @cached
     def sin(self) -> Address:
         """Get the SIN token.
 
@@ -144,6 +148,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().sin())
 
+    @cached
     def jug(self) -> Address:
         """Get the SAI/SIN tracker.
 
@@ -152,6 +157,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().jug())
 
+    @cached
     def jar(self) -> Address:
         """Get the collateral vault.
 
@@ -160,6 +166,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().jar())
 
+    @cached
     def pit(self) -> Address:
         """Get the liquidator vault.
 
@@ -168,6 +175,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().pit())
 
+    @cached
     def pot(self) -> Address:
         """Get the good debt vault.
 
@@ -176,6 +184,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().pot())
 
+    @cached
     def skr(self) -> Address:
         """Get the SKR token.
 
@@ -184,6 +193,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().skr())
 
+    @cached
     def gem(self) -> Address:
         """Get the collateral token (eg. W-ETH).
 
@@ -192,6 +202,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().gem())
 
+    @cached
     def pip(self) -> Address:
         """Get the GEM price feed.
 
@@ -200,6 +211,7 @@ class Tub(Contract):
         """
         return Address(self._contractJar.call().pip())
 
+    @cached
     def tip(self) -> Address:
         """Get the target price engine.
 
@@ -208,6 +220,7 @@ class Tub(Contract):
         """
         return Address(self._contractTub.call().tip())
 
+    @cached
     def axe(self) -> Ray:
         """Get the liquidation penalty.
 
@@ -216,6 +229,7 @@ class Tub(Contract):
         """
         return Ray(self._contractTub.call().axe())
 
+    @cached
     def hat(self) -> Wad:
         """Get the debt ceiling.
 
@@ -224,6 +238,7 @@ class Tub(Contract):
         """
         return Wad(self._contractTub.call().hat())
 
+    @cached
     def mat(self) -> Ray:
         """Get the liquidation ratio.
 
@@ -232,6 +247,7 @@ class Tub(Contract):
         """
         return Ray(self._contractTub.call().mat())
 
+    @cached
     def tax(self) -> Ray:
         """Get the stability fee.
 
@@ -240,6 +256,7 @@ class Tub(Contract):
         """
         return Ray(self._contractTub.call().tax())
 
+    @cached
     def way(self) -> Ray:
         """Get the holder fee (interest rate).
 
@@ -248,6 +265,7 @@ class Tub(Contract):
         """
         return Ray(self._contractTip.call().way())
 
+    @cached
     def reg(self) -> int:
         """Get the Tub stage ('register').
 
@@ -256,6 +274,7 @@ class Tub(Contract):
         """
         return self._contractTub.call().reg()
 
+    @cached
     def fit(self) -> Ray:
         """Get the GEM per SKR settlement price.
 
@@ -264,6 +283,7 @@ class Tub(Contract):
         """
         return Ray(self._contractTub.call().fit())
 
+    @cached
     def rho(self) -> int:
         """Get the time of the last drip.
 
@@ -272,6 +292,7 @@ class Tub(Contract):
         """
         return self._contractTub.call().rho()
 
+    @cached
     def tau(self) -> int:
         """Get the time of the last prod.
 
@@ -280,6 +301,7 @@ class Tub(Contract):
         """
         return self._contractTip.call().tau()
 
+    @cached
     def chi(self) -> Ray:
         """Get the internal debt price.
 
@@ -368,6 +390,7 @@ class Tub(Contract):
         """
         return Transact(self, self.web3, self.abiTip, self.tip(), self._contractTip, 'prod', [])
 
+    @cached
     def ice(self) -> Wad:
         """Get the amount of good debt.
 
@@ -376,6 +399,7 @@ class Tub(Contract):
         """
         return Wad(self._contractTub.call().ice())
 
+    @cached
     def pie(self) -> Wad:
         """Get the amount of raw collateral.
 
@@ -384,6 +408,7 @@ class Tub(Contract):
         """
         return Wad(self._contractTub.call().pie())
 
+    @cached
     def air(self) -> Wad:
         """Get the amount of backing collateral.
 
@@ -392,6 +417,7 @@ class Tub(Contract):
         """
         return Wad(self._contractTub.call().air())
 
+    @cached
     def tag(self) -> Wad:
         """Get the reference price (REF per SKR).
 
@@ -403,6 +429,7 @@ class Tub(Contract):
         """
         return Wad(self._contractJar.call().tag())
 
+    @cached
     def par(self) -> Wad:
         """Get the accrued holder fee (REF per SAI).
 
@@ -415,6 +442,7 @@ class Tub(Contract):
         """
         return Wad(self._contractTip.call().par())
 
+    @cached
     def per(self) -> Ray:
         """Get the current average entry/exit price (GEM per SKR).
 
@@ -427,6 +455,7 @@ class Tub(Contract):
         return Ray(self._contractJar.call().per())
 
     # TODO these prefixed methods are ugly, the ultimate solution would be to have a class per smart contract
+    @cached
     def jar_gap(self) -> Wad:
         """Get the current spread for `join` and `exit`.
 
@@ -449,6 +478,7 @@ class Tub(Contract):
         return Transact(self, self.web3, self.abiJar, self.jar(), self._contractJar, 'jump', [new_gap.value])
 
     # TODO these prefixed methods are ugly, the ultimate solution would be to have a class per smart contract
+    @cached
     def jar_bid(self) -> Ray:
         """Get the current `exit()` price (GEM per SKR).
 
@@ -458,6 +488,7 @@ class Tub(Contract):
         return Ray(self._contractJar.call().bid())
 
     # TODO these prefixed methods are ugly, the ultimate solution would be to have a class per smart contract
+    @cached
     def jar_ask(self) -> Ray:
         """Get the current `join()` price (GEM per SKR).
 
@@ -466,6 +497,7 @@ class Tub(Contract):
         """
         return Ray(self._contractJar.call().ask())
 
+    @cached
     def cupi(self) -> int:
         """Get the last cup id
 
@@ -474,6 +506,7 @@ class Tub(Contract):
         """
         return self._contractTub.call().cupi()
 
+    @cached
     def cups(self, cup_id: int) -> Cup:
         """Get the cup details.
 
@@ -487,6 +520,7 @@ class Tub(Contract):
         array = self._contractTub.call().cups(int_to_bytes32(cup_id))
         return Cup(cup_id, Address(array[0]), Wad(array[1]), Wad(array[2]))
 
+    @cached
     def tab(self, cup_id: int) -> Wad:
         """Get the amount of debt in a cup.
 
@@ -499,6 +533,7 @@ class Tub(Contract):
         assert isinstance(cup_id, int)
         return Wad(self._contractTub.call().tab(int_to_bytes32(cup_id)))
 
+    @cached
     def ink(self, cup_id: int) -> Wad:
         """Get the amount of SKR collateral locked in a cup.
 
@@ -511,6 +546,7 @@ class Tub(Contract):
         assert isinstance(cup_id, int)
         return Wad(self._contractTub.call().ink(int_to_bytes32(cup_id)))
 
+    @cached
     def lad(self, cup_id: int) -> Address:
         """Get the owner of a cup.
 
@@ -523,6 +559,7 @@ class Tub(Contract):
         assert isinstance(cup_id, int)
         return Address(self._contractTub.call().lad(int_to_bytes32(cup_id)))
 
+    @cached
     def safe(self, cup_id: int) -> bool:
         """Determine if a cup is safe.
 
@@ -704,6 +741,7 @@ class Tap(Contract):
         assert(isinstance(address, Address))
         return Transact(self, self.web3, self.abi, self.address, self._contract, 'setAuthority', [address.address])
 
+    @cached
     def woe(self) -> Wad:
         """Get the amount of bad debt.
 
@@ -712,6 +750,7 @@ class Tap(Contract):
         """
         return Wad(self._contract.call().woe())
 
+    @cached
     def fog(self) -> Wad:
         """Get the amount of SKR pending liquidation.
 
@@ -721,6 +760,7 @@ class Tap(Contract):
         return Wad(self._contract.call().fog())
 
     #TODO beware that it doesn't call drip() underneath so if `tax`>1.0 we won't get an up-to-date value of joy()
+    @cached
     def joy(self) -> Wad:
         """Get the amount of surplus SAI.
 
@@ -731,6 +771,7 @@ class Tap(Contract):
         """
         return Wad(self._contract.call().joy())
 
+    @cached
     def gap(self) -> Wad:
         """Get the current spread for `boom` and `bust`.
 
@@ -751,6 +792,7 @@ class Tap(Contract):
         assert isinstance(new_gap, Wad)
         return Transact(self, self.web3, self.abi, self.address, self._contract, 'jump', [new_gap.value])
 
+    @cached
     def s2s(self) -> Wad:
         """Get the current SKR per SAI rate (for `boom` and `bust`).
 
@@ -759,6 +801,7 @@ class Tap(Contract):
         """
         return Wad(self._contract.call().s2s())
 
+    @cached
     def bid(self) -> Wad:
         """Get the current price of SKR in SAI for `boom`.
 
@@ -767,6 +810,7 @@ class Tap(Contract):
         """
         return Wad(self._contract.call().bid())
 
+    @cached
     def ask(self) -> Wad:
         """Get the current price of SKR in SAI for `bust`.
 
@@ -833,6 +877,7 @@ class Top(Contract):
         assert(isinstance(address, Address))
         return Transact(self, self.web3, self.abi, self.address, self._contract, 'setAuthority', [address.address])
 
+    @cached
     def fix(self) -> Ray:
         """Get the GEM per SAI settlement price.
 
@@ -883,6 +928,7 @@ class Lpc(Contract):
         approval_function(ERC20Token(web3=self.web3, address=self.ref()), self.address, 'Lpc')
         approval_function(ERC20Token(web3=self.web3, address=self.alt()), self.address, 'Lpc')
 
+    @cached
     def ref(self) -> Address:
         """Get the ref token.
 
@@ -891,6 +937,7 @@ class Lpc(Contract):
         """
         return Address(self._contract.call().ref())
 
+    @cached
     def alt(self) -> Address:
         """Get the alt token.
 
@@ -899,6 +946,7 @@ class Lpc(Contract):
         """
         return Address(self._contract.call().alt())
 
+    @cached
     def pip(self) -> Address:
         """Get the price feed (giving refs per alt).
 
@@ -909,6 +957,7 @@ class Lpc(Contract):
         """
         return Address(self._contract.call().pip())
 
+    @cached
     def tip(self) -> Address:
         """Get the target price engine.
 
@@ -917,6 +966,7 @@ class Lpc(Contract):
         """
         return Address(self._contract.call().tip())
 
+    @cached
     def gap(self) -> Wad:
         """Get the spread, charged on `take()`.
 
@@ -925,6 +975,7 @@ class Lpc(Contract):
         """
         return Wad(self._contract.call().gap())
 
+    @cached
     def lps(self) -> Address:
         """Get the LPS token (liquidity provider shares).
 
@@ -945,6 +996,7 @@ class Lpc(Contract):
         assert isinstance(new_gap, Wad)
         return Transact(self, self.web3, self.abi, self.address, self._contract, 'jump', [new_gap.value])
 
+    @cached
     def tag(self) -> Wad:
         """Get the current price (refs per alt).
 
@@ -955,6 +1007,7 @@ class Lpc(Contract):
         """
         return Wad(self._contract.call().tag())
 
+    @cached
     def pie(self) -> Wad:
         """Get the total pool value (in ref).
 
@@ -963,6 +1016,7 @@ class Lpc(Contract):
         """
         return Wad(self._contract.call().pie())
 
+    @cached
     def par(self) -> Wad:
         """Get the accrued holder fee.
 
@@ -975,6 +1029,7 @@ class Lpc(Contract):
         """
         return Wad(self._contractTip.call().par())
 
+    @cached
     def per(self) -> Ray:
         """Get the lps per ref ratio.
 
@@ -0,0 +1,114 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import codecs
+import json
+import logging
+import socket
+import threading
+
+
+class NewHeadsSubscription(threading.Thread):
+    """Receives new block headers pushed by the node over a persistent IPC connection.
+
+    Uses `eth_subscribe('newHeads')`, so unlike the `web3.eth.filter('latest')` filter it
+    does not poll the node and every new block header is delivered to the callback as soon
+    as the node sends it, without any additional JSON-RPC calls.
+
+    The subscription is a thread which can be registered with `register_filter_thread()`.
+    Similar to `web3.py` filters, if the connection to the node gets lost the thread
+    terminates, which makes `all_filter_threads_alive()` return `False`.
+
+    Args:
+        ipc_path: Path of the node IPC socket, for example `~/.ethereum/geth.ipc`.
+        callback: Function to be called with each new block header (a `dict`
+            with the JSON-RPC representation of the header).
+    """
+    logger = logging.getLogger('api')
+
+    def __init__(self, ipc_path: str, callback):
+        assert(isinstance(ipc_path, str))
+        assert(callable(callback))
+
+        super().__init__(target=self._run)
+        self.daemon = True
+        self.ipc_path = ipc_path
+        self.callback = callback
+        self.running = False
+        self.subscription_id = None
+        self._socket = None
+        self._buffer = ''
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+
+    def watch(self):
+        """Connects to the node, subscribes to new block headers and starts the thread."""
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(self.ipc_path)
+        self._send({"jsonrpc": "2.0", "method": "eth_subscribe", "params": ["newHeads"], "id": 1})
+
+        response = self._receive()
+        if 'error' in response:
+            raise ValueError(response['error'])
+
+        self.subscription_id = response['result']
+        self.running = True
+        self.start()
+
+    def stop_watching(self, timeout=0):
+        """Closes the connection and waits (up to `timeout` seconds) for the thread to terminate."""
+        self.running = False
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.join(timeout)
+
+    def _send(self, request: dict):
+        self._socket.sendall(json.dumps(request).encode('utf-8'))
+
+    def _receive(self) -> dict:
+        # node IPC endpoints do not delimit JSON messages in any way,
+        # so we have to find out where each message ends by decoding them
+        while True:
+            stripped = self._buffer.lstrip()
+            if stripped:
+                try:
+                    message, end = self._decoder.raw_decode(stripped)
+                    self._buffer = stripped[end:]
+                    return message
+                except ValueError:
+                    pass
+
+            data = self._socket.recv(65536)
+            if not data:
+                raise ConnectionError("Connection to the node has been closed")
+            # a multibyte character can be split across reads, so the decoder keeps its incomplete tail
+            self._buffer += self._utf8.decode(data)
+
+    def _run(self):
+        try:
+            while self.running:
+                message = self._receive()
+                if message.get('method') == 'eth_subscription' \
+                        and message['params']['subscription'] == self.subscription_id:
+                    self.callback(message['params']['result'])
+        except Exception as e:
+            if self.running:
+                self.logger.warning(f"New block headers subscription terminated: {e}")
+        finally:
+            self._socket.close()
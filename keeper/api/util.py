@@ -52,12 +52,23 @@ def are_any_transactions_pending(web3: Web3, address) -> bool:
     return pending_transaction > latest_transaction
 
 
+def is_tester(web3: Web3) -> bool:
+    """Checks whether `web3` is connected to `EthereumTesterProvider`, even if it is wrapped."""
+    from keeper.api.provider import ProviderWrapper
+    assert(isinstance(web3, Web3))
+    provider = web3.currentProvider
+    if isinstance(provider, ProviderWrapper):
+        provider = provider.unwrap()
+    return isinstance(provider, EthereumTesterProvider)
+
+
 def next_nonce(web3: Web3, address) -> Optional[int]:
     with _next_nonce_lock:
-        if isinstance(web3.currentProvider, EthereumTesterProvider):
+        if is_tester(web3):
             provider_id = 'unittest'
         else:
-            provider_id = web3.currentProvider.endpoint_uri
+            # not all providers have an `endpoint_uri`, for example `IPCProvider` does not
+            provider_id = getattr(web3.currentProvider, 'endpoint_uri', None) or id(web3.currentProvider)
 
         try:
             next_value = _next_nonce_values[provider_id]+1
@@ -135,7 +146,8 @@ class AsyncCallback:
 
         Arguments:
             on_start: Optional method to be called before the actual callback. Can be `None`.
-            on_finish: Optional method to be called after the actual callback. Can be `None`.
+            on_finish: Optional method to be called after the actual callback, even if it raised
+                an exception. Can be `None`.
 
         Returns:
             `True` if callback has been invoked. `False` otherwise.
@@ -144,9 +156,11 @@ class AsyncCallback:
             def thread_target():
                 if on_start is not None:
                     on_start()
-                self.callback()
-                if on_finish is not None:
-                    on_finish()
+                try:
+                    self.callback()
+                finally:
+                    if on_finish is not None:
+                        on_finish()
 
             self.thread = threading.Thread(target=thread_target)
             self.thread.start()
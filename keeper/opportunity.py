@@ -31,7 +31,9 @@ from keeper.conversion import Conversion
 class Sequence:
     def __init__(self, conversions: List[Conversion]):
         assert(isinstance(conversions, list))
-        self.steps = copy.deepcopy(conversions)
+        # only the amounts of each step get changed, while the contracts they refer to (with their
+        # providers, locks and order book threads) can not and should not be copied
+        self.steps = [copy.copy(conversion) for conversion in conversions]
         self._validate_token_chain()
 
     def total_rate(self) -> Ray:
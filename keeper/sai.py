@@ -15,7 +15,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from keeper import Keeper
+from web3 import Web3
+
+from keeper import Keeper, Config
 from keeper.api import Address
 from keeper.api.oasis import MatchingMarket
 from keeper.api.sai import Tub, Top, Tap
@@ -23,8 +25,8 @@ from keeper.api.token import ERC20Token, DSEthToken
 
 
 class SaiKeeper(Keeper):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, args: list = None, web3: Web3 = None, config: Config = None):
+        super().__init__(args, web3=web3, config=config)
         self.tub = Tub(web3=self.web3, address=Address(self.config.get_contract_address("saiTub")))
         self.tap = Tap(web3=self.web3, address=Address(self.config.get_contract_address("saiTap")))
         self.top = Top(web3=self.web3, address=Address(self.config.get_contract_address("saiTop")))
@@ -18,6 +18,9 @@
 import argparse
 from typing import List
 
+from web3 import Web3
+
+from keeper import Config
 from keeper.api import Address, Transfer
 from keeper.api.approval import via_tx_manager, directly
 from keeper.api.numeric import Ray
@@ -63,14 +66,17 @@ class SaiArbitrage(SaiKeeper):
     profitability.
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, args: list = None, web3: Web3 = None, config: Config = None):
+        super().__init__(args, web3=web3, config=config)
         self.base_token = ERC20Token(web3=self.web3,
                                      address=ERC20Token.token_address_by_name(self.arguments.base_token))
         self.min_profit = Wad.from_number(self.arguments.min_profit)
         self.max_engagement = Wad.from_number(self.arguments.max_engagement)
         self.max_errors = self.arguments.max_errors
         self.errors = 0
+        self.otc_depth = self.arguments.otc_depth
+        self.otc.offer_book(snapshot_file=self.arguments.otc_snapshot,
+                            tokens=[self.sai.address, self.skr.address, self.gem.address])
 
         if self.arguments.tx_manager:
             self.tx_manager_address = Address(self.arguments.tx_manager)
@@ -98,6 +104,12 @@ class SaiArbitrage(SaiKeeper):
         parser.add_argument("--tx-manager", type=str,
                             help="Address of the TxManager to use for multi-step arbitrage")
 
+        parser.add_argument("--otc-snapshot", type=str,
+                            help="File to keep the OasisDEX order book snapshot in, for faster restarts")
+
+        parser.add_argument("--otc-depth", type=int,
+                            help="Number of best OasisDEX offers of each pair to consider (default: all offers)")
+
     def startup(self):
         self.approve()
         self.on_block(self.process_block)
@@ -124,9 +136,15 @@ class SaiArbitrage(SaiKeeper):
                 TubBustConversion(self.tub, self.tap)]
 
     def otc_offers(self, tokens):
-        return [offer for offer in self.otc.active_offers()
-                if offer.sell_which_token in tokens
-                and offer.buy_which_token in tokens]
+        if self.otc_depth is not None:
+            pairs = [(pay_token, buy_token) for pay_token in tokens for buy_token in tokens if pay_token != buy_token]
+            return [offer for offers in self.otc.order_books(pairs, self.otc_depth) for offer in offers]
+        else:
+            # offers of the same price only differ by their volume, so the largest one of each price
+            # level is the only one `OpportunityFinder` needs to see to find the best opportunity
+            offer_book = self.otc.offer_book()
+            pairs = [(pay_token, buy_token) for pay_token in tokens for buy_token in tokens if pay_token != buy_token]
+            return [offer for pay_token, buy_token in pairs for offer in offer_book.level_offers(pay_token, buy_token)]
 
     def otc_conversions(self, tokens) -> List[Conversion]:
         return list(map(lambda offer: OasisTakeConversion(self.otc, offer), self.otc_offers(tokens)))
@@ -20,6 +20,9 @@ import operator
 from functools import reduce
 from typing import List
 
+from web3 import Web3
+
+from keeper import Config
 from keeper.api import Address
 from keeper.api.approval import directly
 from keeper.api.feed import DSValue
@@ -37,8 +40,8 @@ class SaiMakerEtherDelta(SaiKeeper):
     was a bit unpredictable in terms of placing orders at the time this keeper
     was developed, we abandoned it and decided to stick to SaiMakerOtc for now.
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, args: list = None, web3: Web3 = None, config: Config = None):
+        super().__init__(args, web3=web3, config=config)
         self.offchain = self.arguments.offchain
         self.order_age = self.arguments.order_age
         self.max_eth_amount = Wad.from_number(self.arguments.max_eth_amount)
@@ -56,7 +59,8 @@ class SaiMakerEtherDelta(SaiKeeper):
             else None
         self.etherdelta = EtherDelta(web3=self.web3,
                                      address=self.etherdelta_address,
-                                     api_server=self.etherdelta_api_server)
+                                     api_server=self.etherdelta_api_server,
+                                     checkpoint_file=self.arguments.etherdelta_checkpoint)
 
         if self.offchain and not self.etherdelta.supports_offchain_orders():
             raise Exception("Off-chain EtherDelta orders not supported on this chain")
@@ -71,6 +75,8 @@ class SaiMakerEtherDelta(SaiKeeper):
         parser.add_argument("--min-eth-amount", help="Minimum value of open ETH sell orders", type=float, required=True)
         parser.add_argument("--max-sai-amount", help="Maximum value of open SAI sell orders", type=float, required=True)
         parser.add_argument("--min-sai-amount", help="Minimum value of open SAI sell orders", type=float, required=True)
+        parser.add_argument("--etherdelta-checkpoint", help="File to keep the progress of discovering EtherDelta orders in, for faster restarts", type=str)
+        parser.add_argument("--etherdelta-stream", help="Receive off-chain orders over a streaming API connection instead of polling", dest='etherdelta_stream', action='store_true')
 
         onchain_offchain_parser = parser.add_mutually_exclusive_group(required=False)
         onchain_offchain_parser.add_argument('--onchain', dest='offchain', action='store_false')
@@ -79,12 +85,15 @@ class SaiMakerEtherDelta(SaiKeeper):
 
     def startup(self):
         self.approve()
+        if self.offchain and self.arguments.etherdelta_stream:
+            self.etherdelta.stream_offchain_orders(self.sai.address, EtherDelta.ETH_TOKEN)
         self.on_block(self.synchronize_orders)
         self.every(60*60, self.print_balances)
 
     def shutdown(self):
         self.cancel_all_orders()
         self.withdraw_everything()
+        self.etherdelta.close()
 
     def print_balances(self):
         sai_owned = self.sai.balance_of(self.our_address)
@@ -224,8 +233,8 @@ class SaiMakerEtherDelta(SaiKeeper):
         return order.amount_get / order.amount_give
 
     def total_amount(self, orders: List[Order]):
-        give_available = lambda order: order.amount_give - (self.etherdelta.amount_filled(order) * order.amount_give / order.amount_get)
-        return reduce(operator.add, map(give_available, orders), Wad(0))
+        give_available = lambda order, amount_filled: order.amount_give - (amount_filled * order.amount_give / order.amount_get)
+        return reduce(operator.add, map(give_available, orders, self.etherdelta.amounts_filled(orders)), Wad(0))
 
     @staticmethod
     def apply_buy_margin(rate: Wad, margin: float) -> Wad:
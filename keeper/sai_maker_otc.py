@@ -22,9 +22,14 @@ from functools import reduce
 from itertools import chain
 from typing import List
 
-from keeper.api.approval import directly
+from web3 import Web3
+
+from keeper import Config
+from keeper.api import Address
+from keeper.api.approval import directly, via_tx_manager
 from keeper.api.numeric import Wad
-from keeper.api.oasis import OfferInfo
+from keeper.api.oasis import OfferInfo, OfferColumns, MatchingMarket
+from keeper.api.transact import TxManager
 from keeper.api.util import synchronize
 
 from keeper.api.feed import DSValue
@@ -50,9 +55,14 @@ class SaiMakerOtc(SaiKeeper):
 
     This keeper will constantly use gas to move orders as the SAI/GEM price changes,
     but it can be limited by setting the margin and amount ranges wide enough.
+
+    If a `TxManager` address is passed as the `--tx-manager` argument, all orders cancelled
+    and created during one synchronization are sent in a single transaction, so the orders
+    get replaced atomically, in one block. The orders are owned by the `TxManager` then,
+    which has to be owned by the address the keeper is operating from.
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, args: list = None, web3: Web3 = None, config: Config = None):
+        super().__init__(args, web3=web3, config=config)
         self.max_weth_amount = Wad.from_number(self.arguments.max_weth_amount)
         self.min_weth_amount = Wad.from_number(self.arguments.min_weth_amount)
         self.max_sai_amount = Wad.from_number(self.arguments.max_sai_amount)
@@ -66,6 +76,15 @@ class SaiMakerOtc(SaiKeeper):
         self.avg_margin_sell = self.arguments.avg_margin_sell
         self.max_margin_sell = self.arguments.max_margin_sell
         self.round_places = self.arguments.round_places
+        self.otc.offer_book(snapshot_file=self.arguments.otc_snapshot, tokens=[self.sai.address, self.gem.address])
+
+        if self.arguments.tx_manager:
+            self.tx_manager = TxManager(web3=self.web3, address=Address(self.arguments.tx_manager))
+            if self.tx_manager.owner() != self.our_address:
+                self.logger.info("The TxManager has to be owned by the address the keeper is operating from.")
+                exit(-1)
+        else:
+            self.tx_manager = None
 
     def args(self, parser: argparse.ArgumentParser):
         parser.add_argument("--min-margin-buy", help="Minimum margin allowed (buy)", type=float, required=True)
@@ -81,6 +100,8 @@ class SaiMakerOtc(SaiKeeper):
         parser.add_argument("--sai-dust-cutoff", help="Minimum order value (SAI) for buy orders", type=int, default=0)
         parser.add_argument("--weth-dust-cutoff", help="Minimum order value (WETH) for sell orders", type=int, default=0)
         parser.add_argument("--round-places", help="Number of decimal places to round order prices to (default=2)", type=int, default=2)
+        parser.add_argument("--otc-snapshot", help="File to keep the OasisDEX order book snapshot in, for faster restarts", type=str)
+        parser.add_argument("--tx-manager", help="Address of the TxManager to use for replacing orders in one transaction", type=str)
 
     def startup(self):
         self.approve()
@@ -88,7 +109,7 @@ class SaiMakerOtc(SaiKeeper):
         self.every(60*60, self.print_balances)
 
     def shutdown(self):
-        self.cancel_offers(self.our_offers(self.otc.active_offers()))
+        self.cancel_offers(self.our_offers(self.otc.offer_book().columns()))
 
     def print_balances(self):
         def balances():
@@ -98,28 +119,67 @@ class SaiMakerOtc(SaiKeeper):
 
     def approve(self):
         """Approve OasisDEX to access our balances, so we can place orders."""
-        self.otc.approve([self.gem, self.sai], directly())
+        self.otc.approve([self.gem, self.sai], via_tx_manager(self.tx_manager) if self.tx_manager else directly())
+        if self.tx_manager:
+            self.tx_manager.approve([self.gem, self.sai], directly())
+
+    def offer_owner(self) -> Address:
+        """Address our offers are owned by, which is the `TxManager` if we place them through it."""
+        return self.tx_manager.address if self.tx_manager else self.our_address
+
+    def our_offers(self, active_offers: OfferColumns):
+        return active_offers.select(owner=self.offer_owner())
 
-    def our_offers(self, active_offers: list):
-        return list(filter(lambda offer: offer.owner == self.our_address, active_offers))
+    def our_sell_offers(self, active_offers: OfferColumns):
+        return active_offers.select(owner=self.offer_owner(), sell_token=self.gem.address, buy_token=self.sai.address)
 
-    def our_sell_offers(self, active_offers: list):
-        return list(filter(lambda offer: offer.buy_which_token == self.sai.address and
-                                         offer.sell_which_token == self.gem.address, self.our_offers(active_offers)))
+    def our_buy_offers(self, active_offers: OfferColumns):
+        return active_offers.select(owner=self.offer_owner(), sell_token=self.sai.address, buy_token=self.gem.address)
 
-    def our_buy_offers(self, active_offers: list):
-        return list(filter(lambda offer: offer.buy_which_token == self.gem.address and
-                                         offer.sell_which_token == self.sai.address, self.our_offers(active_offers)))
+    def our_sell_engagement(self) -> Wad:
+        return self.otc.offer_book().depth(self.gem.address, self.sai.address, owner=self.offer_owner()).volume()
+
+    def our_buy_engagement(self) -> Wad:
+        return self.otc.offer_book().depth(self.sai.address, self.gem.address, owner=self.offer_owner()).volume()
 
     def synchronize_offers(self):
         """Update our positions in the order book to reflect keeper parameters."""
-        active_offers = self.otc.active_offers()
+        active_offers = self.otc.offer_book().columns()
         target_price = self.tub_target_price()
-        self.cancel_offers(chain(self.excessive_buy_offers(active_offers, target_price),
-                                 self.excessive_sell_offers(active_offers, target_price)))
-        self.create_new_offers(active_offers, target_price)
-
-    def excessive_buy_offers(self, active_offers: list, target_price: Wad):
+        if self.tx_manager:
+            self.replace_offers(active_offers, target_price)
+        else:
+            self.cancel_offers(chain(self.excessive_buy_offers(active_offers, target_price),
+                                     self.excessive_sell_offers(active_offers, target_price)))
+            self.create_new_offers(active_offers, target_price)
+
+    def replace_offers(self, active_offers: OfferColumns, target_price: Wad):
+        """Cancel offers with rates outside allowed margin range and create new ones in one transaction.
+
+        Offers are cancelled and created by the `TxManager`, so the tokens released by the cancelled
+        offers can be used by the new ones straight away.
+        """
+        cancelled_buy_offers = list(self.excessive_buy_offers(active_offers, target_price))
+        cancelled_sell_offers = list(self.excessive_sell_offers(active_offers, target_price))
+        cancelled_offers = cancelled_buy_offers + cancelled_sell_offers
+
+        transacts = chain((self.otc.kill(offer.offer_id) for offer in cancelled_offers),
+                          self.new_buy_offer(active_offers, target_price, cancelled_offers=cancelled_buy_offers),
+                          self.new_sell_offer(active_offers, target_price, cancelled_offers=cancelled_sell_offers))
+        self.execute_via_tx_manager(list(transacts))
+
+    def execute_via_tx_manager(self, transacts: list):
+        """Execute the contract calls of `transacts` in one transaction, using the `tx_manager`.
+
+        The gas estimate comes from running the whole `TxManager` call, cancels included, so it
+        already covers the gas they use before their storage refunds get applied. The default
+        buffer only has to cover the order book changing before the transaction gets mined."""
+        invocations = [transact.invocation() for transact in transacts]
+        if len(invocations) > 0:
+            self.tx_manager.execute([self.gem.address, self.sai.address], invocations) \
+                .transact(gas_price=self.gas_price)
+
+    def excessive_buy_offers(self, active_offers: OfferColumns, target_price: Wad):
         """Return buy offers with rates outside allowed margin range."""
         for offer in self.our_buy_offers(active_offers):
             rate = self.rate_buy(offer)
@@ -128,7 +188,7 @@ class SaiMakerOtc(SaiKeeper):
             if (rate < rate_max) or (rate > rate_min):
                 yield offer
 
-    def excessive_sell_offers(self, active_offers: list, target_price: Wad):
+    def excessive_sell_offers(self, active_offers: OfferColumns, target_price: Wad):
         """Return sell offers with rates outside allowed margin range."""
         for offer in self.our_sell_offers(active_offers):
             rate = self.rate_sell(offer)
@@ -138,38 +198,65 @@ class SaiMakerOtc(SaiKeeper):
                 yield offer
 
     def cancel_offers(self, offers):
-        """Cancel offers asynchronously."""
-        synchronize([self.otc.kill(offer.offer_id).transact_async(gas_price=self.gas_price) for offer in offers])
-
-    def create_new_offers(self, active_offers: list, target_price: Wad):
+        """Cancel offers asynchronously, or in one transaction if we place them through the `tx_manager`."""
+        if self.tx_manager:
+            offers = list(offers)
+            self.execute_via_tx_manager([self.otc.kill(offer.offer_id) for offer in offers])
+        else:
+            synchronize([self.otc.kill(offer.offer_id).transact_async(gas_price=self.gas_price) for offer in offers])
+
+    def create_new_offers(self, active_offers: OfferColumns, target_price: Wad):
         """Asynchronously create new buy and sell offers if necessary."""
         synchronize([transact.transact_async(gas_price=self.gas_price)
                      for transact in chain(self.new_buy_offer(active_offers, target_price),
                                            self.new_sell_offer(active_offers, target_price))])
 
-    def new_sell_offer(self, active_offers: list, target_price: Wad):
-        """If our WETH engagement is below the minimum amount, yield a new offer up to the maximum amount."""
-        total_amount = self.total_amount(self.our_sell_offers(active_offers))
+    def new_sell_offer(self, active_offers: OfferColumns, target_price: Wad, cancelled_offers: List[OfferInfo] = ()):
+        """If our WETH engagement is below the minimum amount, yield a new offer up to the maximum amount.
+
+        `cancelled_offers` are our sell offers which will be cancelled before the new offer gets created,
+        so they do not count towards our engagement and the WETH they hold will be returned to us first."""
+        released = self.total_amount(cancelled_offers)
+        total_amount = self.our_sell_engagement() - released
         if total_amount < self.min_weth_amount:
-            our_balance = self.gem.balance_of(self.our_address)
+            our_balance = self.gem.balance_of(self.our_address) + released
             have_amount = Wad.min(self.max_weth_amount - total_amount, our_balance)
             if (have_amount >= self.weth_dust_cutoff) and (have_amount > Wad(0)):
                 want_amount = have_amount * round(self.apply_sell_margin(target_price, self.avg_margin_sell), self.round_places)
                 if want_amount > Wad(0):
-                    yield self.otc.make(have_token=self.gem.address, have_amount=have_amount,
-                                        want_token=self.sai.address, want_amount=want_amount)
+                    yield self.make_offer(have_token=self.gem.address, have_amount=have_amount,
+                                          want_token=self.sai.address, want_amount=want_amount,
+                                          cancelled_offers=cancelled_offers)
+
+    def new_buy_offer(self, active_offers: OfferColumns, target_price: Wad, cancelled_offers: List[OfferInfo] = ()):
+        """If our SAI engagement is below the minimum amount, yield a new offer up to the maximum amount.
 
-    def new_buy_offer(self, active_offers: list, target_price: Wad):
-        """If our SAI engagement is below the minimum amount, yield a new offer up to the maximum amount."""
-        total_amount = self.total_amount(self.our_buy_offers(active_offers))
+        `cancelled_offers` are our buy offers which will be cancelled before the new offer gets created,
+        so they do not count towards our engagement and the SAI they hold will be returned to us first."""
+        released = self.total_amount(cancelled_offers)
+        total_amount = self.our_buy_engagement() - released
         if total_amount < self.min_sai_amount:
-            our_balance = self.sai.balance_of(self.our_address)
+            our_balance = self.sai.balance_of(self.our_address) + released
             have_amount = Wad.min(self.max_sai_amount - total_amount, our_balance)
             if (have_amount >= self.sai_dust_cutoff) and (have_amount > Wad(0)):
                 want_amount = have_amount / round(self.apply_buy_margin(target_price, self.avg_margin_buy), self.round_places)
                 if want_amount > Wad(0):
-                    yield self.otc.make(have_token=self.sai.address, have_amount=have_amount,
-                                        want_token=self.gem.address, want_amount=want_amount)
+                    yield self.make_offer(have_token=self.sai.address, have_amount=have_amount,
+                                          want_token=self.gem.address, want_amount=want_amount,
+                                          cancelled_offers=cancelled_offers)
+
+    def make_offer(self, have_token: Address, have_amount: Wad, want_token: Address, want_amount: Wad,
+                   cancelled_offers: List[OfferInfo]):
+        """Create a new offer, positioned as if `cancelled_offers` were already gone from the order book."""
+        if isinstance(self.otc, MatchingMarket):
+            pos = self.otc.position(have_token=have_token, have_amount=have_amount,
+                                    want_token=want_token, want_amount=want_amount,
+                                    excluding=[offer.offer_id for offer in cancelled_offers])
+            return self.otc.make(have_token=have_token, have_amount=have_amount,
+                                 want_token=want_token, want_amount=want_amount, pos=pos)
+        else:
+            return self.otc.make(have_token=have_token, have_amount=have_amount,
+                                 want_token=want_token, want_amount=want_amount)
 
     def tub_target_price(self) -> Wad:
         """SAI per GEM price that we are targeting."""
@@ -19,6 +19,9 @@ import argparse
 
 import logging
 
+from web3 import Web3
+
+from keeper import Config
 from keeper.api.approval import directly
 from keeper.api.numeric import Ray
 from keeper.api.numeric import Wad
@@ -34,8 +37,8 @@ class SaiTopUp(SaiKeeper):
 
     Cups owned by other accounts are ignored.
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, args: list = None, web3: Web3 = None, config: Config = None):
+        super().__init__(args, web3=web3, config=config)
         self.liquidation_ratio = self.tub.mat()
         self.minimum_ratio = self.liquidation_ratio + Ray.from_number(self.arguments.min_margin)
         self.target_ratio = self.liquidation_ratio + Ray.from_number(self.arguments.top_up_margin)
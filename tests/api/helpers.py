@@ -15,8 +15,14 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 from unittest.mock import Mock
 
+from eth_utils import force_obj_to_text
+
 
 def is_hashable(v):
     """Determine whether `v` can be hashed."""
@@ -31,3 +37,56 @@ def wait_until_mock_called(mock: Mock):
     while not mock.called:
         pass
     return mock.call_args[0]
+
+
+class JsonRpcServer:
+    """Local stand-in for an Ethereum node, answering JSON-RPC requests over HTTP.
+
+    Every request gets answered by calling `handler(method, params)`. Exceptions raised
+    by the handler are returned as JSON-RPC errors.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.connections = set()
+
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                server.connections.add(self.client_address)
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+                if isinstance(request, list):
+                    response = [server.respond(item) for item in request]
+                else:
+                    response = server.respond(request)
+
+                body = json.dumps(force_obj_to_text(response)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), RequestHandler)
+        self.endpoint_uri = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, request: dict) -> dict:
+        self.requests.append((request['method'], request['params']))
+        try:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'result': self.handler(request['method'], request['params'])}
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32000, 'message': str(e)}}
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
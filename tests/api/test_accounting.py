@@ -0,0 +1,113 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+from web3 import EthereumTesterProvider
+from web3 import Web3
+
+from keeper.api import Address
+from keeper.api.accounting import RpcAccounting, AccountingProvider, RequestStats
+from keeper.api.batch import batch
+from keeper.api.numeric import Wad
+from keeper.api.token import DSToken
+
+
+class FailingProvider(EthereumTesterProvider):
+    def make_request(self, method, params):
+        if method == 'eth_gasPrice':
+            raise IOError("Node unavailable")
+        return super().make_request(method, params)
+
+
+class TestRpcAccounting:
+    def setup_method(self):
+        self.tester_web3 = Web3(FailingProvider())
+        self.tester_web3.eth.defaultAccount = self.tester_web3.eth.accounts[0]
+        self.our_address = Address(self.tester_web3.eth.defaultAccount)
+        token = DSToken.deploy(self.tester_web3, 'ABC')
+        token.mint(Wad(1000000)).transact()
+
+        self.accounting = RpcAccounting()
+        self.web3 = Web3(AccountingProvider(self.tester_web3.currentProvider, self.accounting))
+        self.web3.eth.defaultAccount = self.tester_web3.eth.defaultAccount
+        self.token = DSToken(web3=self.web3, address=token.address)
+        self.accounting.reset()
+
+    def test_should_count_requests_by_method_and_caller(self):
+        # when
+        self.token.total_supply()
+        self.token.balance_of(self.our_address)
+        self.token.balance_of(self.our_address)
+        self.web3.eth.blockNumber
+
+        # then
+        assert self.accounting.by_method['eth_call'].count == 3
+        assert self.accounting.by_method['eth_blockNumber'].count == 1
+        assert self.accounting.by_caller['DSToken.balance_of'].count == 2
+        assert self.accounting.by_caller['DSToken.total_supply'].count == 1
+        assert self.accounting.total().count == 4
+        assert self.accounting.total().failures == 0
+        assert self.accounting.total().duration > 0
+
+    def test_should_count_failed_requests(self):
+        # when
+        with pytest.raises(IOError):
+            self.web3.eth.gasPrice
+
+        # then
+        assert self.accounting.by_method['eth_gasPrice'].count == 1
+        assert self.accounting.by_method['eth_gasPrice'].failures == 1
+        assert self.accounting.total().failures == 1
+
+    def test_should_count_batched_requests(self):
+        # when
+        batch(self.web3, [self.token.total_supply, lambda: self.token.balance_of(self.our_address)])
+
+        # then
+        assert self.accounting.by_method['eth_call'].count == 2
+        assert self.accounting.total().count == 2
+
+    def test_should_reset(self):
+        # given
+        self.token.total_supply()
+
+        # when
+        snapshot = self.accounting.reset()
+
+        # then
+        assert snapshot.total().count == 1
+        assert snapshot.by_caller['DSToken.total_supply'].count == 1
+        assert self.accounting.total() == RequestStats()
+        assert self.accounting.by_method == {}
+
+    def test_should_summarize(self):
+        # given
+        self.token.total_supply()
+        self.token.total_supply()
+        self.web3.eth.blockNumber
+
+        # when
+        summary = self.accounting.summary()
+
+        # then
+        assert summary.startswith("3 requests (")
+        assert "eth_call=2 (" in summary
+        assert "eth_blockNumber=1 (" in summary
+        assert "DSToken.total_supply=2" in summary
+
+    def test_should_summarize_no_requests(self):
+        assert RpcAccounting().summary() == "0 requests (0.000s)"
@@ -0,0 +1,230 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from web3 import EthereumTesterProvider, HTTPProvider
+from web3 import Web3
+
+from keeper.api import Address
+from keeper.api.accounting import AccountingProvider, RpcAccounting
+from keeper.api.asynchronous import call_async, AsyncHTTPClient
+from keeper.api.numeric import Wad
+from keeper.api.provider import AdaptiveLimiter, HedgedHTTPProvider, LimitedProvider, PooledHTTPProvider
+from keeper.api.token import DSToken
+from keeper.api.util import synchronize
+from tests.api.helpers import JsonRpcServer
+
+
+class TestCallAsync:
+    def setup_method(self):
+        self.web3 = Web3(EthereumTesterProvider())
+        self.web3.eth.defaultAccount = self.web3.eth.accounts[0]
+        self.our_address = Address(self.web3.eth.defaultAccount)
+        self.second_address = Address(self.web3.eth.accounts[1])
+        self.token = DSToken.deploy(self.web3, 'ABC')
+        self.token.mint(Wad(1000000)).transact()
+        self.token.transfer(self.second_address, Wad(300)).transact()
+
+    def test_should_return_same_results_as_direct_calls(self):
+        # when
+        results = synchronize([call_async(self.web3, self.token.total_supply),
+                               call_async(self.web3, lambda: self.token.balance_of(self.our_address)),
+                               call_async(self.web3, lambda: self.token.balance_of(self.second_address))])
+
+        # then
+        assert results == [Wad(1000000), Wad(999700), Wad(300)]
+
+    def test_should_handle_dependent_calls(self):
+        # expect
+        assert synchronize([call_async(self.web3, lambda: self.token.balance_of(self.token.authority()))]) == [Wad(0)]
+
+    def test_should_propagate_exceptions(self):
+        # given
+        def failing_call():
+            self.token.total_supply()
+            raise ValueError("failed")
+
+        # expect
+        with pytest.raises(ValueError):
+            synchronize([call_async(self.web3, failing_call)])
+
+
+class TestCallAsyncOverHttp:
+    def setup_method(self):
+        self.tester_web3 = Web3(EthereumTesterProvider())
+        self.tester_web3.eth.defaultAccount = self.tester_web3.eth.accounts[0]
+        self.our_address = Address(self.tester_web3.eth.defaultAccount)
+        token = DSToken.deploy(self.tester_web3, 'ABC')
+        token.mint(Wad(1000000)).transact()
+
+        # `EthereumTesterProvider` is not thread-safe, so requests have to be handled one by one
+        lock = threading.Lock()
+
+        def handler(method, params):
+            with lock:
+                return self.tester_web3.currentProvider.make_request(method, params)['result']
+
+        self.server = JsonRpcServer(handler)
+        self.web3 = Web3(HTTPProvider(self.server.endpoint_uri))
+        self.token = DSToken(web3=self.web3, address=token.address)
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_should_execute_many_calls_concurrently(self):
+        # when
+        results = synchronize([call_async(self.web3, lambda: self.token.balance_of(self.our_address))
+                               for i in range(20)])
+
+        # then
+        assert results == [Wad(1000000)] * 20
+        assert len([request for request in self.server.requests if request[0] == 'eth_call']) == 20
+
+    def test_should_reuse_connections(self):
+        # given
+        connections = len(self.server.connections)
+
+        async def calls():
+            for i in range(5):
+                assert await call_async(self.web3, self.token.total_supply) == Wad(1000000)
+
+        # when
+        synchronize([calls()])
+
+        # then
+        assert len(self.server.connections) == connections + 1
+
+
+class TestCallAsyncThroughProviderWrappers:
+    def setup_method(self):
+        self.tester_web3 = Web3(EthereumTesterProvider())
+        self.tester_web3.eth.defaultAccount = self.tester_web3.eth.accounts[0]
+        self.our_address = Address(self.tester_web3.eth.defaultAccount)
+        self.token = DSToken.deploy(self.tester_web3, 'ABC')
+        self.token.mint(Wad(1000000)).transact()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.methods = []
+
+        # `EthereumTesterProvider` is not thread-safe, so requests have to be handled one by one
+        lock = threading.Lock()
+
+        def handler(method, params):
+            with lock:
+                self.methods.append(method)
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.1)
+            with lock:
+                self.in_flight -= 1
+                return self.tester_web3.currentProvider.make_request(method, params)['result']
+
+        self.server = JsonRpcServer(handler)
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def calls(self, provider) -> list:
+        web3 = Web3(provider)
+        token = DSToken(web3=web3, address=self.token.address)
+        return synchronize([call_async(web3, lambda: token.balance_of(self.our_address)) for i in range(10)])
+
+    def test_should_send_concurrent_requests_through_limiter_and_accounting(self):
+        # given
+        accounting = RpcAccounting()
+        limiter = AdaptiveLimiter(initial_limit=3, min_limit=3, max_limit=3)
+        provider = AccountingProvider(LimitedProvider(PooledHTTPProvider(self.server.endpoint_uri), limiter), accounting)
+
+        # when
+        results = self.calls(provider)
+
+        # then
+        assert results == [Wad(1000000)] * 10
+        assert self.max_in_flight == 3
+        assert limiter.in_flight == 0
+        assert accounting.by_method['eth_call'].count == 10
+
+    def test_should_send_concurrent_requests_through_hedged_provider(self):
+        # given
+        provider = HedgedHTTPProvider([self.server.endpoint_uri])
+
+        # when
+        results = self.calls(provider)
+
+        # then
+        assert results == [Wad(1000000)] * 10
+        assert self.max_in_flight > 1
+        assert self.methods.count('eth_call') == 10
+        assert provider.endpoint_stats()[0].requests == len(self.methods)
+
+
+class TestAsyncHTTPClient:
+    def setup_method(self):
+        self.server = JsonRpcServer(lambda method, params: params[0] if method == 'echo' else 1/0)
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_should_return_results_and_errors(self):
+        # given
+        async def requests():
+            client = AsyncHTTPClient.get(self.server.endpoint_uri)
+            return await client.request('echo', ['abc']), await client.request('fail', [])
+
+        # when
+        result, error = synchronize([requests()])[0]
+
+        # then
+        assert result['result'] == 'abc'
+        assert 'error' in error
+
+    def test_should_read_body_until_closed_if_no_length_given(self):
+        # given
+        async def respond(reader, writer):
+            await reader.readline()
+            headers = []
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                headers.append(line.split(':', 1))
+            await reader.readexactly(int(next(value for name, value in headers if name.lower() == 'content-length')))
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+                         + json.dumps({'jsonrpc': '2.0', 'id': 0, 'result': 'abc'}).encode('utf-8'))
+            await writer.drain()
+            writer.close()
+
+        async def requests():
+            server = await asyncio.start_server(respond, '127.0.0.1', 0)
+            try:
+                client = AsyncHTTPClient(f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}")
+                return await client.request('echo', ['abc']), await client.request('echo', ['abc']), client
+            finally:
+                server.close()
+
+        # when
+        first, second, client = synchronize([requests()])[0]
+
+        # then
+        assert first['result'] == 'abc'
+        assert second['result'] == 'abc'
+        assert client._idle_connections == []
@@ -0,0 +1,147 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+from web3 import EthereumTesterProvider
+from web3 import Web3
+
+from keeper.api import Address
+from keeper.api.batch import batch, BatchRequestManager, match_batch_responses
+from keeper.api.numeric import Wad
+from keeper.api.token import DSToken
+
+
+class BatchCountingProvider(EthereumTesterProvider):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def make_batch_request(self, requests):
+        self.batches.append(requests)
+        return [self.make_request(method, params) for method, params in requests]
+
+
+class TestBatch:
+    def setup_method(self):
+        self.provider = BatchCountingProvider()
+        self.web3 = Web3(self.provider)
+        self.web3.eth.defaultAccount = self.web3.eth.accounts[0]
+        self.our_address = Address(self.web3.eth.defaultAccount)
+        self.second_address = Address(self.web3.eth.accounts[1])
+        self.token = DSToken.deploy(self.web3, 'ABC')
+        self.token.mint(Wad(1000000)).transact()
+        self.token.transfer(self.second_address, Wad(300)).transact()
+
+    def test_should_return_same_results_as_direct_calls(self):
+        # when
+        results = batch(self.web3, [self.token.total_supply,
+                                    lambda: self.token.balance_of(self.our_address),
+                                    lambda: self.token.balance_of(self.second_address),
+                                    self.token.authority])
+
+        # then
+        assert results == [self.token.total_supply(),
+                           self.token.balance_of(self.our_address),
+                           self.token.balance_of(self.second_address),
+                           self.token.authority()]
+        assert results[0] == Wad(1000000)
+        assert results[2] == Wad(300)
+
+    def test_should_send_all_calls_in_one_batch(self):
+        # when
+        batch(self.web3, [self.token.total_supply,
+                          lambda: self.token.balance_of(self.our_address),
+                          lambda: self.token.balance_of(self.second_address)])
+
+        # then
+        assert len(self.provider.batches) == 1
+        assert len(self.provider.batches[0]) == 3
+        assert all(method == 'eth_call' for method, params in self.provider.batches[0])
+
+    def test_should_send_identical_calls_only_once(self):
+        # when
+        results = batch(self.web3, [self.token.total_supply, self.token.total_supply])
+
+        # then
+        assert results == [Wad(1000000), Wad(1000000)]
+        assert len(self.provider.batches) == 1
+        assert len(self.provider.batches[0]) == 1
+
+    def test_should_handle_dependent_calls_in_subsequent_batches(self):
+        # when
+        results = batch(self.web3, [lambda: self.token.balance_of(self.token.authority())])
+
+        # then
+        assert results == [Wad(0)]
+        assert len(self.provider.batches) == 2
+
+    def test_should_not_affect_calls_made_outside_of_batch(self):
+        # given
+        batch(self.web3, [self.token.total_supply])
+
+        # when
+        total_supply = self.token.total_supply()
+
+        # then
+        assert isinstance(self.web3._requestManager, BatchRequestManager)
+        assert total_supply == Wad(1000000)
+        assert len(self.provider.batches) == 1
+
+    def test_should_return_empty_list_for_no_calls(self):
+        assert batch(self.web3, []) == []
+
+    def test_should_propagate_exceptions(self):
+        # given
+        def failing_call():
+            self.token.total_supply()
+            raise ValueError("failed")
+
+        # expect
+        with pytest.raises(ValueError):
+            batch(self.web3, [failing_call])
+
+        # and
+        assert self.token.total_supply() == Wad(1000000)
+
+    def test_should_fail_if_provider_returns_fewer_responses(self):
+        # given
+        self.provider.make_batch_request = lambda requests: [self.provider.make_request(*requests[0])]
+
+        # expect
+        with pytest.raises(ValueError):
+            batch(self.web3, [self.token.total_supply, lambda: self.token.balance_of(self.our_address)])
+
+
+class TestMatchBatchResponses:
+    def test_should_order_responses_by_id(self):
+        # expect
+        assert match_batch_responses([{'id': 1, 'result': 'b'}, {'id': 0, 'result': 'a'}], 2) \
+            == [{'id': 0, 'result': 'a'}, {'id': 1, 'result': 'b'}]
+
+    def test_should_fail_on_missing_or_unexpected_ids(self):
+        # expect
+        with pytest.raises(ValueError):
+            match_batch_responses([{'id': 0, 'result': 'a'}], 2)
+        with pytest.raises(ValueError):
+            match_batch_responses([{'id': 0, 'result': 'a'}, {'id': 0, 'result': 'a'}], 2)
+        with pytest.raises(ValueError):
+            match_batch_responses([{'id': 0, 'result': 'a'}, {'id': 2, 'result': 'b'}], 2)
+
+    def test_should_fail_on_error_response(self):
+        # expect
+        with pytest.raises(ValueError):
+            match_batch_responses({'id': None, 'error': {'code': -32600, 'message': 'Invalid Request'}}, 2)
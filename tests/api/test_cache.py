@@ -0,0 +1,192 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+from web3 import EthereumTesterProvider
+from web3 import Web3
+
+from keeper.api import Address
+from keeper.api.cache import BlockCache, cached
+from keeper.api.feed import DSValue
+from keeper.api.numeric import Wad
+from tests.conftest import SaiDeployment
+
+
+class Counter:
+    def __init__(self, web3: Web3, address: Address):
+        self.web3 = web3
+        self.address = address
+        self.calls = 0
+
+    @cached
+    def value(self, multiplier: int = 1) -> int:
+        self.calls += 1
+        return self.calls * multiplier
+
+
+class TestBlockCache:
+    def setup_method(self):
+        self.web3 = Web3(EthereumTesterProvider())
+        self.counter = Counter(self.web3, Address('0x0101010101010101010101010101010101010101'))
+
+    def test_should_not_cache_if_not_enabled(self):
+        # expect
+        assert self.counter.value() == 1
+        assert self.counter.value() == 2
+
+    def test_should_not_cache_if_block_number_unknown(self):
+        # given
+        BlockCache.enable(self.web3)
+
+        # expect
+        assert self.counter.value() == 1
+        assert self.counter.value() == 2
+
+    def test_should_cache_within_one_block(self):
+        # given
+        BlockCache.enable(self.web3).new_block(1)
+
+        # expect
+        assert self.counter.value() == 1
+        assert self.counter.value() == 1
+        assert self.counter.calls == 1
+
+    def test_should_cache_separately_for_different_arguments(self):
+        # given
+        BlockCache.enable(self.web3).new_block(1)
+
+        # expect
+        assert self.counter.value(10) == 10
+        assert self.counter.value(100) == 200
+        assert self.counter.value(10) == 10
+
+    def test_should_accept_keyword_arguments(self):
+        # given
+        BlockCache.enable(self.web3).new_block(1)
+
+        # expect
+        assert self.counter.value(multiplier=10) == 10
+        assert self.counter.value(10) == 10
+        assert self.counter.value(multiplier=100) == 200
+        assert self.counter.value() == 3
+        assert self.counter.value(1) == 3
+
+    def test_should_cache_separately_for_different_contracts(self):
+        # given
+        BlockCache.enable(self.web3).new_block(1)
+        other_counter = Counter(self.web3, Address('0x0202020202020202020202020202020202020202'))
+
+        # expect
+        assert self.counter.value() == 1
+        assert other_counter.value() == 1
+        assert self.counter.calls == 1
+        assert other_counter.calls == 1
+
+    def test_should_fetch_only_missing_values_at_once(self):
+        # given
+        cache = BlockCache.enable(self.web3)
+        cache.new_block(1)
+        fetched = []
+
+        def fetch_many(keys):
+            fetched.append(keys)
+            return [key * 10 for key in keys]
+
+        # expect
+        assert cache.get_many([1, 2, 1], fetch_many) == [10, 20, 10]
+        assert cache.get_many([2, 3], fetch_many) == [20, 30]
+        assert fetched == [[1, 2], [3]]
+
+    def test_should_invalidate_on_new_block(self):
+        # given
+        cache = BlockCache.enable(self.web3)
+        cache.new_block(1)
+        assert self.counter.value() == 1
+
+        # when
+        cache.new_block(1)
+
+        # then
+        assert self.counter.value() == 1
+
+        # when
+        cache.new_block(2)
+
+        # then
+        assert self.counter.value() == 2
+        assert self.counter.value() == 2
+
+    def test_should_invalidate(self):
+        # given
+        cache = BlockCache.enable(self.web3)
+        cache.new_block(1)
+        assert self.counter.value() == 1
+
+        # when
+        cache.invalidate()
+
+        # then
+        assert self.counter.value() == 2
+
+    def test_should_disable(self):
+        # given
+        BlockCache.enable(self.web3).new_block(1)
+
+        # when
+        BlockCache.disable(self.web3)
+
+        # then
+        assert BlockCache.of(self.web3) is None
+        assert self.counter.value() == 1
+        assert self.counter.value() == 2
+
+
+class TestBlockCacheWithSai:
+    @pytest.fixture()
+    def cache(self, sai: SaiDeployment):
+        cache = BlockCache.enable(sai.web3)
+        cache.new_block(sai.web3.eth.blockNumber)
+        yield cache
+        BlockCache.disable(sai.web3)
+
+    def test_should_cache_tub_getters(self, sai: SaiDeployment, cache: BlockCache):
+        # given
+        pip = DSValue(web3=sai.web3, address=sai.tub.pip())
+        pip.poke_with_int(Wad.from_number(250).value).transact()
+        assert sai.tub.tag() == Wad.from_number(250)
+
+        # when
+        pip._contract.transact().poke(Wad.from_number(300).value.to_bytes(32, byteorder='big'))
+
+        # then
+        assert sai.tub.tag() == Wad.from_number(250)
+
+        # when
+        cache.new_block(sai.web3.eth.blockNumber)
+
+        # then
+        assert sai.tub.tag() == Wad.from_number(300)
+
+    def test_should_invalidate_after_own_transaction(self, sai: SaiDeployment, cache: BlockCache):
+        # given
+        assert sai.tub.pie() == Wad(0)
+
+        # when
+        sai.tub.join(Wad.from_number(5)).transact()
+
+        # then
+        assert sai.tub.pie() == Wad.from_number(5)
@@ -14,15 +14,26 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import queue
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
 import pytest
+import requests
+from unittest.mock import patch
 
 from keeper.api import Address, Wad
 from keeper.api.approval import directly
+from keeper.api.batch import batch
+from keeper.api.cache import BlockCache
 from keeper.api.token import DSToken
 from web3 import EthereumTesterProvider
 from web3 import Web3
 
-from keeper.api.etherdelta import EtherDelta
+from keeper.api.etherdelta import EtherDelta, OffChainOrder, EtherDeltaApi
 
 
 class TestEtherDelta:
@@ -137,6 +148,153 @@ class TestEtherDelta:
         # assert self.etherdelta.amount_available(order) == Wad.from_number(0)
         # assert self.etherdelta.amount_filled(order) == Wad.from_number(4)
 
+    def place_order(self, amount_give: Wad):
+        self.etherdelta.place_order_onchain(token_get=self.token2.address, amount_get=Wad.from_number(4),
+                                            token_give=self.token1.address, amount_give=amount_give,
+                                            expires=100000000).transact()
+
+    def test_onchain_orders_should_be_checkpointed(self, tmpdir):
+        # given
+        checkpoint_file = str(tmpdir.join('etherdelta.json'))
+        etherdelta = EtherDelta(web3=self.web3, address=self.etherdelta.address, api_server=None,
+                                checkpoint_file=checkpoint_file)
+        self.place_order(Wad.from_number(1))
+
+        # when
+        assert len(etherdelta.active_onchain_orders()) == 1
+
+        # then
+        with open(checkpoint_file, 'r') as file:
+            checkpoint = json.load(file)
+        assert checkpoint['block_number'] == self.web3.eth.blockNumber
+        assert len(checkpoint['orders']) == 1
+
+        # when
+        self.place_order(Wad.from_number(2))
+
+        # then
+        assert len(etherdelta.active_onchain_orders()) == 2
+        with open(checkpoint_file, 'r') as file:
+            assert len(json.load(file)['orders']) == 2
+
+    def test_onchain_orders_should_be_resumed_from_checkpoint(self, tmpdir):
+        # given
+        checkpoint_file = str(tmpdir.join('etherdelta.json'))
+        self.place_order(Wad.from_number(1))
+        EtherDelta(web3=self.web3, address=self.etherdelta.address, api_server=None,
+                   checkpoint_file=checkpoint_file).active_onchain_orders()
+        checkpoint_block = self.web3.eth.blockNumber
+
+        # and
+        self.place_order(Wad.from_number(2))
+        etherdelta = EtherDelta(web3=self.web3, address=self.etherdelta.address, api_server=None,
+                                checkpoint_file=checkpoint_file)
+
+        # when
+        with patch.object(etherdelta, '_order_logs', wraps=etherdelta._order_logs) as order_logs:
+            orders = etherdelta.active_onchain_orders()
+
+        # then
+        assert len(orders) == 2
+        assert order_logs.call_args_list[0][0][0] == checkpoint_block + 1
+
+    def test_onchain_orders_should_be_read_in_smaller_chunks_on_failure(self):
+        # given
+        self.place_order(Wad.from_number(1))
+        etherdelta = EtherDelta(web3=self.web3, address=self.etherdelta.address, api_server=None)
+        etherdelta.BACKFILL_CHUNK = 4
+        order_logs = etherdelta._order_logs
+
+        def failing_order_logs(from_block: int, to_block: int):
+            if to_block - from_block + 1 > 1:
+                raise ValueError("query returned more than 1 result")
+            return order_logs(from_block, to_block)
+
+        # when
+        with patch.object(etherdelta, '_order_logs', side_effect=failing_order_logs):
+            orders = etherdelta.active_onchain_orders()
+
+        # then
+        assert len(orders) == 1
+
+    def test_onchain_orders_should_resume_backfill_after_failure(self, tmpdir):
+        # given
+        checkpoint_file = str(tmpdir.join('etherdelta.json'))
+        self.place_order(Wad.from_number(1))
+        order_block = self.web3.eth.blockNumber
+        self.place_order(Wad.from_number(2))
+        etherdelta = EtherDelta(web3=self.web3, address=self.etherdelta.address, api_server=None,
+                                checkpoint_file=checkpoint_file)
+        etherdelta.BACKFILL_CHUNK = 1
+        order_logs = etherdelta._order_logs
+
+        def failing_order_logs(from_block: int, to_block: int):
+            if from_block <= order_block <= to_block:
+                raise ValueError("request timed out")
+            return order_logs(from_block, to_block)
+
+        # when
+        with patch.object(etherdelta, '_order_logs', side_effect=failing_order_logs):
+            with pytest.raises(ValueError):
+                etherdelta.active_onchain_orders()
+
+        # then
+        with open(checkpoint_file, 'r') as file:
+            assert json.load(file)['block_number'] == order_block - 1
+
+        # when
+        self.place_order(Wad.from_number(3))
+
+        # then
+        orders = etherdelta.active_onchain_orders()
+        assert sorted(order.amount_give for order in orders) == [Wad.from_number(1), Wad.from_number(2),
+                                                                 Wad.from_number(3)]
+        with open(checkpoint_file, 'r') as file:
+            assert json.load(file)['block_number'] == self.web3.eth.blockNumber
+
+    def test_amounts_filled_and_available_should_be_batched_and_cached_per_block(self):
+        # given
+        BlockCache.enable(self.web3).new_block(self.web3.eth.blockNumber)
+        self.etherdelta.approve([self.token1, self.token2], directly())
+        self.etherdelta.deposit_token(self.token1.address, Wad.from_number(10)).transact()
+        self.place_order(Wad.from_number(1))
+        self.place_order(Wad.from_number(2))
+        orders = self.etherdelta.active_onchain_orders()
+
+        # when
+        # `active_onchain_orders()` has already fetched the filled amounts for this block
+        with patch('keeper.api.etherdelta.batch', wraps=batch) as batch_mock:
+            amounts_filled = self.etherdelta.amounts_filled(orders)
+            amounts_available = self.etherdelta.amounts_available(orders)
+            assert self.etherdelta.amounts_filled(orders + orders) == amounts_filled + amounts_filled
+
+        # then
+        assert amounts_filled == [self.etherdelta.amount_filled(order) for order in orders]
+        assert amounts_available == [self.etherdelta.amount_available(order) for order in orders]
+        assert batch_mock.call_count == 1
+
+        # when
+        self.etherdelta.cancel_order(orders[0]).transact()
+
+        # then
+        assert self.etherdelta.amounts_filled(orders) == [Wad.from_number(4), Wad(0)]
+
+    def test_amounts_filled_should_be_batched_without_block_cache(self):
+        # given
+        self.etherdelta.approve([self.token1, self.token2], directly())
+        self.etherdelta.deposit_token(self.token1.address, Wad.from_number(10)).transact()
+        self.place_order(Wad.from_number(1))
+        orders = self.etherdelta.active_onchain_orders()
+
+        # when
+        with patch('keeper.api.etherdelta.batch', wraps=batch) as batch_mock:
+            amounts_filled = self.etherdelta.amounts_filled(orders + orders)
+
+        # then
+        assert amounts_filled == [Wad(0), Wad(0)]
+        assert batch_mock.call_count == 1
+        assert len(batch_mock.call_args[0][1]) == 1
+
     @pytest.mark.skip(reason='eth_sign is not implemented yet in eth-testrpc')
     # see
     def test_offchain_order_happy_path(self):
@@ -189,3 +347,317 @@ class TestEtherDelta:
 
     def test_should_have_printable_representation(self):
         assert repr(self.etherdelta) == f"EtherDelta('{self.etherdelta.address}')"
+
+
+class StreamingApiServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for the EtherDelta API, sending queued messages over `/orders/stream/...` connections."""
+    daemon_threads = True
+
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.connections = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.connections += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                while True:
+                    message = server.messages.get()
+                    if message is None:
+                        self.wfile.write(b'0\r\n\r\n')
+                        return
+                    data = (json.dumps(message) + '\n').encode('utf-8')
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                    self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def wait_until(condition, timeout: float = 10.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+class TestEtherDeltaOrderStream:
+    def setup_method(self):
+        self.web3 = Web3(EthereumTesterProvider())
+        self.web3.eth.defaultAccount = self.web3.eth.accounts[0]
+        self.our_address = Address(self.web3.eth.defaultAccount)
+        self.server = StreamingApiServer()
+        self.etherdelta = EtherDelta.deploy(self.web3,
+                                            admin=Address('0x1111100000999998888877777666665555544444'),
+                                            fee_account=Address('0x8888877777666665555544444111110000099999'),
+                                            account_levels_addr=Address('0x6666655555444441111188888777770000099999'),
+                                            fee_make=Wad.from_number(0.01),
+                                            fee_take=Wad.from_number(0.02),
+                                            fee_rebate=Wad.from_number(0.03),
+                                            api_server=self.server.url)
+        self.token1 = DSToken.deploy(self.web3, 'AAA')
+        self.token2 = DSToken.deploy(self.web3, 'BBB')
+
+    def teardown_method(self):
+        self.etherdelta.close()
+        self.server.messages.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def order(self, nonce: int) -> OffChainOrder:
+        return OffChainOrder(token_get=self.token2.address, amount_get=Wad.from_number(4),
+                             token_give=self.token1.address, amount_give=Wad.from_number(2),
+                             expires=100000000, nonce=nonce, user=self.our_address,
+                             v=27, r=bytes(32), s=bytes(32))
+
+    def entry(self, order: OffChainOrder) -> dict:
+        return {'order': order.to_json(self.etherdelta.address)}
+
+    def active_orders(self) -> set:
+        return set(self.etherdelta.active_offchain_orders(self.token1.address, self.token2.address))
+
+    def test_should_serve_orders_from_the_stream(self):
+        # given
+        stream = self.etherdelta.stream_offchain_orders(self.token1.address, self.token2.address)
+        self.server.messages.put({'orders': [self.entry(self.order(1)), self.entry(self.order(2))]})
+
+        # when
+        wait_until(lambda: stream.synced.is_set())
+
+        # then
+        with patch.object(self.etherdelta.api, 'get') as get_mock:
+            assert self.active_orders() == {self.order(1), self.order(2)}
+            assert not get_mock.called
+
+        # when
+        self.server.messages.put({'added': [self.entry(self.order(3))], 'removed': [self.entry(self.order(1))]})
+
+        # then
+        wait_until(lambda: self.active_orders() == {self.order(2), self.order(3)})
+
+    def test_should_drop_filled_orders(self):
+        # given
+        # the order is placed on-chain as well, so it can be cancelled without a valid signature
+        self.etherdelta.place_order_onchain(token_get=self.token2.address, amount_get=Wad.from_number(4),
+                                            token_give=self.token1.address, amount_give=Wad.from_number(2),
+                                            expires=100000000).transact()
+        order = self.order(self.etherdelta.active_onchain_orders()[0].nonce)
+
+        # and
+        stream = self.etherdelta.stream_offchain_orders(self.token1.address, self.token2.address)
+        self.server.messages.put({'orders': [self.entry(order), self.entry(self.order(2))]})
+        wait_until(lambda: stream.synced.is_set())
+        assert self.active_orders() == {order, self.order(2)}
+
+        # when
+        self.etherdelta.cancel_order(order).transact()
+
+        # then
+        assert self.active_orders() == {self.order(2)}
+        assert stream.orders() == {self.order(2)}
+
+    def test_should_resynchronize_after_reconnecting(self):
+        # given
+        stream = self.etherdelta.stream_offchain_orders(self.token1.address, self.token2.address)
+        stream.reconnect_delay = 0.1
+        self.server.messages.put({'orders': [self.entry(self.order(1))]})
+        wait_until(lambda: stream.synced.is_set())
+
+        # when
+        self.server.messages.put(None)
+        wait_until(lambda: self.server.connections == 2)
+        self.server.messages.put({'orders': [self.entry(self.order(2))]})
+
+        # then
+        wait_until(lambda: stream.synced.is_set() and stream.orders() == {self.order(2)})
+
+    def test_should_not_share_the_api_session(self):
+        # when
+        stream = self.etherdelta.stream_offchain_orders(self.token1.address, self.token2.address)
+
+        # then
+        assert stream.session is not self.etherdelta.api.session
+
+    def test_should_stop_stream_threads_on_close(self):
+        # given
+        stream = self.etherdelta.stream_offchain_orders(self.token1.address, self.token2.address)
+        self.server.messages.put({'orders': [self.entry(self.order(1))]})
+        wait_until(lambda: stream.synced.is_set())
+
+        # and
+        self.server.messages.put(None)
+        wait_until(lambda: not stream.synced.is_set())
+
+        # when
+        self.etherdelta.close()
+
+        # then
+        assert not stream._thread.is_alive()
+
+
+class FlakyApiServer(HTTPServer):
+    """Local stand-in for the EtherDelta API, responding with queued status codes."""
+
+    def __init__(self):
+        self.statuses = queue.Queue()
+        self.requests = 0
+        self.delay = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.requests += 1
+                status = server.statuses.get_nowait() if not server.statuses.empty() else 200
+                time.sleep(server.delay)
+                body = b'{"orders": []}'
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                self.do_GET()
+
+            def log_message(self, format, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class TestEtherDeltaApi:
+    def setup_method(self):
+        self.server = FlakyApiServer()
+        self.api = EtherDeltaApi(self.server.url, max_retries=2, retry_delay=0.01)
+
+    def teardown_method(self):
+        self.api.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_should_retry_server_errors(self):
+        # given
+        self.server.statuses.put(500)
+        self.server.statuses.put(503)
+
+        # when
+        response = self.api.get('orders', 'orders/1/a/b')
+
+        # then
+        assert response.status_code == 200
+        assert self.server.requests == 3
+
+        # and
+        stats = self.api.endpoint_stats()
+        assert len(stats) == 1
+        assert stats[0].endpoint_uri == f"{self.server.url}/orders"
+        assert stats[0].requests == 3
+        assert stats[0].failures == 2
+        assert stats[0].consecutive_failures == 0
+        assert stats[0].latency > 0
+
+    def test_should_give_up_after_max_retries(self):
+        # given
+        for _ in range(3):
+            self.server.statuses.put(500)
+
+        # expect
+        with pytest.raises(requests.HTTPError):
+            self.api.get('orders', 'orders/1/a/b')
+
+        # and
+        assert self.server.requests == 3
+        assert self.api.endpoint_stats()[0].consecutive_failures == 3
+
+    def test_should_not_retry_client_errors(self):
+        # given
+        self.server.statuses.put(404)
+
+        # when
+        response = self.api.get('orders', 'orders/1/a/b')
+
+        # then
+        assert response.status_code == 404
+        assert self.server.requests == 1
+
+    def test_should_not_retry_server_errors_of_post_requests(self):
+        # given
+        self.server.statuses.put(500)
+
+        # when
+        response = self.api.post('message', 'message', data={'message': '{}'})
+
+        # then
+        assert response.status_code == 500
+        assert self.server.requests == 1
+
+        # and
+        stats = self.api.endpoint_stats()
+        assert stats[0].requests == 1
+        assert stats[0].failures == 1
+
+    def test_should_not_retry_post_requests_which_timed_out(self):
+        # given
+        self.server.delay = 0.5
+
+        # expect
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            self.api.post('message', 'message', data={'message': '{}'}, timeout=0.1)
+
+        # and
+        assert self.server.requests == 1
+        assert self.api.endpoint_stats()[0].requests == 1
+
+    def test_should_retry_post_requests_which_could_not_connect(self):
+        # given
+        self.server.shutdown()
+        self.server.server_close()
+
+        # expect
+        with pytest.raises(requests.exceptions.ConnectionError):
+            self.api.post('message', 'message', data={'message': '{}'})
+
+        # and
+        stats = self.api.endpoint_stats()
+        assert stats[0].requests == 3
+        assert stats[0].failures == 3
+
+    def test_should_reuse_connections(self):
+        # given
+        connections = []
+        connect = HTTPServer.get_request
+
+        def get_request(server):
+            connections.append(True)
+            return connect(server)
+
+        # when
+        with patch.object(FlakyApiServer, 'get_request', get_request):
+            for _ in range(5):
+                self.api.get('orders', 'orders/1/a/b')
+
+        # then
+        assert self.server.requests == 5
+        assert len(connections) == 1
@@ -15,10 +15,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from unittest.mock import Mock
+
 import pytest
+from web3 import EthereumTesterProvider
+from web3 import Web3
 
 from keeper import Wad
 from keeper.api import Address, Calldata, Receipt, Transfer
+from keeper.api.token import DSToken, ERC20Token
 from tests.api.helpers import is_hashable
 
 
@@ -236,3 +241,62 @@ class TestTransfer:
         assert transfer1b != transfer2
         assert transfer2 != transfer1a
         assert transfer2 != transfer1b
+
+
+class TestContract:
+    def setup_method(self):
+        self.web3 = Web3(EthereumTesterProvider())
+        self.web3.eth.defaultAccount = self.web3.eth.accounts[0]
+        self.token = DSToken.deploy(self.web3, 'ABC')
+
+    def web3_counting_get_code(self) -> Web3:
+        web3 = Web3(self.web3.currentProvider)
+        web3.eth.getCode = Mock(side_effect=self.web3.eth.getCode)
+        return web3
+
+    def test_should_reuse_contract_for_the_same_abi_and_address(self):
+        # given
+        web3 = self.web3_counting_get_code()
+
+        # when
+        first = self.token._get_contract(web3, DSToken.abi, self.token.address)
+        second = self.token._get_contract(web3, DSToken.abi, self.token.address)
+
+        # then
+        assert second is first
+        assert web3.eth.getCode.call_count == 1
+
+        # and
+        assert DSToken(web3=web3, address=self.token.address).total_supply() == Wad(0)
+        assert web3.eth.getCode.call_count == 1
+
+    def test_should_create_separate_contract_for_each_abi_without_checking_code_again(self):
+        # given
+        web3 = self.web3_counting_get_code()
+        token_contract = self.token._get_contract(web3, DSToken.abi, self.token.address)
+
+        # when
+        erc20_contract = self.token._get_contract(web3, ERC20Token.abi, self.token.address)
+
+        # then
+        assert erc20_contract is not token_contract
+        assert erc20_contract.address == token_contract.address
+        assert web3.eth.getCode.call_count == 1
+
+    def test_should_create_separate_contract_for_each_web3(self):
+        # given
+        web3 = self.web3_counting_get_code()
+        other_web3 = self.web3_counting_get_code()
+        contract = self.token._get_contract(web3, DSToken.abi, self.token.address)
+
+        # when
+        other_contract = self.token._get_contract(other_web3, DSToken.abi, self.token.address)
+
+        # then
+        assert other_contract is not contract
+        assert other_contract.web3 is other_web3
+        assert other_web3.eth.getCode.call_count == 1
+
+    def test_should_still_fail_when_no_contract_at_address(self):
+        with pytest.raises(Exception):
+            ERC20Token(web3=self.web3, address=Address('0x0123456789012345678901234567890123456789'))
@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+from fractions import Fraction
 from unittest.mock import Mock
 
 import pytest
@@ -23,7 +25,7 @@ from web3 import Web3
 
 from keeper.api import Address, Wad
 from keeper.api.approval import directly
-from keeper.api.oasis import SimpleMarket, ExpiringMarket, MatchingMarket
+from keeper.api.oasis import SimpleMarket, ExpiringMarket, MatchingMarket, DeadOffers, OfferInfo, OfferColumns
 from keeper.api.token import DSToken
 from tests.api.helpers import wait_until_mock_called
 
@@ -125,6 +127,160 @@ class GeneralMarketTest:
         assert self.otc.active_offers() == []
         assert self.otc.get_last_offer_id() == 1
 
+    def test_active_offers_in_batches(self):
+        # given
+        self.otc.approve([self.token1], directly())
+        for i in range(5):
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.kill(2).transact(gas=4000000)
+
+        # expect
+        assert [offer.offer_id for offer in self.otc.active_offers(batch_size=2)] == [1, 3, 4, 5]
+        assert self.otc.active_offers(batch_size=2) == self.otc.active_offers()
+
+    def test_active_offers_should_not_read_inactive_offers_again(self):
+        # given
+        self.otc.approve([self.token1], directly())
+        for i in range(3):
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.kill(2).transact(gas=4000000)
+        self.otc.active_offers()
+
+        # when
+        self.otc.get_offer = Mock(wraps=self.otc.get_offer)
+        offers = self.otc.active_offers()
+
+        # then
+        assert [offer.offer_id for offer in offers] == [1, 3]
+        assert set(call[0][0] for call in self.otc.get_offer.call_args_list) == {1, 3}
+
+    def test_active_offers_should_start_above_the_dead_offers_watermark(self):
+        # given
+        self.otc.approve([self.token1], directly())
+        for i in range(4):
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.kill(1).transact(gas=4000000)
+        self.otc.kill(2).transact(gas=4000000)
+        self.otc.kill(4).transact(gas=4000000)
+        self.otc.active_offers()
+
+        # when
+        self.otc.get_offer = Mock(wraps=self.otc.get_offer)
+        offers = self.otc.active_offers()
+
+        # then
+        assert [offer.offer_id for offer in offers] == [3]
+        assert self.otc._none_offers.watermark == 2
+        assert self.otc._none_offers.above_watermark() == [4]
+        assert set(call[0][0] for call in self.otc.get_offer.call_args_list) == {3}
+
+    def test_offer_book(self):
+        # given
+        self.otc.approve([self.token1, self.token2], directly())
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(3),
+                      want_token=self.token2.address, want_amount=Wad.from_number(4)).transact()
+
+        # expect
+        assert self.otc.offer_book().offers() == [self.otc.get_offer(1), self.otc.get_offer(2)]
+
+        # when
+        self.otc.make(have_token=self.token2.address, have_amount=Wad.from_number(5),
+                      want_token=self.token1.address, want_amount=Wad.from_number(10)).transact()
+        self.otc.take(1, Wad.from_number(0.25)).transact()
+        self.otc.kill(2).transact(gas=4000000)
+
+        # then
+        offers = self.otc.offer_book().offers()
+        assert offers == self.otc.active_offers()
+        assert offers[0].offer_id == 1
+        assert offers[0].sell_how_much == Wad.from_number(0.75)
+        assert offers[1].offer_id == 3
+        assert offers[1].owner == self.our_address
+
+    def test_offer_book_should_only_read_offers_touched_by_events(self):
+        # given
+        self.otc.approve([self.token1, self.token2], directly())
+        for i in range(3):
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.offer_book().offers()
+
+        # when
+        self.otc.get_offer = Mock(wraps=self.otc.get_offer)
+        self.otc.take(2, Wad.from_number(1)).transact()
+        offers = self.otc.offer_book().offers()
+
+        # then
+        assert offers == [self.otc.get_offer(1), self.otc.get_offer(3)]
+        assert set(call[0][0] for call in self.otc.get_offer.call_args_list) == {2, 1, 3}
+        assert self.otc.get_offer.call_args_list[0][0][0] == 2
+
+    def test_offer_book_should_read_the_whole_book_again_if_filter_is_lost(self):
+        # given
+        self.otc.approve([self.token1], directly())
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        assert len(self.otc.offer_book().offers()) == 1
+
+        # when
+        for filter_id in self.otc.offer_book()._filter_ids:
+            self.web3.eth.uninstallFilter(filter_id)
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+
+        # then
+        assert self.otc.offer_book().offers() == [self.otc.get_offer(1), self.otc.get_offer(2)]
+
+    def test_offer_book_columns(self):
+        # given
+        self.otc.approve([self.token1, self.token2], directly())
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.make(have_token=self.token2.address, have_amount=Wad.from_number(3),
+                      want_token=self.token1.address, want_amount=Wad.from_number(4)).transact()
+
+        # when
+        columns = self.otc.offer_book().columns()
+
+        # then
+        assert list(columns) == self.otc.active_offers()
+        assert list(columns.offer_ids) == [1, 2]
+        assert columns.sell_how_much == [Wad.from_number(1).value, Wad.from_number(3).value]
+        assert columns.tokens == [self.token1.address, self.token2.address]
+        assert list(columns.sell_which_token) == [0, 1]
+        assert list(columns.buy_which_token) == [1, 0]
+        assert columns.owners == [self.our_address]
+
+        # and
+        assert columns.select(sell_token=self.token1.address) == [self.otc.get_offer(1)]
+        assert columns.select(buy_token=self.token1.address, owner=self.our_address) == [self.otc.get_offer(2)]
+        assert columns.select(owner=Address('0x0101010101010101010101010101010101010101')) == []
+        assert columns.select(tokens=[self.token1.address, self.token2.address]) == list(columns)
+        assert columns.select(tokens=[self.token1.address]) == []
+
+    def test_offer_book_columns_should_be_updated_in_place(self):
+        # given
+        self.otc.approve([self.token1], directly())
+        for i in range(3):
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        columns = self.otc.offer_book().columns()
+
+        # when
+        self.otc.kill(1).transact(gas=4000000)
+        self.otc.take(3, Wad.from_number(0.5)).transact()
+
+        # then
+        assert self.otc.offer_book().columns() is columns
+        assert sorted(columns.offer_ids) == [2, 3]
+        assert columns.get(3).sell_how_much == Wad.from_number(0.5)
+        assert sorted(columns, key=lambda offer: offer.offer_id) == self.otc.active_offers()
+
     def test_no_past_events_on_startup(self):
         assert self.otc.past_make(PAST_BLOCKS) == []
         assert self.otc.past_bump(PAST_BLOCKS) == []
@@ -340,10 +496,315 @@ class TestMatchingMarket(GeneralMarketTest):
         assert self.otc.get_offer(6).owner == self.our_address
         assert self.otc.get_offer(6).timestamp != 0
 
+    def test_order_book(self):
+        # given
+        self.otc.approve([self.token1], directly())
+        for want_amount in [2, 2.2, 1.8, 2.1, 1.9]:
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(want_amount)).transact()
+
+        # expect
+        assert self.otc.get_offer_count(self.token1.address, self.token2.address) == 5
+        assert self.otc.get_best_offer(self.token1.address, self.token2.address) == 3
+        assert self.otc.get_worse_offer(3) == 5
+
+        # and
+        assert [offer.offer_id for offer in self.otc.order_book(self.token1.address, self.token2.address, depth=5)] \
+               == [3, 5, 1, 4, 2]
+        assert self.otc.order_book(self.token1.address, self.token2.address, depth=2) \
+               == [self.otc.get_offer(3), self.otc.get_offer(5)]
+        assert self.otc.order_book(self.token2.address, self.token1.address, depth=2) == []
+
+    def test_offer_book_limited_to_tokens(self):
+        # given
+        token3 = DSToken.deploy(self.web3, 'CCC')
+        token3.mint(Wad.from_number(10000)).transact()
+        self.otc.add_token_pair_whitelist(token3.address, self.token1.address).transact()
+        self.otc.approve([self.token1, token3], directly())
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.make(have_token=token3.address, have_amount=Wad.from_number(1),
+                      want_token=self.token1.address, want_amount=Wad.from_number(2)).transact()
+
+        # expect
+        assert self.otc.active_pair_offers([self.token1.address, self.token2.address]) == [self.otc.get_offer(1)]
+        assert self.otc.offer_book(tokens=[self.token1.address, self.token2.address]).offers() \
+               == [self.otc.get_offer(1)]
+
+        # when
+        self.otc.get_offer = Mock(wraps=self.otc.get_offer)
+        self.otc.make(have_token=token3.address, have_amount=Wad.from_number(1),
+                      want_token=self.token1.address, want_amount=Wad.from_number(3), pos=0).transact()
+        self.otc.kill(2).transact(gas=4000000)
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(3)).transact()
+        offers = self.otc.offer_book().offers()
+
+        # then
+        assert [offer.offer_id for offer in offers] == [1, 4]
+        assert set(call[0][0] for call in self.otc.get_offer.call_args_list) == {4}
+
+    def test_active_pair_offers_should_not_read_offers_of_other_pairs(self):
+        # given
+        token3 = DSToken.deploy(self.web3, 'CCC')
+        token3.mint(Wad.from_number(10000)).transact()
+        self.otc.add_token_pair_whitelist(token3.address, self.token1.address).transact()
+        self.otc.approve([self.token1, token3], directly())
+        self.otc.make(have_token=token3.address, have_amount=Wad.from_number(1),
+                      want_token=self.token1.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+
+        # when
+        self.otc.get_offer = Mock(wraps=self.otc.get_offer)
+        offers = self.otc.active_pair_offers([self.token1.address, self.token2.address])
+
+        # then
+        assert [offer.offer_id for offer in offers] == [2]
+        assert [call[0][0] for call in self.otc.get_offer.call_args_list] == [2]
+
+        # and
+        assert self.otc.active_pair_offers([self.token1.address, token3.address], owner=self.our_address) \
+            == [self.otc.get_offer(1)]
+        assert self.otc.active_pair_offers([self.token1.address, token3.address],
+                                           owner=Address('0x0101010101010101010101010101010101010101')) == []
+
+    def test_active_pair_offers_should_be_read_in_batches(self):
+        # given
+        self.otc.approve([self.token1, self.token2], directly())
+        for i in range(3):
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(2 + i)).transact()
+        self.otc.make(have_token=self.token2.address, have_amount=Wad.from_number(1),
+                      want_token=self.token1.address, want_amount=Wad.from_number(2)).transact()
+
+        # when
+        self.otc.get_worse_offer = Mock(wraps=self.otc.get_worse_offer)
+        offers = self.otc.active_pair_offers([self.token1.address, self.token2.address])
+
+        # then
+        assert [offer.offer_id for offer in offers] == [1, 2, 3, 4]
+        assert self.otc.get_worse_offer.call_count == 0
+
+    def test_order_books_should_skip_pairs_without_offers(self):
+        # given
+        self.otc.approve([self.token1], directly())
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+
+        # when
+        self.otc.get_best_offer = Mock(wraps=self.otc.get_best_offer)
+        self.otc.get_worse_offer = Mock(wraps=self.otc.get_worse_offer)
+        order_books = self.otc.order_books([(self.token1.address, self.token2.address),
+                                            (self.token2.address, self.token1.address)], depth=5)
+
+        # then
+        assert order_books == [[self.otc.get_offer(1)], []]
+        assert all(call[0] == (self.token1.address, self.token2.address)
+                   for call in self.otc.get_best_offer.call_args_list)
+        assert self.otc.get_worse_offer.call_count == 0
+
     def test_should_have_printable_representation(self):
         assert repr(self.otc) == f"MatchingMarket('{self.otc.address}')"
 
 
+class TestOfferColumns:
+    def offer(self, offer_id: int, sell_how_much: float, owner: Address) -> OfferInfo:
+        return OfferInfo(offer_id=offer_id,
+                         sell_how_much=Wad.from_number(sell_how_much),
+                         sell_which_token=Address('0x0101010101010101010101010101010101010101'),
+                         buy_how_much=Wad.from_number(1),
+                         buy_which_token=Address('0x0202020202020202020202020202020202020202'),
+                         owner=owner,
+                         timestamp=offer_id)
+
+    def test_should_move_last_offer_into_place_of_removed_one(self):
+        # given
+        owner1 = Address('0x0303030303030303030303030303030303030303')
+        owner2 = Address('0x0404040404040404040404040404040404040404')
+        columns = OfferColumns([self.offer(1, 1, owner1), self.offer(2, 2, owner2), self.offer(3, 3, owner1)])
+
+        # when
+        columns.remove(1)
+
+        # then
+        assert len(columns) == 2
+        assert list(columns.offer_ids) == [3, 2]
+        assert columns.sell_how_much == [Wad.from_number(3).value, Wad.from_number(2).value]
+        assert 1 not in columns
+        assert columns.get(1) is None
+        assert columns.get(3).sell_how_much == Wad.from_number(3)
+        assert [offer.offer_id for offer in columns.select(owner=owner1)] == [3]
+
+        # when
+        columns.remove(2)
+        columns.append(self.offer(4, 4, owner2))
+
+        # then
+        assert list(columns.offer_ids) == [3, 4]
+        assert [offer.offer_id for offer in columns.select(owner=owner2)] == [4]
+
+    def test_should_replace_offer_in_place(self):
+        # given
+        owner = Address('0x0303030303030303030303030303030303030303')
+        columns = OfferColumns([self.offer(1, 1, owner), self.offer(2, 2, owner)])
+
+        # when
+        columns.replace(self.offer(1, 0.5, owner))
+
+        # then
+        assert list(columns.offer_ids) == [1, 2]
+        assert columns.get(1).sell_how_much == Wad.from_number(0.5)
+        assert columns[0].sell_how_much == Wad.from_number(0.5)
+        assert columns.get(2).sell_how_much == Wad.from_number(2)
+
+
+class TestDeadOffers:
+    def test_should_move_watermark_when_lowest_ids_become_contiguous(self):
+        # given
+        dead_offers = DeadOffers()
+
+        # when
+        dead_offers.update([2, 3, 5])
+
+        # then
+        assert dead_offers.watermark == 0
+        assert dead_offers.above_watermark() == [2, 3, 5]
+        assert 1 not in dead_offers
+        assert 2 in dead_offers
+        assert 4 not in dead_offers
+
+        # when
+        dead_offers.add(1)
+
+        # then
+        assert dead_offers.watermark == 3
+        assert dead_offers.above_watermark() == [5]
+        assert 1 in dead_offers
+        assert len(dead_offers) == 4
+
+    def test_should_add_all_offers_up_to_watermark(self):
+        # given
+        dead_offers = DeadOffers()
+        dead_offers.update([5, 9])
+
+        # when
+        dead_offers.add_up_to(4)
+
+        # then
+        assert dead_offers.watermark == 5
+        assert dead_offers.above_watermark() == [9]
+        assert len(dead_offers) == 6
+
+    def test_should_add_all_offers_up_to_watermark_except_the_ones_given(self):
+        # given
+        dead_offers = DeadOffers()
+
+        # when
+        dead_offers.add_up_to(9, excluding=[3, 7, 12])
+
+        # then
+        assert dead_offers.watermark == 2
+        assert dead_offers.highest() == 9
+        assert dead_offers.above_watermark() == [4, 5, 6, 8, 9]
+
+    def test_should_list_offers_not_known_to_be_inactive(self):
+        # given
+        dead_offers = DeadOffers()
+        dead_offers.update(range(2, 20001))
+
+        # expect
+        assert dead_offers.watermark == 0
+        assert dead_offers.unknown(20003) == [1, 20001, 20002, 20003]
+        assert dead_offers.unknown(0) == []
+
+        # when
+        dead_offers.add(1)
+
+        # then
+        assert dead_offers.unknown(20000) == []
+
+
+class TestOfferBookSnapshot:
+    def setup_method(self):
+        self.web3 = Web3(EthereumTesterProvider())
+        self.web3.eth.defaultAccount = self.web3.eth.accounts[0]
+        self.token1 = DSToken.deploy(self.web3, 'AAA')
+        self.token1.mint(Wad.from_number(10000)).transact()
+        self.token2 = DSToken.deploy(self.web3, 'BBB')
+        self.otc = SimpleMarket.deploy(self.web3)
+        self.otc.approve([self.token1], directly())
+        for i in range(3):
+            self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                          want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.kill(2).transact(gas=4000000)
+
+    def restarted_market(self) -> SimpleMarket:
+        otc = SimpleMarket(web3=self.web3, address=self.otc.address)
+        otc.active_offers = Mock(wraps=otc.active_offers)
+        return otc
+
+    def test_should_save_snapshot(self, tmpdir):
+        # given
+        snapshot_file = str(tmpdir.join('snapshot.json'))
+
+        # when
+        self.otc.offer_book(snapshot_file).offers()
+
+        # then
+        with open(snapshot_file) as file:
+            snapshot = json.load(file)
+        assert snapshot['market'] == self.otc.address.address
+        assert snapshot['block_number'] == self.web3.eth.blockNumber
+        assert snapshot['block_hash'] == self.web3.eth.getBlock('latest')['hash']
+        assert snapshot['dead_offers_up_to'] == 2
+        assert snapshot['dead_offers_except'] == [1]
+        assert [offer[0] for offer in snapshot['offers']] == [1, 3]
+
+    def test_should_resume_from_snapshot(self, tmpdir):
+        # given
+        snapshot_file = str(tmpdir.join('snapshot.json'))
+        self.otc.offer_book(snapshot_file).offers()
+
+        # and
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                      want_token=self.token2.address, want_amount=Wad.from_number(2)).transact()
+        self.otc.kill(1).transact(gas=4000000)
+
+        # when
+        otc = self.restarted_market()
+        offers = otc.offer_book(snapshot_file).offers()
+
+        # then
+        assert offers == self.otc.active_offers()
+        assert [offer.offer_id for offer in offers] == [3, 4]
+        assert offers[0].sell_how_much == Wad.from_number(1)
+        assert offers[0].owner == Address(self.web3.eth.defaultAccount)
+        assert otc.active_offers.call_count == 0
+        assert otc._none_offers.watermark == 2
+        assert otc._none_offers.above_watermark() == []
+
+    def test_should_read_the_whole_book_if_snapshot_block_is_not_canonical(self, tmpdir):
+        # given
+        snapshot_file = str(tmpdir.join('snapshot.json'))
+        self.otc.offer_book(snapshot_file).offers()
+
+        # and
+        with open(snapshot_file) as file:
+            snapshot = json.load(file)
+        snapshot['block_hash'] = '0x' + '00' * 32
+        with open(snapshot_file, 'w') as file:
+            json.dump(snapshot, file)
+
+        # when
+        otc = self.restarted_market()
+        offers = otc.offer_book(snapshot_file).offers()
+
+        # then
+        assert [offer.offer_id for offer in offers] == [1, 3]
+        assert otc.active_offers.call_count == 1
+
+
 class TestMatchingMarketPosition:
     def setup_method(self):
         self.web3 = Web3(EthereumTesterProvider())
@@ -365,6 +826,149 @@ class TestMatchingMarketPosition:
         assert self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
                                  want_token=self.token2.address, want_amount=Wad.from_number(35)) == 4
 
+    def test_should_calculate_order_position_after_offers_change(self):
+        # given
+        assert self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                                 want_token=self.token2.address, want_amount=Wad.from_number(35)) == 4
+
+        # when
+        self.otc.kill(4).transact(gas=4000000)
+
+        # then
+        assert self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                                 want_token=self.token2.address, want_amount=Wad.from_number(35)) == 6
+
+    def test_should_calculate_order_position_without_excluded_offers(self):
+        # expect
+        assert self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                                 want_token=self.token2.address, want_amount=Wad.from_number(35),
+                                 excluding=[4]) == 6
+
+        # and
+        self.otc.offer_book(tokens=[self.token1.address, self.token2.address])
+        assert self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                                 want_token=self.token2.address, want_amount=Wad.from_number(35),
+                                 excluding=[4, 6]) == 9
+
+    def test_should_calculate_order_position_at_the_end(self):
+        # expect
+        assert self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                                 want_token=self.token2.address, want_amount=Wad.from_number(5)) == 0
+        assert self.otc.position(have_token=self.token2.address, have_amount=Wad.from_number(1),
+                                 want_token=self.token1.address, want_amount=Wad.from_number(5)) == 0
+
+    def test_should_calculate_order_position_without_creating_offer_book(self):
+        # when
+        position = self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                                     want_token=self.token2.address, want_amount=Wad.from_number(35))
+
+        # then
+        assert position == 4
+        assert self.otc.offer_book(tokens=[self.token1.address, self.token2.address]).tokens \
+            == [self.token1.address, self.token2.address]
+
+    def test_should_calculate_order_position_using_offer_book(self):
+        # given
+        offer_book = self.otc.offer_book(tokens=[self.token1.address, self.token2.address])
+        offer_book.update()
+
+        # when
+        self.otc.get_offer = Mock(wraps=self.otc.get_offer)
+        position = self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
+                                     want_token=self.token2.address, want_amount=Wad.from_number(35))
+
+        # then
+        assert position == 4
+        assert self.otc.get_offer.call_count == 0
+
+    def test_offer_book_should_not_be_reconfigured(self):
+        # given
+        offer_book = self.otc.offer_book(tokens=[self.token1.address, self.token2.address])
+
+        # expect
+        assert self.otc.offer_book() is offer_book
+        assert self.otc.offer_book(tokens=[self.token2.address, self.token1.address]) is offer_book
+
+        # and
+        with pytest.raises(Exception):
+            self.otc.offer_book(tokens=[self.token1.address])
+        with pytest.raises(Exception):
+            self.otc.offer_book(snapshot_file='offer-book.json')
+
+    def test_should_order_offers_by_price(self):
+        # given
+        offer_book = self.otc.offer_book()
+
+        # expect
+        assert offer_book.best_offer(self.token1.address, self.token2.address).offer_id == 1
+        assert offer_book.worst_offer(self.token1.address, self.token2.address).offer_id == 2
+        assert [offer.offer_id for offer in offer_book.pair_offers(self.token1.address, self.token2.address)] \
+            == [1, 9, 6, 4, 5, 3, 7, 8, 2]
+        assert [offer.offer_id for offer in offer_book.offers_in_price_range(self.token1.address,
+                                                                             self.token2.address,
+                                                                             Fraction(1, 45),
+                                                                             Fraction(1, 34))] == [7, 3, 5, 4]
+
+        # and
+        assert offer_book.best_offer(self.token2.address, self.token1.address) is None
+        assert offer_book.pair_offers(self.token2.address, self.token1.address) == []
+
+    def test_should_aggregate_depth_by_price_level(self):
+        # given
+        depth = self.otc.offer_book().depth(self.token1.address, self.token2.address)
+
+        # expect
+        assert len(depth) == 9
+        assert depth.levels()[0] == (Fraction(11), Wad.from_number(1), Wad.from_number(11))
+        assert depth.volume_up_to(Fraction(21)) == Wad.from_number(3)
+        assert depth.volume_up_to(Fraction(10)) == Wad(0)
+        assert depth.fill_price(Wad.from_number(2)) == Fraction(13)
+        assert depth.fill_price(Wad.from_number(2.5)) == Fraction(73, 5)
+        assert depth.fill_price(Wad.from_number(10)) is None
+
+        # when
+        self.otc.take(1, Wad.from_number(1)).transact()
+
+        # then
+        assert self.otc.offer_book().depth(self.token1.address, self.token2.address) is depth
+        assert len(depth) == 8
+        assert depth.volume_up_to(Fraction(21)) == Wad.from_number(2)
+        assert depth.fill_price(Wad.from_number(2)) == Fraction(18)
+
+        # and
+        assert len(self.otc.offer_book().depth(self.token2.address, self.token1.address)) == 0
+
+    def test_should_aggregate_depth_of_one_owner(self):
+        # given
+        depth = self.otc.offer_book().depth(self.token1.address, self.token2.address, owner=self.our_address)
+        other_depth = self.otc.offer_book().depth(self.token1.address, self.token2.address,
+                                                  owner=Address(self.web3.eth.accounts[1]))
+
+        # expect
+        assert depth.volume() == Wad.from_number(9)
+        assert other_depth.volume() == Wad(0)
+
+        # when
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(2),
+                      want_token=self.token2.address, want_amount=Wad.from_number(50)).transact()
+
+        # then
+        assert self.otc.offer_book().depth(self.token1.address, self.token2.address, owner=self.our_address) is depth
+        assert depth.volume() == Wad.from_number(11)
+        assert other_depth.volume() == Wad(0)
+
+    def test_should_list_the_largest_offer_of_each_price_level(self):
+        # given
+        self.otc.make(have_token=self.token1.address, have_amount=Wad.from_number(2),
+                      want_token=self.token2.address, want_amount=Wad.from_number(22)).transact()
+
+        # when
+        offers = self.otc.offer_book().level_offers(self.token1.address, self.token2.address)
+
+        # then
+        assert [offer.offer_id for offer in offers] == [10, 9, 6, 4, 5, 3, 7, 8, 2]
+        assert offers[0].sell_how_much == Wad.from_number(2)
+
     def test_should_use_correct_order_position_by_default(self):
         # when
         explicit_position = self.otc.position(have_token=self.token1.address, have_amount=Wad.from_number(1),
@@ -0,0 +1,480 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+import requests
+from web3 import EthereumTesterProvider
+from web3 import Web3
+
+from keeper.api.numeric import Wad
+from keeper.api.provider import PooledHTTPProvider, HedgedHTTPProvider, AdaptiveLimiter, LimitedProvider, \
+    EndpointStats
+from keeper.api.token import DSToken
+from tests.api.helpers import JsonRpcServer
+
+
+class TestPooledHTTPProvider:
+    def setup_method(self):
+        self.release = threading.Event()
+
+        def handler(method, params):
+            if method == 'eth_call':
+                self.release.wait(5)
+                return '0x01'
+            elif method == 'eth_blockNumber':
+                return '0x10'
+            elif method == 'eth_getFilterChanges':
+                return []
+            elif method == 'eth_sendTransaction':
+                return '0x' + '00' * 32
+            elif method == 'eth_syncing':
+                time.sleep(2)
+                return False
+            else:
+                raise Exception(f"Unknown method {method}")
+
+        self.server = JsonRpcServer(handler)
+
+    def teardown_method(self):
+        self.release.set()
+        self.server.stop()
+
+    def test_should_make_requests(self):
+        # given
+        web3 = Web3(PooledHTTPProvider(self.server.endpoint_uri))
+
+        # expect
+        assert web3.eth.blockNumber == 16
+        assert web3.currentProvider.endpoint_uri == self.server.endpoint_uri
+
+    def test_should_raise_errors(self):
+        # given
+        web3 = Web3(PooledHTTPProvider(self.server.endpoint_uri))
+
+        # expect
+        with pytest.raises(ValueError):
+            web3.eth.gasPrice
+
+    def test_should_keep_connections_alive(self):
+        # given
+        web3 = Web3(PooledHTTPProvider(self.server.endpoint_uri))
+
+        # when
+        for i in range(10):
+            assert web3.eth.blockNumber == 16
+
+        # then
+        assert len(self.server.connections) == 1
+
+    def test_should_not_queue_filter_polling_behind_calls(self):
+        # given
+        provider = PooledHTTPProvider(self.server.endpoint_uri, pool_size=2)
+        threads = [threading.Thread(target=provider.make_request, args=('eth_call', [{}, 'latest']))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+
+        # when
+        start = time.time()
+        provider.make_request('eth_getFilterChanges', ['0x1'])
+        provider.make_request('eth_sendTransaction', [{}])
+
+        # then
+        assert time.time() - start < 1.0
+        assert len([request for request in self.server.requests if request[0] == 'eth_call']) == 2
+
+        # cleanup
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_should_time_out(self):
+        # given
+        provider = PooledHTTPProvider(self.server.endpoint_uri, timeout=0.5)
+
+        # expect
+        with pytest.raises(requests.exceptions.Timeout):
+            provider.make_request('eth_syncing', [])
+
+    def test_should_make_batch_requests(self):
+        # given
+        provider = PooledHTTPProvider(self.server.endpoint_uri)
+
+        # when
+        responses = provider.make_batch_request([('eth_blockNumber', []), ('eth_gasPrice', [])])
+
+        # then
+        assert responses[0]['result'] == '0x10'
+        assert 'error' in responses[1]
+        assert len(self.server.connections) == 1
+
+
+class TestHedgedHTTPProvider:
+    def setup_method(self):
+        self.delays = {}
+
+        def node(name):
+            def handler(method, params):
+                time.sleep(self.delays.get(name, 0))
+                if method in ['eth_gasPrice', 'eth_blockNumber', 'eth_getTransactionCount']:
+                    return name
+                else:
+                    raise Exception(f"Unknown method {method}")
+            return JsonRpcServer(handler)
+
+        self.first = node('0x1')
+        self.second = node('0x2')
+        self.provider = HedgedHTTPProvider([self.first.endpoint_uri, self.second.endpoint_uri],
+                                           hedge_delay=0.2, max_failures=1, timeout=2)
+
+    def teardown_method(self):
+        self.first.stop()
+        self.second.stop()
+
+    def gas_price(self) -> int:
+        return Web3(self.provider).eth.gasPrice
+
+    def test_should_expose_first_endpoint(self):
+        # expect
+        assert self.provider.endpoint_uri == self.first.endpoint_uri
+
+    def test_should_pass_pool_size_and_timeout_to_endpoints(self):
+        # given
+        provider = HedgedHTTPProvider([self.first.endpoint_uri, self.second.endpoint_uri], pool_size=3, timeout=0.5)
+        self.delays['0x1'] = 1.0
+        loop = asyncio.new_event_loop()
+
+        # expect
+        assert all(endpoint.pool_size == 3 and endpoint.call_pool[1] == 0.5 for endpoint in provider.providers)
+
+        # when
+        # the pinned request times out on the non-blocking client as well
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                loop.run_until_complete(provider.make_request_async('eth_blockNumber', []))
+        finally:
+            loop.close()
+
+    def test_should_use_fastest_endpoint(self):
+        # given
+        self.delays['0x1'] = 0.1
+
+        # when
+        self.gas_price()
+        self.gas_price()
+
+        # then
+        assert self.gas_price() == 2
+        stats = self.provider.endpoint_stats()
+        assert stats[0].latency > stats[1].latency
+
+    def test_should_hedge_slow_requests(self):
+        # given
+        self.delays['0x2'] = 0.1
+        for i in range(3):
+            self.gas_price()
+        assert self.gas_price() == 1
+
+        # when
+        self.delays['0x1'] = 1.0
+        self.delays['0x2'] = 0.0
+        start = time.time()
+        gas_price = self.gas_price()
+
+        # then
+        assert gas_price == 2
+        assert time.time() - start < 0.8
+
+    def test_should_fail_over_to_healthy_endpoint(self):
+        # given
+        self.first.stop()
+
+        # when
+        gas_prices = [self.gas_price() for i in range(3)]
+
+        # then
+        assert gas_prices == [2, 2, 2]
+        stats = self.provider.endpoint_stats()
+        assert stats[0].failures == 1
+        assert stats[0].consecutive_failures == 1
+        assert stats[1].failures == 0
+
+    def test_should_pin_transaction_methods_to_first_endpoint(self):
+        # given
+        self.delays['0x1'] = 0.5
+
+        # expect
+        assert Web3(self.provider).eth.getTransactionCount('0x0000000000000000000000000000000000000000') == 1
+        assert len(self.second.requests) == 0
+
+    def test_should_pin_block_number_to_first_endpoint(self):
+        # given
+        self.delays['0x1'] = 0.5
+
+        # expect
+        assert Web3(self.provider).eth.blockNumber == 1
+        assert len(self.second.requests) == 0
+
+    def test_should_raise_if_all_endpoints_fail(self):
+        # given
+        self.first.stop()
+        self.second.stop()
+
+        # expect
+        with pytest.raises(requests.exceptions.ConnectionError):
+            self.gas_price()
+
+
+class TestEndpointStats:
+    def test_should_average_latency_of_successful_requests(self):
+        # given
+        stats = EndpointStats('http://localhost:8545')
+
+        # when
+        stats.record(1.0, False)
+        stats.record(2.0, False)
+
+        # then
+        assert stats.requests == 2
+        assert stats.failures == 0
+        assert stats.latency == pytest.approx(1.3)
+
+    def test_should_take_first_successful_latency_directly_after_failures(self):
+        # given
+        stats = EndpointStats('http://localhost:8545')
+
+        # when
+        stats.record(5.0, True)
+        stats.record(1.0, False)
+
+        # then
+        assert stats.requests == 2
+        assert stats.failures == 1
+        assert stats.consecutive_failures == 0
+        assert stats.latency == 1.0
+
+
+class TestAdaptiveLimiter:
+    def test_should_increase_limit_additively_on_success(self):
+        # given
+        limiter = AdaptiveLimiter(initial_limit=4, max_limit=5)
+
+        # when
+        for i in range(4):
+            limiter.acquire(False)
+            limiter.release(0.01, False)
+
+        # then
+        assert int(limiter.limit) == 4
+        assert limiter.limit > 4.9
+
+        # when
+        for i in range(10):
+            limiter.acquire(False)
+            limiter.release(0.01, False)
+
+        # then
+        assert limiter.limit == 5
+        assert limiter.in_flight == 0
+
+    def test_should_decrease_limit_multiplicatively_on_failures_and_slow_requests(self):
+        # given
+        limiter = AdaptiveLimiter(initial_limit=16, target_latency=0.1)
+
+        # when
+        limiter.acquire(False)
+        limiter.release(0.01, True)
+
+        # then
+        assert limiter.limit == 8
+
+        # when
+        limiter.acquire(False)
+        limiter.release(0.5, False)
+
+        # then
+        assert limiter.limit == 8
+
+        # when
+        time.sleep(0.15)
+        limiter.acquire(False)
+        limiter.release(0.5, False)
+
+        # then
+        assert limiter.limit == 4
+
+    def test_should_not_decrease_below_minimum(self):
+        # given
+        limiter = AdaptiveLimiter(initial_limit=2, min_limit=2, target_latency=0.0)
+
+        # when
+        limiter.acquire(False)
+        limiter.release(1.0, True)
+
+        # then
+        assert limiter.limit == 2
+
+    def test_should_admit_high_priority_requests_above_limit(self):
+        # given
+        limiter = AdaptiveLimiter(initial_limit=1, reserve=1)
+        limiter.acquire(False)
+        low_priority_admitted = threading.Event()
+
+        def low_priority():
+            limiter.acquire(False)
+            low_priority_admitted.set()
+
+        threading.Thread(target=low_priority, daemon=True).start()
+
+        # when
+        limiter.acquire(True)
+
+        # then
+        assert limiter.in_flight == 2
+        assert not low_priority_admitted.wait(0.2)
+
+        # when
+        limiter.release(0.01, False)
+        limiter.release(0.01, False)
+
+        # then
+        assert low_priority_admitted.wait(1.0)
+
+
+    def test_should_acquire_asynchronously_without_blocking_the_event_loop(self):
+        # given
+        limiter = AdaptiveLimiter(initial_limit=1)
+        limiter.acquire(False)
+        loop = asyncio.new_event_loop()
+        ticks = []
+
+        async def tick():
+            while len(ticks) < 5:
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+
+        async def acquire():
+            await limiter.acquire_async(False)
+            return len(ticks)
+
+        # when
+        threading.Timer(0.2, limiter.release, args=(0.01, False)).start()
+        try:
+            ticks_before_admitted, _ = loop.run_until_complete(asyncio.gather(acquire(), tick(), loop=loop))
+        finally:
+            loop.close()
+
+        # then
+        assert ticks_before_admitted == 5
+        assert limiter.in_flight == 1
+
+class TestLimitedProvider:
+    def test_should_pass_requests_through_limiter(self):
+        # given
+        tester_web3 = Web3(EthereumTesterProvider())
+        tester_web3.eth.defaultAccount = tester_web3.eth.accounts[0]
+        token = DSToken.deploy(tester_web3, 'ABC')
+        token.mint(Wad(100)).transact()
+
+        # when
+        limiter = AdaptiveLimiter()
+        web3 = Web3(LimitedProvider(tester_web3.currentProvider, limiter))
+
+        # then
+        assert DSToken(web3=web3, address=token.address).total_supply() == Wad(100)
+        assert limiter.in_flight == 0
+        assert limiter.limit > 8
+
+    def test_should_pass_async_requests_through_limiter_and_wrapped_provider(self):
+        # given
+        server = JsonRpcServer(lambda method, params: '0x10')
+        limiter = AdaptiveLimiter()
+        provider = LimitedProvider(PooledHTTPProvider(server.endpoint_uri), limiter)
+        provider.provider.make_request = Mock(side_effect=Exception("Blocking transport used"))
+        loop = asyncio.new_event_loop()
+        try:
+            # when
+            response = loop.run_until_complete(provider.make_request_async('eth_blockNumber', []))
+
+            # then
+            assert response['result'] == '0x10'
+            assert limiter.in_flight == 0
+        finally:
+            loop.close()
+            server.stop()
+
+    def test_should_pass_transactions_through_limiter(self):
+        # given
+        tester_web3 = Web3(EthereumTesterProvider())
+        token = DSToken.deploy(tester_web3, 'ABC')
+        limiter = AdaptiveLimiter()
+        limiter.acquire = Mock(wraps=limiter.acquire)
+        web3 = Web3(LimitedProvider(tester_web3.currentProvider, limiter))
+        web3.eth.defaultAccount = tester_web3.eth.accounts[0]
+
+        # when
+        receipt = DSToken(web3=web3, address=token.address).mint(Wad(100)).transact()
+
+        # then
+        assert receipt is not None
+        assert limiter.acquire.call_count > 0
+        assert limiter.acquire.call_args_list.count(((True,), {})) > 0
+        assert limiter.in_flight == 0
+
+    def test_should_not_wait_for_slots_held_by_async_requests_of_the_same_thread(self):
+        # given
+        server = JsonRpcServer(lambda method, params: '0x10')
+        limiter = AdaptiveLimiter(initial_limit=1, reserve=0)
+        provider = LimitedProvider(PooledHTTPProvider(server.endpoint_uri), limiter)
+        loop = asyncio.new_event_loop()
+
+        async def request_holding_slot():
+            await limiter.acquire_async(False)
+            try:
+                return provider.make_request('eth_blockNumber', [])
+            finally:
+                limiter.release_async(0.01, False)
+
+        try:
+            # when
+            response = loop.run_until_complete(request_holding_slot())
+
+            # then
+            assert response['result'] == '0x10'
+            assert limiter.in_flight == 0
+            assert not limiter.held_asynchronously()
+        finally:
+            loop.close()
+            server.stop()
+
+    def test_should_expose_attributes_of_wrapped_provider(self):
+        # given
+        server = JsonRpcServer(lambda method, params: '0x10')
+        try:
+            provider = LimitedProvider(PooledHTTPProvider(server.endpoint_uri), AdaptiveLimiter())
+
+            # expect
+            assert provider.endpoint_uri == server.endpoint_uri
+            assert Web3(provider).eth.blockNumber == 16
+        finally:
+            server.stop()
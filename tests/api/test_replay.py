@@ -0,0 +1,177 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+import pytest
+from web3 import EthereumTesterProvider
+from web3 import Web3
+
+from keeper.api import Address
+from keeper.api.batch import batch
+from keeper.api.numeric import Wad
+from keeper.api.replay import RecordingProvider, ReplayProvider
+from keeper.api.token import DSToken
+
+
+class SlowProvider(EthereumTesterProvider):
+    def make_request(self, method, params):
+        if method == 'eth_blockNumber':
+            time.sleep(0.2)
+        return super().make_request(method, params)
+
+
+class TestRecordAndReplay:
+    @pytest.fixture(params=['requests.jsonl', 'requests.jsonl.gz'])
+    def filename(self, request, tmpdir):
+        return str(tmpdir.join(request.param))
+
+    def setup_method(self):
+        self.tester_web3 = Web3(SlowProvider())
+        self.tester_web3.eth.defaultAccount = self.tester_web3.eth.accounts[0]
+        self.our_address = Address(self.tester_web3.eth.defaultAccount)
+        self.token = DSToken.deploy(self.tester_web3, 'ABC')
+        self.token.mint(Wad(1000)).transact()
+
+    def session(self, web3: Web3) -> list:
+        token = DSToken(web3=web3, address=self.token.address)
+        return [token.total_supply(),
+                token.balance_of(self.our_address),
+                web3.eth.blockNumber,
+                batch(web3, [token.total_supply, lambda: token.balance_of(self.our_address)])]
+
+    def record(self, filename: str) -> list:
+        provider = RecordingProvider(self.tester_web3.currentProvider, filename)
+        web3 = Web3(provider)
+        web3.eth.defaultAccount = self.our_address.address
+        try:
+            return self.session(web3)
+        finally:
+            provider.close()
+
+    def test_should_replay_recorded_session(self, filename):
+        # given
+        recorded = self.record(filename)
+
+        # when
+        web3 = Web3(ReplayProvider(filename))
+        web3.eth.defaultAccount = self.our_address.address
+        replayed = self.session(web3)
+
+        # then
+        assert replayed == recorded
+        assert replayed[0] == Wad(1000)
+        assert web3.currentProvider.requests == 6
+
+    def test_should_serve_repeated_requests_in_recorded_order(self, filename):
+        # given
+        provider = RecordingProvider(self.tester_web3.currentProvider, filename)
+        web3 = Web3(provider)
+        first_block_number = web3.eth.blockNumber
+        self.token.mint(Wad(1000)).transact()
+        second_block_number = web3.eth.blockNumber
+        provider.close()
+
+        # when
+        web3 = Web3(ReplayProvider(filename))
+
+        # then
+        assert web3.eth.blockNumber == first_block_number
+        assert web3.eth.blockNumber == second_block_number
+        assert web3.eth.blockNumber == second_block_number
+
+    def test_should_serve_responses_recorded_for_the_block_being_replayed(self, filename):
+        # given
+        provider = RecordingProvider(self.tester_web3.currentProvider, filename)
+        web3 = Web3(provider)
+        provider.new_block(1)
+        first_block_number = web3.eth.blockNumber
+        web3.eth.blockNumber
+        provider.new_block(2)
+        self.token.mint(Wad(1000)).transact()
+        second_block_number = web3.eth.blockNumber
+        provider.new_block(3)
+        provider.close()
+
+        # when
+        provider = ReplayProvider(filename)
+        web3 = Web3(provider)
+        provider.new_block(1)
+
+        # then
+        assert web3.eth.blockNumber == first_block_number
+
+        # when
+        provider.new_block(2)
+
+        # then
+        assert web3.eth.blockNumber == second_block_number
+
+        # when
+        # nothing has been recorded for this block, so responses of the previous one get served
+        provider.new_block(3)
+
+        # then
+        assert web3.eth.blockNumber == second_block_number
+
+    def test_should_not_repeat_filter_changes_once_exhausted(self, filename):
+        # given
+        provider = RecordingProvider(self.tester_web3.currentProvider, filename)
+        web3 = Web3(provider)
+        filter_id = web3.eth.filter('latest').filter_id
+        self.token.mint(Wad(1000)).transact()
+        recorded_changes = web3.eth.getFilterChanges(filter_id)
+        provider.close()
+
+        # when
+        web3 = Web3(ReplayProvider(filename))
+        assert web3.eth.filter('latest').filter_id == filter_id
+
+        # then
+        assert web3.eth.getFilterChanges(filter_id) == recorded_changes
+        assert len(recorded_changes) > 0
+        assert web3.eth.getFilterChanges(filter_id) == []
+        assert web3.eth.getFilterChanges(filter_id) == []
+
+    def test_should_fail_on_requests_not_recorded(self, filename):
+        # given
+        self.record(filename)
+
+        # when
+        web3 = Web3(ReplayProvider(filename))
+
+        # then
+        with pytest.raises(KeyError):
+            web3.eth.gasPrice
+
+    def test_should_replay_with_recorded_latency(self, filename):
+        # given
+        self.record(filename)
+
+        # when
+        zero_latency_web3 = Web3(ReplayProvider(filename, latency='zero'))
+        recorded_latency_web3 = Web3(ReplayProvider(filename, latency='recorded'))
+
+        # then
+        start = time.time()
+        zero_latency_web3.eth.blockNumber
+        assert time.time() - start < 0.1
+
+        # and
+        start = time.time()
+        recorded_latency_web3.eth.blockNumber
+        assert time.time() - start >= 0.2
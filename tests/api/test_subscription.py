@@ -0,0 +1,156 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from keeper.api import filter_thread_alive
+from keeper.api.subscription import NewHeadsSubscription
+
+
+class IpcNode:
+    """Local stand-in for an Ethereum node IPC endpoint supporting `eth_subscribe('newHeads')`."""
+    def __init__(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ipc_path = os.path.join(self.directory.name, 'node.ipc')
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.ipc_path)
+        self.server.listen(1)
+        self.connection = None
+
+    def accept(self, error=False):
+        self.connection, _ = self.server.accept()
+        request = json.loads(self.connection.recv(65536).decode('utf-8'))
+        assert request['method'] == 'eth_subscribe'
+        assert request['params'] == ['newHeads']
+        if error:
+            self.send({"jsonrpc": "2.0", "id": request['id'], "error": {"code": -32601, "message": "Not supported"}})
+        else:
+            self.send({"jsonrpc": "2.0", "id": request['id'], "result": "0xabc"})
+
+    def push_header(self, number: int, subscription: str = "0xabc"):
+        self.send({"jsonrpc": "2.0", "method": "eth_subscription",
+                   "params": {"subscription": subscription,
+                              "result": {"number": hex(number), "hash": "0x%064x" % number}}})
+
+    def send(self, message: dict):
+        self.connection.sendall(json.dumps(message).encode('utf-8'))
+
+    def send_split(self, message: dict, at: int):
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        self.connection.sendall(data[:at])
+        time.sleep(0.1)
+        self.connection.sendall(data[at:])
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        self.server.close()
+        self.directory.cleanup()
+
+
+def wait_until(condition, timeout=5.0):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(0.01)
+
+
+class TestNewHeadsSubscription:
+    def setup_method(self):
+        self.node = IpcNode()
+        self.headers = []
+
+    def teardown_method(self):
+        self.node.close()
+
+    def subscribe(self, error=False) -> NewHeadsSubscription:
+        threading.Thread(target=self.node.accept, kwargs={'error': error}).start()
+        subscription = NewHeadsSubscription(self.node.ipc_path, self.headers.append)
+        subscription.watch()
+        return subscription
+
+    def test_should_deliver_pushed_headers(self):
+        # given
+        subscription = self.subscribe()
+
+        # when
+        self.node.push_header(1)
+        self.node.push_header(2)
+        self.node.push_header(3, subscription="0xdef")
+        self.node.push_header(4)
+        wait_until(lambda: len(self.headers) == 3)
+
+        # then
+        assert [int(header['number'], 16) for header in self.headers] == [1, 2, 4]
+        assert self.headers[0]['hash'] == "0x%064x" % 1
+        assert filter_thread_alive(subscription)
+
+        # cleanup
+        subscription.stop_watching(timeout=5)
+
+    def test_should_decode_characters_split_across_reads(self):
+        # given
+        subscription = self.subscribe()
+        message = {"jsonrpc": "2.0", "method": "eth_subscription",
+                   "params": {"subscription": "0xabc",
+                              "result": {"number": hex(1), "extraData": "ééé"}}}
+
+        # when
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        self.node.send_split(message, at=data.index('é'.encode('utf-8')) + 1)
+        wait_until(lambda: len(self.headers) == 1)
+
+        # then
+        assert self.headers[0]['extraData'] == "ééé"
+        assert filter_thread_alive(subscription)
+
+        # cleanup
+        subscription.stop_watching(timeout=5)
+
+    def test_should_stop_watching(self):
+        # given
+        subscription = self.subscribe()
+
+        # when
+        subscription.stop_watching(timeout=5)
+
+        # then
+        assert not subscription.is_alive()
+        assert filter_thread_alive(subscription)
+
+    def test_should_be_detected_as_dead_when_connection_lost(self):
+        # given
+        subscription = self.subscribe()
+
+        # when
+        self.node.connection.close()
+        subscription.join(timeout=5)
+
+        # then
+        assert not subscription.is_alive()
+        assert not filter_thread_alive(subscription)
+
+    def test_should_fail_if_subscription_not_supported(self):
+        # expect
+        with pytest.raises(ValueError):
+            self.subscribe(error=True)
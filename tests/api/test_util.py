@@ -20,11 +20,13 @@ import time
 from unittest.mock import Mock, call
 
 import pytest
-from web3 import Web3
+from web3 import Web3, EthereumTesterProvider, IPCProvider
 
 from keeper.api import Address
 from keeper.api.util import synchronize, int_to_bytes32, bytes_to_int, bytes_to_hexstring, hexstring_to_bytes, \
-    AsyncCallback, chain, are_any_transactions_pending, next_nonce
+    AsyncCallback, chain, are_any_transactions_pending, next_nonce, is_tester
+from keeper.api.accounting import AccountingProvider, RpcAccounting
+from keeper.api.provider import LimitedProvider, AdaptiveLimiter
 
 
 async def async_return(result):
@@ -151,6 +153,18 @@ def test_next_nonce_should_generate_nonces_starting_from_last_transactions_nonce
     assert next_nonce(web3, some_account) == 9
 
 
+def test_is_tester_should_look_through_provider_wrappers():
+    # given
+    tester = EthereumTesterProvider()
+    ipc = IPCProvider('/tmp/nonexistent.ipc')
+
+    # expect
+    assert is_tester(Web3(tester))
+    assert is_tester(Web3(AccountingProvider(LimitedProvider(tester, AdaptiveLimiter()), RpcAccounting())))
+    assert not is_tester(Web3(ipc))
+    assert not is_tester(Web3(AccountingProvider(ipc, RpcAccounting())))
+
+
 def test_synchronize_should_return_empty_list_for_no_futures():
     assert synchronize([]) == []
 
@@ -322,3 +336,16 @@ class TestAsyncCallback:
 
         # then
         assert mock.mock_calls == [call.on_start(), call.callback(), call.on_finish()]
+
+    def test_should_call_on_finish_even_if_the_callback_failed(self, callbacks):
+        # given
+        mock = Mock()
+        mock.callback.side_effect = Exception("callback failed")
+
+        # when
+        async_callback = AsyncCallback(mock.callback)
+        async_callback.trigger(mock.on_start, mock.on_finish)
+        async_callback.wait()
+
+        # then
+        assert mock.mock_calls == [call.on_start(), call.callback(), call.on_finish()]
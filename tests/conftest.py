@@ -19,85 +19,21 @@ import os
 import sys
 sys.path.append(os.path.dirname(__file__) + "/../..")
 
-import json
-
-import pkg_resources
 import pytest
 
-from keeper.api import Address
-from keeper.api import Wad
-from keeper.api.approval import directly
-from keeper.api.auth import DSGuard
-from keeper.api.feed import DSValue
-from keeper.api.sai import Tub, Tap, Top
-from keeper.api.token import DSToken
-from keeper.api.vault import DSVault
 from web3 import EthereumTesterProvider
 from web3 import Web3
 
-
-class SaiDeployment:
-    def __init__(self,
-                 web3: Web3,
-                 our_address: Address,
-                 gem: DSToken,
-                 sai: DSToken,
-                 sin: DSToken,
-                 skr: DSToken,
-                 tub: Tub,
-                 tap: Tap,
-                 top: Top):
-        self.web3 = web3
-        self.our_address = our_address
-        self.gem = gem
-        self.sai = sai
-        self.sin = sin
-        self.skr = skr
-        self.tub = tub
-        self.tap = tap
-        self.top = top
+from benchmarks.deployment import SaiDeployment, deploy_sai
 
 
 @pytest.fixture(scope='session')
 def new_sai() -> SaiDeployment:
-    def deploy(web3, contract_name, args=None):
-        contract_factory = web3.eth.contract(abi=json.loads(pkg_resources.resource_string('keeper.api.feed', f'abi/{contract_name}.abi')),
-                                             bytecode=pkg_resources.resource_string('keeper.api.feed', f'abi/{contract_name}.bin'))
-        tx_hash = contract_factory.deploy(args=args)
-        receipt = web3.eth.getTransactionReceipt(tx_hash)
-        return receipt['contractAddress']
-
     web3 = Web3(EthereumTesterProvider())
     web3.eth.defaultAccount = web3.eth.accounts[0]
-    our_address = Address(web3.eth.defaultAccount)
-    sai = DSToken.deploy(web3, 'SAI')
-    sin = DSToken.deploy(web3, 'SIN')
-    gem = DSToken.deploy(web3, 'ETH')
-    pip = DSValue.deploy(web3)
-    skr = DSToken.deploy(web3, 'SKR')
-    pot = DSVault.deploy(web3)
-    pit = DSVault.deploy(web3)
-    tip = deploy(web3, 'Tip')
-    dad = DSGuard.deploy(web3)
-    jug = deploy(web3, 'SaiJug', [sai.address.address, sin.address.address])
-    jar = deploy(web3, 'SaiJar', [skr.address.address, gem.address.address, pip.address.address])
-
-    tub = Tub.deploy(web3, Address(jar), Address(jug), pot.address, pit.address, Address(tip))
-    tap = Tap.deploy(web3, tub.address, pit.address)
-    top = Top.deploy(web3, tub.address, tap.address)
-
-    # set permissions
-    dad.permit(DSGuard.ANY, DSGuard.ANY, DSGuard.ANY).transact()
-    tub.set_authority(dad.address)
-    for auth in [sai, sin, skr, pot, pit, tap, top]:
-        auth.set_authority(dad.address).transact()
-
-    # approve, mint some GEMs
-    tub.approve(directly())
-    gem.mint(Wad.from_number(1000000)).transact()
-
+    deployment = deploy_sai(web3)
     web3.currentProvider.rpc_methods.evm_snapshot()
-    return SaiDeployment(web3, our_address, gem, sai, sin, skr, tub, tap, top)
+    return deployment
 
 
 @pytest.fixture()
@@ -0,0 +1,215 @@
+# This file is part of Maker Keeper Framework.
+#
+# Copyright (C) 2017 reverendus
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+from web3 import EthereumTesterProvider
+from web3 import Web3
+
+from keeper import Keeper, Config
+from keeper.api import Wad
+from keeper.api.cache import BlockCache
+from keeper.api.provider import LimitedProvider, PooledHTTPProvider, HedgedHTTPProvider
+from keeper.api.replay import RecordingProvider, ReplayProvider
+from keeper.api.token import DSToken
+from tests.api.helpers import JsonRpcServer
+
+
+class TesterNode(JsonRpcServer):
+    """Local node answering JSON-RPC requests over HTTP from an `EthereumTesterProvider` chain."""
+    def __init__(self):
+        self.web3 = Web3(EthereumTesterProvider())
+        self.web3.eth.defaultAccount = self.web3.eth.accounts[0]
+        self._lock = threading.Lock()
+        super().__init__(self._forward)
+
+    def _forward(self, method, params):
+        # the tester chain is not thread-safe
+        with self._lock:
+            response = self.web3.currentProvider.make_request(method, params)
+        if 'error' in response:
+            raise Exception(response['error'])
+        return response['result']
+
+
+class DummyKeeper(Keeper):
+    def startup(self):
+        pass
+
+
+class TestKeeper:
+    def setup_method(self):
+        self.node = TesterNode()
+
+    def teardown_method(self):
+        self.node.stop()
+
+    def keeper(self, *args) -> Keeper:
+        return DummyKeeper(['--rpc-host', '127.0.0.1', '--rpc-port', self.node.endpoint_uri.split(':')[-1],
+                            '--eth-from', self.node.web3.eth.defaultAccount] + list(args),
+                           config=Config('unknown', {'unknown': {'tokens': {}, 'contracts': {}}}))
+
+    @staticmethod
+    def limited_provider(keeper: Keeper) -> LimitedProvider:
+        provider = keeper.web3.currentProvider
+        while not isinstance(provider, LimitedProvider):
+            provider = provider.provider
+        return provider
+
+    def limiter(self, keeper: Keeper):
+        return self.limited_provider(keeper).limiter
+
+    def node_provider(self, keeper: Keeper):
+        return self.limited_provider(keeper).provider
+
+    @staticmethod
+    def watch_new_heads(keeper: Keeper, callback):
+        with patch('keeper.NewHeadsSubscription') as subscription, patch('keeper.register_filter_thread'):
+            keeper.on_block(callback)
+        return subscription
+
+    @staticmethod
+    def new_head(keeper: Keeper, subscription: Mock, block_number: int):
+        subscription.call_args[0][1]({'number': hex(block_number), 'hash': '0x%064x' % block_number})
+        keeper._on_block_callback.thread.join()
+
+    def test_should_send_transactions_through_limiter_as_high_priority(self):
+        # given
+        keeper = self.keeper('--rpc-max-concurrency', '4')
+        token = DSToken.deploy(self.node.web3, 'ABC')
+        limiter = self.limiter(keeper)
+        limiter.acquire = Mock(wraps=limiter.acquire)
+
+        # when
+        receipt = DSToken(web3=keeper.web3, address=token.address).mint(Wad(100)).transact()
+
+        # then
+        assert receipt is not None
+        assert limiter.max_limit == 4
+        assert limiter.in_flight == 0
+
+        # and
+        # gas estimation, submission and at least one receipt poll
+        assert limiter.acquire.call_args_list.count(((True,), {})) >= 3
+        assert keeper.rpc_accounting.by_method['eth_sendTransaction'].count == 1
+
+    def test_should_not_enable_block_cache_by_default(self):
+        # when
+        keeper = self.keeper()
+
+        # then
+        assert BlockCache.of(keeper.web3) is None
+
+    def test_should_enable_block_cache(self):
+        # when
+        keeper = self.keeper('--block-cache')
+
+        # then
+        assert BlockCache.of(keeper.web3) is not None
+
+    def test_should_use_the_given_web3(self):
+        # when
+        keeper = DummyKeeper(['--eth-from', self.node.web3.eth.defaultAccount], web3=self.node.web3,
+                             config=Config('unknown', {'unknown': {'tokens': {}, 'contracts': {}}}))
+
+        # then
+        assert keeper.web3 is self.node.web3
+
+    def test_should_reject_unknown_keyword_arguments(self):
+        # expect
+        with pytest.raises(TypeError):
+            DummyKeeper(['--eth-from', self.node.web3.eth.defaultAccount], web3=self.node.web3,
+                        confg=Config('unknown', {'unknown': {'tokens': {}, 'contracts': {}}}))
+
+    def test_should_use_connection_pools_given_in_arguments(self):
+        # when
+        keeper = self.keeper('--rpc-pool-size', '3', '--rpc-timeout', '7')
+
+        # then
+        provider = self.node_provider(keeper)
+        assert isinstance(provider, PooledHTTPProvider)
+        assert provider.endpoint_uri == self.node.endpoint_uri
+        assert provider.pool_size == 3
+        assert provider.call_pool[1] == 7
+        assert provider.filter_pool[1] == 7
+
+    def test_should_hedge_requests_to_backup_endpoints(self):
+        # when
+        keeper = self.keeper('--rpc-backup', 'http://127.0.0.1:1', '--rpc-hedge-delay', '0.2', '--rpc-pool-size', '3')
+
+        # then
+        provider = self.node_provider(keeper)
+        assert isinstance(provider, HedgedHTTPProvider)
+        assert [endpoint.endpoint_uri for endpoint in provider.providers] == [self.node.endpoint_uri,
+                                                                              'http://127.0.0.1:1']
+        assert all(endpoint.pool_size == 3 for endpoint in provider.providers)
+        assert provider.hedge_delay == 0.2
+
+    def test_should_replay_recorded_requests(self, tmpdir):
+        # given
+        recording_file = str(tmpdir.join('recording.jsonl'))
+        recording_keeper = self.keeper('--rpc-record', recording_file)
+        assert isinstance(self.node_provider(recording_keeper), RecordingProvider)
+        balance = recording_keeper.eth_balance(recording_keeper.our_address)
+        recording_keeper._recording_provider.close()
+
+        # when
+        replay_keeper = self.keeper('--rpc-replay', recording_file)
+
+        # then
+        assert isinstance(self.node_provider(replay_keeper), ReplayProvider)
+        assert replay_keeper.eth_balance(replay_keeper.our_address) == balance
+        assert replay_keeper._replay_provider.requests > 0
+
+    def test_should_subscribe_to_new_heads_if_ipc_path_given(self):
+        # given
+        keeper = self.keeper('--ipc-path', '/tmp/node.ipc')
+        callback = Mock()
+
+        # when
+        subscription = self.watch_new_heads(keeper, callback)
+        self.new_head(keeper, subscription, 5)
+
+        # then
+        assert subscription.call_args[0][0] == '/tmp/node.ipc'
+        assert subscription.return_value.watch.called
+        assert callback.call_count == 1
+
+    def test_should_account_requests_made_while_processing_each_block(self):
+        # given
+        keeper = self.keeper('--ipc-path', '/tmp/node.ipc')
+        subscription = self.watch_new_heads(keeper, lambda: keeper.eth_balance(keeper.our_address))
+        keeper.web3.eth.blockNumber
+
+        # when
+        self.new_head(keeper, subscription, 1)
+
+        # then
+        accounting = keeper.last_block_rpc_accounting
+        assert accounting.total().count == 1
+        assert accounting.by_method['eth_getBalance'].count == 1
+        assert 'eth_getBalance=1' in accounting.summary()
+        assert keeper.rpc_accounting.total().count == 0
+
+        # when
+        self.new_head(keeper, subscription, 2)
+
+        # then
+        assert keeper.last_block_rpc_accounting is not accounting
+        assert keeper.last_block_rpc_accounting.total().count == 1
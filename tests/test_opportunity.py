@@ -16,11 +16,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import pytest
+from web3 import EthereumTesterProvider
+from web3 import Web3
 
 from keeper.api import Address
+from keeper.api.approval import directly
 from keeper.api.numeric import Ray
 from keeper.api.numeric import Wad
-from keeper.conversion import Conversion
+from keeper.api.oasis import SimpleMarket
+from keeper.api.provider import LimitedProvider, AdaptiveLimiter
+from keeper.api.token import DSToken
+from keeper.conversion import Conversion, OasisTakeConversion
 from keeper.opportunity import Sequence, OpportunityFinder
 
 
@@ -74,6 +80,40 @@ class TestSequence:
             prev_tx_costs = tx_costs
 
 
+    def test_should_not_copy_contracts_of_steps(self):
+        # given
+        web3 = Web3(EthereumTesterProvider())
+        web3.eth.defaultAccount = web3.eth.accounts[0]
+        token1 = DSToken.deploy(web3, 'AAA')
+        token1.mint(Wad.from_number(100)).transact()
+        token2 = DSToken.deploy(web3, 'BBB')
+        otc = SimpleMarket.deploy(web3)
+        otc.approve([token1], directly())
+        otc.make(have_token=token1.address, have_amount=Wad.from_number(1),
+                 want_token=token2.address, want_amount=Wad.from_number(2)).transact()
+
+        # and
+        # the keeper reads through wrapped providers, which hold locks and thread-local state
+        wrapped_web3 = Web3(LimitedProvider(web3.currentProvider, AdaptiveLimiter()))
+        wrapped_web3.eth.defaultAccount = web3.eth.defaultAccount
+        wrapped_otc = SimpleMarket(web3=wrapped_web3, address=otc.address)
+        offer_book = wrapped_otc.offer_book()
+        conversion = OasisTakeConversion(wrapped_otc, offer_book.offers()[0])
+
+        try:
+            # when
+            sequence = Sequence([conversion])
+            sequence.set_amounts(Wad.from_number(1))
+
+            # then
+            assert sequence.steps[0] is not conversion
+            assert sequence.steps[0].otc is wrapped_otc
+            assert sequence.steps[0].source_amount == Wad.from_number(1)
+            assert conversion.source_amount is None
+        finally:
+            offer_book.close()
+
+
 class TestOpportunityFinder:
     @pytest.fixture
     def token1(self):
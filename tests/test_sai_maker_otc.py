@@ -15,12 +15,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from unittest.mock import Mock
+
 from web3 import Web3, EthereumTesterProvider
 
 from keeper import Address, ERC20Token, Wad, DefaultGasPrice
 from keeper.api.feed import DSValue
-from keeper.api.oasis import SimpleMarket
+from keeper.api.oasis import SimpleMarket, MatchingMarket
 from keeper.api.token import DSEthToken, DSToken
+from keeper.api.transact import TxManager
 from keeper.sai_bite import SaiBite
 from keeper.sai_maker_otc import SaiMakerOtc
 from tests.conftest import SaiDeployment
@@ -49,6 +52,7 @@ class TestSaiMakerOtc:
         keeper.skr = ERC20Token(web3=keeper.web3, address=keeper.tub.skr())
         keeper.sai = ERC20Token(web3=keeper.web3, address=keeper.tub.sai())
         keeper.gem = DSEthToken(web3=keeper.web3, address=keeper.tub.gem())
+        keeper.tx_manager = None
         ERC20Token.register_token(keeper.tub.skr(), 'SKR')
         ERC20Token.register_token(keeper.tub.sai(), 'SAI')
         ERC20Token.register_token(keeper.tub.gem(), 'WETH')
@@ -124,3 +128,84 @@ class TestSaiMakerOtc:
         # then
         assert len(keeper.otc.active_offers()) == 0
 
+    def test_should_replace_offers_in_one_transaction_via_tx_manager(self, sai: SaiDeployment):
+        # given
+        keeper = self.setup_keeper(sai)
+        keeper.tx_manager = TxManager.deploy(sai.web3)
+        keeper.max_weth_amount = Wad.from_number(10)
+        keeper.min_weth_amount = Wad.from_number(5)
+        keeper.max_sai_amount = Wad.from_number(100)
+        keeper.min_sai_amount = Wad.from_number(50)
+        keeper.sai_dust_cutoff = Wad.from_number(0)
+        keeper.weth_dust_cutoff = Wad.from_number(0)
+        keeper.min_margin_buy = 0.01
+        keeper.avg_margin_buy = 0.02
+        keeper.max_margin_buy = 0.03
+        keeper.min_margin_sell = 0.02
+        keeper.avg_margin_sell = 0.03
+        keeper.max_margin_sell = 0.04
+        keeper.round_places = 2
+        keeper.gas_price = DefaultGasPrice()
+
+        # and
+        gem = DSToken(web3=sai.web3, address=sai.tub.gem())
+        gem.transfer(Address(sai.web3.eth.accounts[1]), gem.balance_of(keeper.our_address)).transact()
+        gem.mint(Wad.from_number(10)).transact()
+        DSToken(web3=sai.web3, address=sai.tub.sai()).mint(Wad.from_number(100)).transact()
+
+        # and
+        DSValue(web3=sai.web3, address=sai.tub.pip()).poke_with_int(Wad.from_number(250).value).transact()
+
+        # and
+        keeper.approve()
+        keeper.synchronize_offers()
+        old_offer_ids = set(offer.offer_id for offer in keeper.otc.active_offers())
+        assert len(old_offer_ids) == 2
+        assert keeper.gem.balance_of(keeper.our_address) == Wad(0)
+        assert keeper.sai.balance_of(keeper.our_address) == Wad(0)
+
+        # when
+        DSValue(web3=sai.web3, address=sai.tub.pip()).poke_with_int(Wad.from_number(300).value).transact()
+        transaction_count = sai.web3.eth.getTransactionCount(keeper.our_address.address)
+        keeper.synchronize_offers()
+
+        # then
+        assert sai.web3.eth.getTransactionCount(keeper.our_address.address) == transaction_count + 1
+
+        # and
+        offers = keeper.otc.active_offers()
+        assert len(offers) == 2
+        assert all(offer.offer_id not in old_offer_ids for offer in offers)
+        assert all(offer.owner == keeper.tx_manager.address for offer in offers)
+
+        # and
+        sell_offer = next(offer for offer in offers if offer.sell_which_token == keeper.gem.address)
+        assert sell_offer.sell_how_much == Wad.from_number(10)
+        assert sell_offer.buy_which_token == keeper.sai.address
+        assert sell_offer.buy_how_much == Wad.from_number(10) * Wad.from_number(309)
+
+        # and
+        buy_offer = next(offer for offer in offers if offer.sell_which_token == keeper.sai.address)
+        assert buy_offer.sell_how_much == Wad.from_number(100)
+        assert buy_offer.buy_which_token == keeper.gem.address
+        assert buy_offer.buy_how_much == Wad.from_number(100) / Wad.from_number(294)
+
+    def test_should_not_position_new_offers_at_cancelled_ones(self, sai: SaiDeployment):
+        # given
+        keeper = self.setup_keeper(sai)
+        keeper.otc = Mock(spec=MatchingMarket)
+        keeper.otc.position.return_value = 7
+        cancelled_offers = [Mock(offer_id=3), Mock(offer_id=5)]
+
+        # when
+        keeper.make_offer(have_token=keeper.gem.address, have_amount=Wad.from_number(1),
+                          want_token=keeper.sai.address, want_amount=Wad.from_number(300),
+                          cancelled_offers=cancelled_offers)
+
+        # then
+        keeper.otc.position.assert_called_once_with(have_token=keeper.gem.address, have_amount=Wad.from_number(1),
+                                                    want_token=keeper.sai.address, want_amount=Wad.from_number(300),
+                                                    excluding=[3, 5])
+        keeper.otc.make.assert_called_once_with(have_token=keeper.gem.address, have_amount=Wad.from_number(1),
+                                                want_token=keeper.sai.address, want_amount=Wad.from_number(300),
+                                                pos=7)